@@ -0,0 +1,143 @@
+"""ISBN候補抽出のリグレッション確認とベンチマーク
+
+従来 on_message で使っていた正規表現と isbn_extract.iter_isbn_candidates で、
+抽出・修正後のISBN13が一致することを確認し、長い貼り付けテキストでの処理時間と
+入力長に対する伸び方を比較する。limit を指定すれば長い入力でもすぐ返ることも確認する。
+
+    python benchmarks/bench_isbn_extract.py
+"""
+import logging
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from isbn_extract import iter_isbn_candidates
+from isbn_validation import fix_isbn
+
+logging.getLogger('isbn_validation').disabled = True
+
+# 従来の正規表現（メッセージごとに組み立てていたもの）
+LEGACY_PATTERN = re.compile(
+    r'(?:ISBN[:\s-]*)?(?:979[:\s-]*\d{1,5}[:\s-]*\d{1,7}[:\s-]*\d{1,6}[:\s-]*[\dX]|978[:\s-]*\d{1,5}[:\s-]*\d{1,7}[:\s-]*\d{1,6}[:\s-]*[\dX]|\d{1,5}[:\s-]*\d{1,7}[:\s-]*\d{1,6}[:\s-]*[\dX]|\d{9,13}[\dX]?)',
+    re.IGNORECASE,
+)
+
+# 従来と同じ結果になるべきメッセージ
+SAME_RESULT_MESSAGES = [
+    "9784092906044",
+    "ISBN978-4-09-290604-4 をお願いします",
+    "ISBN: 978 4 09 290604 4",
+    "4-09-290604-8 と 978-4-7594-0136-3",
+    "978-4-09-290604-4 978-4-759-40136-3",
+    "4-09-290604-X です",
+    "isbn4-7594-0136-x",
+    "4092906044 (後ろ10桁)",
+    "2024年12月 電話 03-1234-5678 まで",
+    "409290604",
+    "978409290604",
+    "こんにちは、今日は注文ありません",
+]
+
+# 従来の正規表現では誤って連結・分割されていたメッセージ（新しい抽出器で改善）
+IMPROVED_MESSAGES = [
+    ("9784092906044\n9784759401363", {'9784092906044', '9784759401363'}),
+    ("97840929060449784759401363", {'9784092906044', '9784759401363'}),
+    ("4092906048\n4759401363\n4092906048", {'9784092906044', '9784759401363'}),
+    ("ISBN13: 979-10-90636-07-1", {'9791090636071'}),
+    ("1\t978-4-09-290604-4\t2", {'9784092906044'}),
+    ("1\t978-4-09-290604-4\t2\t1,650\n2\t978-4-7594-0136-3\t1\t2,200", {'9784092906044', '9784759401363'}),
+]
+
+def resolve_all(candidates):
+    """候補を修正・正規化し、ISBN13の集合を返す"""
+    isbn13s = set()
+    for candidate in candidates:
+        _, isbn13, _ = fix_isbn(candidate)
+        if isbn13:
+            isbn13s.add(isbn13)
+    return isbn13s
+
+def legacy_candidates(content):
+    return LEGACY_PATTERN.findall(content)
+
+def new_candidates(content):
+    return list(iter_isbn_candidates(content))
+
+def check_regressions():
+    """従来の結果と比較し、不一致の件数を返す"""
+    failures = 0
+    for content in SAME_RESULT_MESSAGES:
+        legacy = resolve_all(legacy_candidates(content))
+        new = resolve_all(new_candidates(content))
+        if legacy != new:
+            failures += 1
+            print(f"  不一致 {content!r}: 従来 {sorted(legacy)} / 新 {sorted(new)}")
+
+    for content, expected in IMPROVED_MESSAGES:
+        new = resolve_all(new_candidates(content))
+        if new != expected:
+            failures += 1
+            print(f"  期待と異なる {content!r}: {sorted(new)} (期待 {sorted(expected)})")
+
+    return failures
+
+ADVERSARIAL_INPUTS = {
+    '数字とハイフンの羅列': lambda n: "1-" * n + "a",
+    '空白区切りの数字': lambda n: "12 " * n,
+    '区切りだけが長い': lambda n: "978" + " " * (n * 2) + "a",
+    'ISBN表記の連続': lambda n: ("ISBN" + "-" * 50 + "x ") * (n // 50),
+    '区切りのない長い数字': lambda n: "9" * (n * 2),
+    '表計算の貼り付け': lambda n: "\n".join(f"{i}\t978-4-09-290604-4\t2\t1,650" for i in range(n // 40)),
+}
+
+MAX_GROWTH = 6  # 入力長4倍で許容する処理時間の伸び
+LIMIT_INPUT_LENGTH = 2_560_000  # limit の確認に使う数字列の長さ
+LIMIT_MAX_MS = 200  # limit=1 なら入力が長くてもこの時間内に返る
+
+def timed(func, content, repeat=5):
+    """最速の実行時間（ミリ秒）"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(content)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+def check_scaling():
+    """入力長を4倍にしたときの処理時間の伸びを表示し、線形でないものの件数を返す"""
+    failures = 0
+    print(f"{'入力':<20}{'長さ':>8}{'従来(ms)':>12}{'新(ms)':>10}{'新 4倍時の伸び':>16}")
+    for name, build in ADVERSARIAL_INPUTS.items():
+        small = build(5000)
+        large = build(20000)
+        legacy_ms = timed(legacy_candidates, large)
+        small_ms = timed(new_candidates, small)
+        large_ms = timed(new_candidates, large)
+        growth = large_ms / small_ms if small_ms else 0.0
+        # 線形なら約4倍。計測誤差を見込んで6倍を上限とする
+        if growth > MAX_GROWTH:
+            failures += 1
+        print(f"{name:<20}{len(large):>8}{legacy_ms:>12.2f}{large_ms:>10.2f}{growth:>15.1f}x")
+    return failures
+
+def check_limit():
+    """limit=1 なら長い入力でも残りを切り分けずに返るか（超えたら1を返す）"""
+    content = "9" * LIMIT_INPUT_LENGTH
+    elapsed = timed(lambda text: list(iter_isbn_candidates(text, limit=1)), content, repeat=3)
+    print(f"limit=1 ({len(content)}桁の数字): {elapsed:.1f} ms（上限 {LIMIT_MAX_MS} ms）")
+    return 1 if elapsed > LIMIT_MAX_MS else 0
+
+def main():
+    print("リグレッション確認:")
+    regressions = check_regressions()
+    print(f"  {len(SAME_RESULT_MESSAGES) + len(IMPROVED_MESSAGES)}件中 不一致 {regressions}件")
+    print()
+    nonlinear = check_scaling()
+    print()
+    unbounded = check_limit()
+    return 1 if regressions or nonlinear or unbounded else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
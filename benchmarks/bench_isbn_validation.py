@@ -0,0 +1,234 @@
+"""ISBN検証・修正エンジンのベンチマーク
+
+isbnlibを使った従来の fix_common_isbn_errors と isbn_validation.fix_isbn の
+結果が一致することを、正しいISBNと入力ミスを含むISBNのコーパスで確認し、
+処理時間を比較する。
+
+    python benchmarks/bench_isbn_validation.py [件数]
+"""
+import logging
+import os
+import random
+import re
+import sys
+import time
+
+from isbnlib import to_isbn10, to_isbn13, is_isbn10, is_isbn13
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from isbn_validation import fix_isbn, fix_isbns
+
+logger = logging.getLogger('legacy')
+logger.disabled = True
+logging.getLogger('isbn_validation').disabled = True
+
+# ---- 従来の実装（isbnlibを呼び出す版をそのまま保持） ----
+
+def legacy_calculate_isbn10_check_digit(isbn9):
+    """ISBN10のチェックディジットを計算"""
+    try:
+        total = 0
+        for i, digit in enumerate(isbn9):
+            if not digit.isdigit():
+                return None
+            total += int(digit) * (10 - i)
+        
+        remainder = total % 11
+        if remainder == 0:
+            return '0'
+        elif remainder == 1:
+            return 'X'
+        else:
+            return str(11 - remainder)
+    except:
+        return None
+
+def legacy_calculate_isbn13_check_digit(isbn12):
+    """ISBN13のチェックディジットを計算"""
+    try:
+        total = 0
+        for i, digit in enumerate(isbn12):
+            if not digit.isdigit():
+                return None
+            multiplier = 1 if i % 2 == 0 else 3
+            total += int(digit) * multiplier
+        
+        remainder = total % 10
+        return str((10 - remainder) % 10)
+    except:
+        return None
+
+def legacy_fix_common_isbn_errors(isbn_input):
+    """一般的なISBN入力間違いを修正"""
+    try:
+        # 数字とXのみ抽出
+        clean_isbn = re.sub(r'[^\dX]', '', isbn_input.upper())
+        
+        # ケース1: ISBN13の後ろ10桁をISBN10として間違えて入力
+        if len(clean_isbn) == 10:
+            # 通常のISBN10として検証
+            if is_isbn10(clean_isbn):
+                return clean_isbn, to_isbn13(clean_isbn)
+            
+            # ISBN13の後ろ10桁の可能性をチェック
+            # 978 + 9桁 + チェックディジット の形で13桁にしてみる
+            if clean_isbn[0].isdigit():  # Xで始まることはない
+                test_isbn13 = '978' + clean_isbn
+                if len(test_isbn13) == 13 and is_isbn13(test_isbn13):
+                    corrected_isbn10 = to_isbn10(test_isbn13)
+                    if corrected_isbn10:
+                        logger.info(f"ISBN修正: 後ろ10桁パターン {clean_isbn} -> {corrected_isbn10}")
+                        return corrected_isbn10, test_isbn13
+            
+            # 979プレフィックスも試す
+            test_isbn13_979 = '979' + clean_isbn
+            if len(test_isbn13_979) == 13 and is_isbn13(test_isbn13_979):
+                corrected_isbn10 = to_isbn10(test_isbn13_979)
+                if corrected_isbn10:
+                    logger.info(f"ISBN修正: 979後ろ10桁パターン {clean_isbn} -> {corrected_isbn10}")
+                    return corrected_isbn10, test_isbn13_979
+            
+            # チェックディジットが間違っている可能性
+            isbn9 = clean_isbn[:9]
+            correct_check = legacy_calculate_isbn10_check_digit(isbn9)
+            if correct_check and correct_check != clean_isbn[9]:
+                corrected_isbn10 = isbn9 + correct_check
+                if is_isbn10(corrected_isbn10):
+                    logger.info(f"ISBN修正: ISBN10チェックディジット {clean_isbn} -> {corrected_isbn10}")
+                    return corrected_isbn10, to_isbn13(corrected_isbn10)
+        
+        # ケース2: ISBN10の前に978を付けただけの間違ったISBN13
+        elif len(clean_isbn) == 13:
+            # 通常のISBN13として検証
+            if is_isbn13(clean_isbn):
+                return to_isbn10(clean_isbn), clean_isbn
+            
+            # 978 + ISBN10 の形になっている可能性
+            if clean_isbn.startswith('978'):
+                potential_isbn10 = clean_isbn[3:]
+                if len(potential_isbn10) == 10:
+                    # ISBN10として正しいかチェック
+                    if is_isbn10(potential_isbn10):
+                        corrected_isbn13 = to_isbn13(potential_isbn10)
+                        logger.info(f"ISBN修正: 978+ISBN10パターン {clean_isbn} -> {corrected_isbn13}")
+                        return potential_isbn10, corrected_isbn13
+                    
+                    # ISBN10のチェックディジットを再計算
+                    isbn9 = potential_isbn10[:9]
+                    correct_check = legacy_calculate_isbn10_check_digit(isbn9)
+                    if correct_check:
+                        test_isbn10 = isbn9 + correct_check
+                        if is_isbn10(test_isbn10):
+                            corrected_isbn13 = to_isbn13(test_isbn10)
+                            logger.info(f"ISBN修正: 978+ISBN10(チェックディジット修正) {clean_isbn} -> {corrected_isbn13}")
+                            return test_isbn10, corrected_isbn13
+            
+            # チェックディジットが間違っている可能性
+            isbn12 = clean_isbn[:12]
+            correct_check = legacy_calculate_isbn13_check_digit(isbn12)
+            if correct_check and correct_check != clean_isbn[12]:
+                corrected_isbn13 = isbn12 + correct_check
+                if is_isbn13(corrected_isbn13):
+                    logger.info(f"ISBN修正: ISBN13チェックディジット {clean_isbn} -> {corrected_isbn13}")
+                    return to_isbn10(corrected_isbn13), corrected_isbn13
+        
+        # ケース3: 9桁や12桁の不完全な入力
+        elif len(clean_isbn) == 9:
+            # ISBN10の最初の9桁の可能性
+            correct_check = legacy_calculate_isbn10_check_digit(clean_isbn)
+            if correct_check:
+                test_isbn10 = clean_isbn + correct_check
+                if is_isbn10(test_isbn10):
+                    logger.info(f"ISBN修正: 9桁補完 {clean_isbn} -> {test_isbn10}")
+                    return test_isbn10, to_isbn13(test_isbn10)
+        
+        elif len(clean_isbn) == 12:
+            # ISBN13の最初の12桁の可能性
+            correct_check = legacy_calculate_isbn13_check_digit(clean_isbn)
+            if correct_check:
+                test_isbn13 = clean_isbn + correct_check
+                if is_isbn13(test_isbn13):
+                    logger.info(f"ISBN修正: 12桁補完 {clean_isbn} -> {test_isbn13}")
+                    return to_isbn10(test_isbn13), test_isbn13
+        
+        return None, None
+        
+    except Exception as e:
+        logger.error(f"ISBN修正処理エラー: {e}")
+        return None, None
+
+# ---- コーパス生成 ----
+
+def random_isbn13(rng):
+    """ランダムな正しいISBN13を生成"""
+    body = rng.choice(['978', '979']) + ''.join(rng.choice('0123456789') for _ in range(9))
+    return body + legacy_calculate_isbn13_check_digit(body)
+
+def corrupt(isbn13, rng):
+    """よくある入力ミスを含むISBN候補を生成"""
+    isbn10 = to_isbn10(isbn13) or isbn13[3:]
+    kind = rng.randrange(10)
+    if kind == 0:
+        return isbn13
+    if kind == 1:
+        return isbn10
+    if kind == 2:
+        return isbn13[3:]  # 後ろ10桁
+    if kind == 3:
+        return '978' + isbn10  # 978+ISBN10
+    if kind == 4:
+        return isbn13[:12] + str((int(isbn13[12]) + 1) % 10)  # チェックディジット間違い
+    if kind == 5:
+        return isbn10[:9] + rng.choice('0123456789X')  # ISBN10のチェックディジット間違い
+    if kind == 6:
+        return isbn10[:9]  # 9桁
+    if kind == 7:
+        return isbn13[:12]  # 12桁
+    if kind == 8:
+        return f"ISBN{isbn13[:3]}-{isbn13[3]}-{isbn13[4:6]}-{isbn13[6:12]}-{isbn13[12]}"
+    # ランダムな数字列・X混じり・全角数字
+    length = rng.choice([4, 9, 10, 11, 12, 13, 14])
+    noise = ''.join(rng.choice('0123456789X') for _ in range(length))
+    return rng.choice([noise, noise.lower(), '９７８' + noise[3:]])
+
+def build_corpus(size, seed=0):
+    """ベンチマーク用のISBN候補リストを生成"""
+    rng = random.Random(seed)
+    return [corrupt(random_isbn13(rng), rng) for _ in range(size)]
+
+def timed(func, corpus):
+    """関数をコーパス全体に適用し、(結果, 秒数) を返す"""
+    start = time.perf_counter()
+    results = [func(isbn) for isbn in corpus]
+    return results, time.perf_counter() - start
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    corpus = build_corpus(size)
+
+    legacy_results, legacy_time = timed(legacy_fix_common_isbn_errors, corpus)
+    new_results, new_time = timed(lambda isbn: fix_isbn(isbn)[:2], corpus)
+
+    start = time.perf_counter()
+    batch_results = [result[:2] for result in fix_isbns(corpus)]
+    batch_time = time.perf_counter() - start
+
+    mismatches = [
+        (isbn, old, new)
+        for isbn, old, new in zip(corpus, legacy_results, new_results)
+        if old != new
+    ]
+    batch_mismatches = sum(1 for old, new in zip(legacy_results, batch_results) if old != new)
+
+    print(f"コーパス: {size}件（有効 {sum(1 for r in legacy_results if r[1])}件）")
+    print(f"従来実装 (isbnlib): {legacy_time * 1000:.1f} ms")
+    print(f"fix_isbn:            {new_time * 1000:.1f} ms ({legacy_time / new_time:.1f}倍)")
+    print(f"fix_isbns (一括):    {batch_time * 1000:.1f} ms ({legacy_time / batch_time:.1f}倍)")
+    print(f"不一致: {len(mismatches)}件 / 一括: {batch_mismatches}件")
+    for isbn, old, new in mismatches[:10]:
+        print(f"  {isbn!r}: 従来 {old} / 新 {new}")
+
+    return 1 if mismatches or batch_mismatches else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
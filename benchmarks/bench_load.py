@@ -0,0 +1,315 @@
+"""オフライン負荷試験（Discord・OpenBD・Google Sheetsは偽物）
+
+合成したメッセージ列で main.on_message を駆動し、外部サービスの代わりに
+遅延と429を設定できる偽のバックエンドを使って、処理件数/秒・
+エンドツーエンドのp50/p99レイテンシ・注文1件あたりのAPI呼び出し数を表示する。
+認証情報やネットワークは不要。
+
+    python benchmarks/bench_load.py
+    python benchmarks/bench_load.py --messages 500 --concurrency 20 --openbd-latency 0.2 --sheets-429 0.05
+    python benchmarks/bench_load.py --scenario paste50 --real-budgets
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sheets_client import MemoryWorksheet, SheetsAPIError
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='オフライン負荷試験')
+    parser.add_argument('--scenario', choices=sorted(SCENARIOS) + ['all'], default='all')
+    parser.add_argument('--messages', type=int, default=200, help='シナリオごとのメッセージ数')
+    parser.add_argument('--concurrency', type=int, default=10, help='同時に処理するメッセージ数')
+    parser.add_argument('--discord-latency', type=float, default=0.05, help='返信1回の遅延（秒）')
+    parser.add_argument('--openbd-latency', type=float, default=0.1, help='OpenBDリクエスト1回の遅延（秒）')
+    parser.add_argument('--sheets-latency', type=float, default=0.3, help='Sheets API呼び出し1回の遅延（秒）')
+    parser.add_argument('--discord-429', type=float, default=0.0, help='返信が429になる確率')
+    parser.add_argument('--openbd-429', type=float, default=0.0, help='OpenBDが429になる確率')
+    parser.add_argument('--sheets-429', type=float, default=0.0, help='Sheets APIが429になる確率')
+    parser.add_argument('--retry-after', type=float, default=0.2, help='429で返すretry_after（秒。Discord・OpenBD・Sheets共通）')
+    parser.add_argument('--catalog-size', type=int, default=2000, help='OpenBDに登録されている書籍数')
+    parser.add_argument('--real-budgets', action='store_true',
+                        help='API別の予算を本番の設定値のまま使う（指定しなければ予算で律速しない）')
+    parser.add_argument('--seed', type=int, default=1)
+    return parser.parse_args()
+
+# 合成メッセージ
+
+def make_isbn13(rng):
+    from isbn_validation import calculate_isbn13_check_digit
+    body = '9784' + ''.join(rng.choice('0123456789') for _ in range(8))
+    return body + calculate_isbn13_check_digit(body)
+
+def hyphenate(isbn13):
+    return f"{isbn13[:3]}-{isbn13[3]}-{isbn13[4:6]}-{isbn13[6:12]}-{isbn13[12]}"
+
+def scenario_single(rng, catalog):
+    """ISBNを1つだけ書いた注文"""
+    return f"{hyphenate(rng.choice(catalog))} をお願いします"
+
+def scenario_paste50(rng, catalog):
+    """表計算からの50件貼り付け"""
+    return '\n'.join(f"{i + 1}\t{isbn}\t2" for i, isbn in enumerate(rng.sample(catalog, 50)))
+
+def scenario_malformed(rng, catalog):
+    """チェックディジット誤り・桁不足・ISBN10の混在（補正される入力と無効な入力）"""
+    from isbn_validation import to_isbn10
+    parts = []
+    for isbn13 in rng.sample(catalog, 5):
+        kind = rng.randrange(5)
+        if kind == 0:
+            wrong = str((int(isbn13[-1]) + 1) % 10)
+            parts.append(isbn13[:-1] + wrong)  # チェックディジット誤り
+        elif kind == 1:
+            parts.append(isbn13[:-1])  # 12桁（チェックディジットなし）
+        elif kind == 2:
+            parts.append(to_isbn10(isbn13))
+        elif kind == 3:
+            parts.append(to_isbn10(isbn13)[:-1])  # 9桁
+        else:
+            parts.append('12345-' + isbn13[5:9])  # ISBNではない数字
+    return 'ISBN: ' + ' / '.join(parts)
+
+def scenario_duplicates(rng, catalog):
+    """少数の人気書籍を何度も書いた注文（メッセージ内・メッセージ間の重複）"""
+    popular = catalog[:5]
+    return '\n'.join(rng.choice([isbn, hyphenate(isbn)]) for isbn in rng.choices(popular, k=10))
+
+SCENARIOS = {
+    'single': scenario_single,
+    'paste50': scenario_paste50,
+    'malformed': scenario_malformed,
+    'duplicates': scenario_duplicates,
+}
+
+# 偽のバックエンド
+
+class Backends:
+    """偽バックエンドの設定と呼び出し回数"""
+
+    def __init__(self, args, catalog):
+        self.args = args
+        self.catalog = set(catalog)
+        self.rng = random.Random(args.seed)
+        self.calls = {}
+        self._lock = threading.Lock()
+
+    def count(self, name):
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def delay(self, latency):
+        """遅延に±50%のばらつきを加える"""
+        return latency * self.rng.uniform(0.5, 1.5)
+
+    def should_fail(self, probability):
+        return probability > 0 and self.rng.random() < probability
+
+class FakeSheet(MemoryWorksheet):
+    """Google Sheetsのワークシートの代わり（遅延し、確率で429を返す）"""
+
+    def __init__(self, backends):
+        super().__init__([['日付', 'ISBN10', 'ISBN13', 'タイトル', '価格', '出版社', '冊数', 'ステータス', 'ユーザーID', 'URL']])
+        self.backends = backends
+
+    async def _call(self, name):
+        self.backends.count(f'sheets.{name}')
+        await asyncio.sleep(self.backends.delay(self.backends.args.sheets_latency))
+        if self.backends.should_fail(self.backends.args.sheets_429):
+            self.backends.count('sheets.429')
+            raise SheetsAPIError(429, "Quota exceeded for quota metric 'Write requests'", self.backends.args.retry_after)
+
+    async def append_rows(self, rows):
+        await self._call('append_rows')
+        return await super().append_rows(rows)
+
+    async def get_all_values(self):
+        await self._call('get_all_values')
+        return await super().get_all_values()
+
+    async def get_row(self, row):
+        await self._call('get_row')
+        return await super().get_row(row)
+
+    async def update_cell(self, row, col, value):
+        await self._call('update_cell')
+        await super().update_cell(row, col, value)
+
+def make_fake_fetch(backends):
+    """openbd.fetch_openbd_chunk の代わり"""
+    from openbd import OpenBDRateLimited
+
+    def fetch(isbns, timeout=10, url=None):
+        backends.count('openbd.get')
+        time.sleep(backends.delay(backends.args.openbd_latency))
+        if backends.should_fail(backends.args.openbd_429):
+            backends.count('openbd.429')
+            raise OpenBDRateLimited(backends.args.retry_after)
+        return {
+            isbn: (f"書籍{isbn[-4:]}", '出版社', '1650') if isbn in backends.catalog else (None, None, None)
+            for isbn in isbns
+        }
+
+    return fetch
+
+class FakeResponse:
+    def __init__(self, status, reason, retry_after=None):
+        self.status = status
+        self.reason = reason
+        self.headers = {'Retry-After': str(retry_after)} if retry_after else {}
+
+class FakeAuthor:
+    bot = False
+
+    def __init__(self, author_id):
+        self.id = author_id
+
+class FakeMessage:
+    """discord.Message の代わり（返信は非同期で遅延し、確率で429を返す）"""
+
+    def __init__(self, backends, message_id, content):
+        self.backends = backends
+        self.id = message_id
+        self.content = content
+        self.author = FakeAuthor(1000 + message_id % 7)
+        self.guild = None
+        self.channel = None
+        self.attachments = []
+        self.replies = []
+
+    async def reply(self, content):
+        import discord
+        self.backends.count('discord.reply')
+        await asyncio.sleep(self.backends.delay(self.backends.args.discord_latency))
+        if self.backends.should_fail(self.backends.args.discord_429):
+            self.backends.count('discord.429')
+            response = FakeResponse(429, 'Too Many Requests', self.backends.args.retry_after)
+            raise discord.HTTPException(response, 'You are being rate limited.')
+        self.replies.append(content)
+
+# 実行
+
+def install_fakes(main, backends):
+    """main の外部サービスと状態を偽物・新しいものに差し替える"""
+    import metadata_providers
+    sheet = FakeSheet(backends)
+    metadata_providers.fetch_openbd_chunk = make_fake_fetch(backends)
+    main.resolve_isbn.cache_clear()
+    main.rate_limiter = main.RateLimitScheduler({
+        'discord': (main.DISCORD_RATE_PER_SEC, main.DISCORD_BURST),
+        'sheets': (main.SHEETS_RATE_PER_SEC, main.SHEETS_BURST),
+        'openbd': (main.OPENBD_RATE_PER_SEC, main.OPENBD_BURST),
+    })
+    main.metadata_lookup = main.create_metadata_lookup([main.OpenBDProvider(main.rate_limiter)])
+    main.book_cache = main.BookInfoCache(max_entries=main.BOOK_CACHE_MAX_ENTRIES)
+    main.isbn_workers = asyncio.Semaphore(main.ISBN_WORKERS)
+    main.sheet_router = main.create_sheet_router()
+    route = main.sheet_router.default
+    route.bind(sheet)
+    main.sheet_index, main.order_queue, main.sheet_buffer = route.index, route.queue, route.buffer
+    main.reply_sender = main.ReplySender(
+        main.rate_limiter,
+        max_retries=main.REPLY_MAX_RETRIES,
+        on_rate_limit=lambda error_message, retry_after: main.handle_rate_limit_error(error_message, 'discord', retry_after),
+    )
+    return sheet, route
+
+async def run_scenario(main, name, args):
+    rng = random.Random(args.seed)
+    catalog = [make_isbn13(rng) for _ in range(args.catalog_size)]
+    # 登録のない書籍も注文されるように、1割はOpenBDにない扱いにする
+    backends = Backends(args, catalog[: args.catalog_size * 9 // 10])
+    contents = [SCENARIOS[name](rng, catalog) for _ in range(args.messages)]
+
+    sheet, route = install_fakes(main, backends)
+    await route.index.refresh()
+    route.buffer.start()
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+    messages = []
+
+    async def handle(message_id, content):
+        async with semaphore:
+            message = FakeMessage(backends, message_id, content)
+            messages.append(message)
+            started = time.perf_counter()
+            await main.on_message(message)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(handle(i + 1, content) for i, content in enumerate(contents)))
+    elapsed = time.perf_counter() - started
+
+    # 残った行を書き込んでから集計
+    while len(route.buffer):
+        if not await route.buffer.flush():
+            await asyncio.sleep(args.retry_after)
+    route.buffer._task.cancel()
+    drained = time.perf_counter() - started
+
+    orders = len(sheet.rows) - 1
+    api_calls = sum(count for key, count in backends.calls.items() if not key.endswith('.429'))
+    replied = sum(1 for message in messages if message.replies)
+    return {
+        'name': name,
+        'messages': len(contents),
+        'elapsed': elapsed,
+        'drained': drained,
+        'latencies': sorted(latencies),
+        'orders': orders,
+        'replied': replied,
+        'api_calls': api_calls,
+        'calls': dict(sorted(backends.calls.items())),
+    }
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def print_result(result):
+    latencies = result['latencies']
+    per_order = result['api_calls'] / result['orders'] if result['orders'] else float('nan')
+    print(f"[{result['name']}] {result['messages']}メッセージ / 注文{result['orders']}行 / 返信{result['replied']}件")
+    print(f"  処理件数     {result['messages'] / result['elapsed']:8.1f} msg/s"
+          f"（全処理 {result['elapsed']:.2f}s、書き込み完了まで {result['drained']:.2f}s）")
+    print(f"  レイテンシ   p50 {percentile(latencies, 0.5) * 1000:8.1f} ms   p99 {percentile(latencies, 0.99) * 1000:8.1f} ms"
+          f"   平均 {statistics.fmean(latencies) * 1000:8.1f} ms")
+    print(f"  API呼び出し  {result['api_calls']}回（注文1件あたり {per_order:.3f}回）")
+    print('  内訳         ' + ', '.join(f"{key}={count}" for key, count in result['calls'].items()))
+
+def main():
+    args = parse_args()
+
+    os.environ['BOOK_CACHE_PATH'] = ''
+    os.environ['ORDER_QUEUE_PATH'] = ':memory:'
+    os.environ.pop('GOOGLE_CREDENTIALS_JSON', None)
+    if not args.real_budgets:
+        for backend in ('DISCORD', 'SHEETS', 'OPENBD'):
+            os.environ[f'{backend}_RATE_PER_SEC'] = '100000'
+            os.environ[f'{backend}_BURST'] = '100000'
+
+    logging.disable(logging.ERROR)
+    import main as bot
+
+    names = sorted(SCENARIOS) if args.scenario == 'all' else [args.scenario]
+    print(f"メッセージ{args.messages}件 / 同時{args.concurrency}件 / 遅延 Discord {args.discord_latency}s"
+          f" OpenBD {args.openbd_latency}s Sheets {args.sheets_latency}s"
+          f" / 429 Discord {args.discord_429} OpenBD {args.openbd_429} Sheets {args.sheets_429}"
+          f" / 予算 {'本番設定' if args.real_budgets else '制限なし'}")
+    for name in names:
+        print()
+        print_result(asyncio.run(run_scenario(bot, name, args)))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,130 @@
+"""Discordクライアントのメモリ使用量（通常モードと省メモリモード）
+
+ゲートウェイから届くイベントを合成して main.create_client() のクライアントに直接渡し、
+ギルド数・メッセージ数ごとの定常状態のRSSを比べる。接続はしない。
+省メモリモードはギルドのインテントを使わないので、GUILD_CREATE は届かない扱いにする。
+測定ごとに別プロセスで実行する。
+
+    python benchmarks/bench_memory.py
+    python benchmarks/bench_memory.py --guilds 10 100 1000 --messages 5000
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CHANNELS_PER_GUILD = 30
+ROLES_PER_GUILD = 20
+EMOJIS_PER_GUILD = 20
+MEMBERS_PER_GUILD = 50  # GUILD_MEMBERSインテントなしで届くのはごく一部のメンバー
+MESSAGE_CONTENT = "ISBN 978-4-09-290604-4 と 4-7594-0136-9 をお願いします。" * 3
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Discordクライアントのメモリ使用量')
+    parser.add_argument('--guilds', type=int, nargs='+', default=[10, 100, 500])
+    parser.add_argument('--messages', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--worker', nargs=3, metavar=('MODE', 'GUILDS', 'MESSAGES'), help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+def rss_mib():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+
+def user_payload(user_id):
+    return {'id': str(user_id), 'username': f"user{user_id}", 'discriminator': '0', 'global_name': None,
+            'avatar': None, 'bot': False}
+
+def guild_payload(guild_id):
+    base = guild_id * 1000
+    return {
+        'id': str(guild_id), 'name': f"guild{guild_id}", 'icon': None, 'owner_id': '1', 'afk_timeout': 300,
+        'verification_level': 0, 'default_message_notifications': 0, 'explicit_content_filter': 0,
+        'mfa_level': 0, 'nsfw_level': 0, 'premium_tier': 0, 'features': [], 'member_count': MEMBERS_PER_GUILD,
+        'large': False, 'preferred_locale': 'ja',
+        'channels': [{'id': str(base + i), 'type': 0, 'name': f"channel{i}", 'position': i, 'topic': None,
+                      'nsfw': False, 'permission_overwrites': [], 'parent_id': None}
+                     for i in range(CHANNELS_PER_GUILD)],
+        'roles': [{'id': str(guild_id if i == 0 else base + 100 + i), 'name': f"role{i}", 'color': 0,
+                   'hoist': False, 'position': i, 'permissions': '0', 'managed': False, 'mentionable': False}
+                  for i in range(ROLES_PER_GUILD)],
+        'emojis': [{'id': str(base + 200 + i), 'name': f"emoji{i}", 'roles': [], 'require_colons': True,
+                    'managed': False, 'animated': False, 'available': True}
+                   for i in range(EMOJIS_PER_GUILD)],
+        'members': [{'user': user_payload(base + 300 + i), 'roles': [], 'joined_at': '2024-01-01T00:00:00+00:00',
+                     'deaf': False, 'mute': False, 'flags': 0}
+                    for i in range(MEMBERS_PER_GUILD)],
+        'stickers': [], 'threads': [], 'voice_states': [], 'presences': [], 'stage_instances': [],
+        'guild_scheduled_events': [],
+    }
+
+def message_payload(message_id, guild_id):
+    author_id = guild_id * 1000 + 300 + message_id % MEMBERS_PER_GUILD
+    return {
+        'id': str(10 ** 9 + message_id), 'channel_id': str(guild_id * 1000 + message_id % CHANNELS_PER_GUILD),
+        'guild_id': str(guild_id), 'author': user_payload(author_id),
+        'member': {'roles': [], 'joined_at': '2024-01-01T00:00:00+00:00', 'deaf': False, 'mute': False, 'flags': 0},
+        'content': MESSAGE_CONTENT, 'timestamp': '2024-01-01T00:00:00+00:00', 'edited_timestamp': None,
+        'tts': False, 'mention_everyone': False, 'mentions': [], 'mention_roles': [], 'attachments': [],
+        'embeds': [], 'pinned': False, 'type': 0,
+    }
+
+async def measure(guilds, messages):
+    import main
+    client = main.create_client()
+    await client._async_setup_hook()  # login() の代わりにイベントループを設定する
+
+    async def ignore(message):
+        pass
+
+    client.on_message = ignore  # 注文処理は動かさず、キャッシュだけを測る
+    state = client._connection
+    gc.collect()
+    baseline = rss_mib()
+
+    lean = not state._intents.guilds
+    guild_ids = [i + 1 for i in range(guilds)]
+    if not lean:
+        for guild_id in guild_ids:
+            state.parse_guild_create(guild_payload(guild_id))
+    for i in range(messages):
+        state.parse_message_create(message_payload(i, guild_ids[i % guilds]))
+        if i % 500 == 0:
+            await asyncio.sleep(0)
+    await asyncio.sleep(0)
+    gc.collect()
+    return {
+        'rss_mib': rss_mib(),
+        'delta_mib': rss_mib() - baseline,
+        'cached_guilds': len(state._guilds),
+        'cached_messages': len(state._messages or ()),
+    }
+
+def run_worker(mode, guilds, messages):
+    env = dict(os.environ, LEAN_CLIENT='1' if mode == 'lean' else '', LOG_LEVEL='ERROR', LOG_FILE_PATH='',
+               BOOK_CACHE_PATH='', ORDER_QUEUE_PATH=':memory:')
+    output = subprocess.run([sys.executable, __file__, '--worker', mode, str(guilds), str(messages)],
+                            env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    args = parse_args()
+    if args.worker:
+        mode, guilds, messages = args.worker
+        print(json.dumps(asyncio.run(measure(int(guilds), int(messages)))))
+        return
+
+    print(f"{'mode':<8}{'guilds':>8}{'messages':>10}{'RSS MiB':>10}{'増加 MiB':>10}{'ギルド':>8}{'メッセージ':>10}")
+    for guilds in args.guilds:
+        for messages in args.messages:
+            for mode in ('default', 'lean'):
+                result = run_worker(mode, guilds, messages)
+                print(f"{mode:<8}{guilds:>8}{messages:>10}{result['rss_mib']:>10.1f}{result['delta_mib']:>10.1f}"
+                      f"{result['cached_guilds']:>8}{result['cached_messages']:>10}")
+
+if __name__ == '__main__':
+    main()
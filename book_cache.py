@@ -0,0 +1,140 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+class BookInfoCache:
+    """ISBN13をキーにした書籍情報キャッシュ（メモリ上のLRU + SQLite永続化）
+
+    値は (タイトル, 出版社, 価格)。OpenBDに登録がない場合の (None, None, None)
+    も短めのTTLでキャッシュする（ネガティブキャッシュ）。
+    SQLiteのファイルは open() か最初の読み書きのときに開く。
+    """
+
+    def __init__(self, db_path=None, max_entries=5000, ttl=7 * 24 * 3600, negative_ttl=24 * 3600):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()  # isbn13 -> (expires_at, info)
+        self._lock = threading.Lock()
+        self._db = None
+        self._opened = False
+
+    def open(self):
+        """SQLiteのファイルを開く（2回目以降は何もしない）"""
+        with self._lock:
+            self._open_locked()
+
+    def _open_locked(self):
+        if self._opened:
+            return
+        self._opened = True
+        if not self.db_path:
+            return
+        try:
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS book_info ("
+                "isbn13 TEXT PRIMARY KEY, info TEXT, expires_at REAL)"
+            )
+            self._db.commit()
+        except Exception as e:
+            logger.error(f"書籍キャッシュDBの初期化エラー: {e}")
+            self._db = None
+
+    def stats(self):
+        """ヒット数・ミス数・ヒット率を返す"""
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'entries': len(self._memory),
+        }
+
+    def get(self, isbn13):
+        """キャッシュから取得。見つからないか期限切れならNoneを返す"""
+        now = time.time()
+        with self._lock:
+            self._open_locked()
+            entry = self._memory.get(isbn13)
+            if entry is None and self._db is not None:
+                entry = self._load(isbn13)
+                if entry is not None:
+                    self._remember(isbn13, entry)
+
+            if entry is None or entry[0] < now:
+                if entry is not None:
+                    self._memory.pop(isbn13, None)
+                self.misses += 1
+                return None
+
+            self._memory.move_to_end(isbn13)
+            self.hits += 1
+            return entry[1]
+
+    def get_many(self, isbn13s):
+        """複数ISBNをまとめて取得し、(ヒットした結果の辞書, 未取得ISBNのリスト) を返す"""
+        found = {}
+        missing = []
+        for isbn13 in isbn13s:
+            info = self.get(isbn13)
+            if info is None:
+                missing.append(isbn13)
+            else:
+                found[isbn13] = info
+        return found, missing
+
+    def put(self, isbn13, info):
+        """書籍情報を保存（見つからなかった結果は negative_ttl で保存）"""
+        self.put_many({isbn13: info})
+
+    def put_many(self, infos):
+        """複数の書籍情報をまとめて保存"""
+        now = time.time()
+        entries = []
+        with self._lock:
+            self._open_locked()
+            for isbn13, info in infos.items():
+                info = tuple(info)
+                ttl = self.negative_ttl if info[0] is None else self.ttl
+                entry = (now + ttl, info)
+                self._remember(isbn13, entry)
+                entries.append((isbn13, json.dumps(info, ensure_ascii=False), entry[0]))
+
+            if self._db is not None and entries:
+                try:
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO book_info (isbn13, info, expires_at) VALUES (?, ?, ?)",
+                        entries,
+                    )
+                    self._db.commit()
+                except Exception as e:
+                    logger.error(f"書籍キャッシュDBへの保存エラー: {e}")
+
+    def _remember(self, isbn13, entry):
+        """メモリ上のLRUに追加し、上限を超えたら古いものから削除"""
+        self._memory[isbn13] = entry
+        self._memory.move_to_end(isbn13)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _load(self, isbn13):
+        """SQLiteからエントリを読み込む"""
+        try:
+            row = self._db.execute(
+                "SELECT info, expires_at FROM book_info WHERE isbn13 = ?", (isbn13,)
+            ).fetchone()
+        except Exception as e:
+            logger.error(f"書籍キャッシュDBの読み込みエラー: {e}")
+            return None
+        if row is None:
+            return None
+        return row[1], tuple(json.loads(row[0]))
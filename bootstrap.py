@@ -0,0 +1,69 @@
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+class Services:
+    """外部サービスへの接続を起動時にまとめて行い、準備状況を管理する
+
+    インポート時には何も接続しない。接続処理は名前付きの非同期関数として
+    add_check で登録し、connect() で並行に実行する。必須の接続は成功するまで
+    間隔を延ばしながら再試行する。テストでは登録する関数を差し替えれば
+    認証情報なしで動かせる。
+    """
+
+    def __init__(self, timeout=30.0, retry_wait=5.0, max_retry_wait=300.0):
+        self.timeout = timeout
+        self.retry_wait = retry_wait
+        self.max_retry_wait = max_retry_wait
+        self._checks = {}
+        self._state = {}
+
+    def add_check(self, name, check, required=True):
+        """接続処理を登録する（check は成功したら返り、失敗したら例外を送出するコルーチン関数）"""
+        self._checks[name] = (check, required)
+        self._state[name] = {'ready': False, 'required': required, 'error': None, 'seconds': None}
+
+    def mark_ready(self, name, ready=True, error=None):
+        """外部から準備状況を更新する（Discordの接続・切断など）"""
+        state = self._state.setdefault(name, {'ready': False, 'required': True, 'error': None, 'seconds': None})
+        state['ready'] = ready
+        state['error'] = error
+
+    async def _run_check(self, name, check, required):
+        attempt = 0
+        while True:
+            started = time.monotonic()
+            try:
+                await asyncio.wait_for(check(), self.timeout)
+            except Exception as e:
+                self.mark_ready(name, False, str(e) or type(e).__name__)
+                self._state[name]['seconds'] = round(time.monotonic() - started, 3)
+                if not required:
+                    logger.warning(f"起動時の接続に失敗（必須ではないため続行）: {name}: {e}")
+                    return
+                wait = min(self.retry_wait * (2 ** attempt), self.max_retry_wait)
+                attempt += 1
+                logger.error(f"起動時の接続に失敗: {name}: {e}（{wait:.0f}秒後に再試行）")
+                await asyncio.sleep(wait)
+                continue
+
+            self.mark_ready(name, True)
+            self._state[name]['seconds'] = round(time.monotonic() - started, 3)
+            logger.info(f"起動時の接続完了: {name}（{time.monotonic() - started:.2f}秒）")
+            return
+
+    async def connect(self):
+        """登録された接続処理を並行に実行する（必須のものは全て成功するまで戻らない）"""
+        await asyncio.gather(*(self._run_check(name, check, required) for name, (check, required) in self._checks.items()))
+        return self.is_ready()
+
+    def is_ready(self, name=None):
+        """指定したサービス（省略時は必須のもの全て）が使える状態か"""
+        if name is not None:
+            return self._state.get(name, {}).get('ready', False)
+        return all(state['ready'] for state in self._state.values() if state['required'])
+
+    def status(self):
+        return {name: dict(state) for name, state in self._state.items()}
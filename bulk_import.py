@@ -0,0 +1,99 @@
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+IMPORT_EXTENSIONS = ('.csv', '.tsv', '.txt')
+READ_CHUNK_BYTES = 64 * 1024
+
+class ImportTooLarge(Exception):
+    """添付ファイルが取り込みの上限サイズを超えた"""
+
+def is_import_attachment(attachment):
+    """取り込み対象の添付ファイル（CSV・TSV・テキスト）か"""
+    return attachment.filename.lower().endswith(IMPORT_EXTENSIONS)
+
+def decode_line(raw):
+    """1行をデコードする（UTF-8でなければExcelが出力するShift_JISとみなす）"""
+    try:
+        return raw.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        return raw.decode('cp932', errors='replace')
+
+async def iter_attachment_lines(session, url, max_bytes):
+    """添付ファイルをダウンロードしながら1行ずつ返す（ファイル全体はメモリに載せない）
+
+    READ_CHUNK_BYTES ずつ読んで改行で区切るので、1行が長くても（カンマ区切りで
+    1行に並べたISBNなど）max_bytes までは読める。
+    """
+    async with session.get(url) as response:
+        response.raise_for_status()
+        if response.content_length and response.content_length > max_bytes:
+            raise ImportTooLarge(f"ファイルが大きすぎます（{response.content_length}バイト、上限{max_bytes}バイト）")
+        received = 0
+        rest = b''
+        async for chunk in response.content.iter_chunked(READ_CHUNK_BYTES):
+            received += len(chunk)
+            if received > max_bytes:
+                raise ImportTooLarge(f"ファイルが大きすぎます（上限{max_bytes}バイト）")
+            *lines, rest = (rest + chunk).split(b'\n')
+            for raw in lines:
+                yield decode_line(raw + b'\n')
+        if rest:
+            yield decode_line(rest)
+
+class ImportProgress:
+    """一括取り込みの集計と進捗表示"""
+
+    def __init__(self, filenames):
+        self.filenames = filenames
+        self.started = time.monotonic()
+        self.lines = 0
+        self.isbns = 0  # 重複を除いた有効なISBN
+        self.duplicates = 0
+        self.invalid = 0
+        self.ordered = 0
+        self.without_info = 0
+        self.errors = []
+        self.truncated = False
+
+    @property
+    def processed(self):
+        return self.ordered + self.without_info + len(self.errors)
+
+    def record(self, title, url, error):
+        """process_single_isbn の結果を集計する"""
+        if title:
+            self.ordered += 1
+        elif url:
+            self.without_info += 1
+        elif error:
+            self.errors.append(error)
+
+    def format_progress(self):
+        elapsed = time.monotonic() - self.started
+        return (f"📥 {', '.join(self.filenames)} を取り込み中…\n"
+                f"{self.lines}行を読み込み / ISBN {self.isbns}件中 {self.processed}件を処理（{elapsed:.0f}秒経過）")
+
+    def format_summary(self, sheet_write_error=None, failure=None):
+        elapsed = time.monotonic() - self.started
+        heading = "⚠️ 取り込みを中断しました" if failure else "✅ 取り込みが完了しました"
+        lines = [
+            f"{heading}（{', '.join(self.filenames)}、{elapsed:.0f}秒）",
+            f"・読み込んだ行: {self.lines}行",
+            f"・発注依頼: {self.ordered + self.without_info}件（うち書籍情報なし {self.without_info}件）",
+        ]
+        if self.duplicates:
+            lines.append(f"・重複のため省略: {self.duplicates}件")
+        if self.invalid:
+            lines.append(f"・ISBNとして読み取れなかった数字: {self.invalid}件")
+        if self.truncated:
+            lines.append("・件数の上限に達したため、以降の行は取り込んでいません")
+        if self.errors:
+            lines.append(f"・エラー: {len(self.errors)}件")
+            lines.extend(f"　{error}" for error in self.errors[:3])  # 最大3件まで表示
+        if failure:
+            lines.append(f"※{failure}")
+        if sheet_write_error:
+            lines.append("※スプレッドシートへの書き込みが混み合っているため、記録は後ほど自動で再試行します")
+        return '\n'.join(lines)
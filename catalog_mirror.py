@@ -0,0 +1,276 @@
+"""OpenBDの一括データから作るローカルの書籍カタログ（メモリマップした索引）
+
+ファイル構成（リトルエンディアン）:
+    ヘッダー   MAGIC(8バイト) + 件数(uint64)
+    索引       件数 × [ISBN13(13バイト) + blob内の位置(uint32) + 長さ(uint16)]（ISBN順）
+    blob       "タイトル\\x1f出版社\\x1f価格" をUTF-8で詰めたもの
+
+索引は固定長でISBN順に並んでいるので、mmapしたまま二分探索で引ける。
+ページはOSのキャッシュに載るだけなので、全件をメモリに読み込むよりRSSが小さい。
+
+使い方:
+    python catalog_mirror.py build  dump.jsonl catalog.bin   # 一括データから作る
+    python catalog_mirror.py update catalog.bin changes.jsonl # 変わった書籍だけ差し替える
+    python catalog_mirror.py lookup catalog.bin 9784...       # 確認用
+
+一括データはOpenBDの /v1/get が返すレコードのJSON配列、または1行1レコードのJSON Lines。
+"""
+import argparse
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+
+from openbd import parse_book_data
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'BOOKMIR1'
+HEADER = struct.Struct('<8sQ')
+ENTRY = struct.Struct('<13sIH')
+KEY_SIZE = 13
+FIELD_SEPARATOR = '\x1f'
+MAX_VALUE_BYTES = 0xFFFF
+MAX_BLOB_BYTES = 0xFFFFFFFF
+
+def pack_info(info):
+    """(タイトル, 出版社, 価格) をblobに入れるバイト列にする"""
+    fields = ['' if value is None else str(value).replace(FIELD_SEPARATOR, ' ') for value in info]
+    return FIELD_SEPARATOR.join(fields).encode('utf-8')[:MAX_VALUE_BYTES]
+
+def unpack_info(value):
+    title, publisher, price = value.decode('utf-8', errors='replace').split(FIELD_SEPARATOR)
+    return title or None, publisher or None, price or None
+
+def iter_dump_records(path):
+    """一括データ（JSON配列またはJSON Lines）から (isbn13, OpenBDのレコード) を返す"""
+    with open(path, encoding='utf-8') as f:
+        head = f.read(1)
+        while head and head.isspace():
+            head = f.read(1)
+        f.seek(0)
+        records = json.load(f) if head == '[' else (json.loads(line) for line in f if line.strip())
+        for record in records:
+            if not record:
+                continue
+            isbn = str(record.get('summary', {}).get('isbn', '')).replace('-', '')
+            if len(isbn) == KEY_SIZE and isbn.isdigit():
+                yield isbn, record
+
+def write_mirror(path, entries):
+    """ISBN順の (isbn13, 値のバイト列) からファイルを作る（一時ファイルに書いて差し替える）"""
+    tmp_path = f"{path}.tmp"
+    index = bytearray()
+    count = 0
+    with open(f"{tmp_path}.blob", 'wb+') as blob:
+        offset = 0
+        for key, value in entries:
+            if offset + len(value) > MAX_BLOB_BYTES:
+                raise ValueError("カタログのデータが4GBを超えました")
+            index += ENTRY.pack(key.encode('ascii'), offset, len(value))
+            blob.write(value)
+            offset += len(value)
+            count += 1
+        blob.seek(0)
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, count))
+            f.write(index)
+            while True:
+                chunk = blob.read(1024 * 1024)
+                if not chunk:
+                    break
+                f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+    os.remove(f"{tmp_path}.blob")
+    os.replace(tmp_path, path)
+    return count
+
+class CatalogMirror:
+    """ローカルカタログの読み取り（mmap + 二分探索）
+
+    ファイルが update で差し替えられたら、reload_interval 秒以内に開き直す。
+    ファイルがなければ何も見つからないだけで、OpenBDへの問い合わせに任せる。
+    """
+
+    def __init__(self, path, reload_interval=60):
+        self.path = path
+        self.reload_interval = reload_interval
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._file = None
+        self._mmap = None
+        self._count = 0
+        self._blob_start = 0
+        self._stat = None
+        self._checked_at = 0.0
+        self._open()
+
+    def __len__(self):
+        return self._count
+
+    def _open(self):
+        """ファイルを開き直す（開けなければ空のカタログとして扱う）"""
+        self._checked_at = time.monotonic()
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            self._close()
+            return
+        if self._stat is not None and (stat.st_ino, stat.st_mtime_ns) == self._stat:
+            return
+
+        self._close()
+        try:
+            f = open(self.path, 'rb')
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, count = HEADER.unpack_from(mm, 0)
+            if magic != MAGIC:
+                raise ValueError("カタログのファイル形式が違います")
+        except Exception as e:
+            logger.error(f"ローカルカタログを開けません（{self.path}）: {e}")
+            return
+        self._file, self._mmap, self._count = f, mm, count
+        self._blob_start = HEADER.size + count * ENTRY.size
+        self._stat = (stat.st_ino, stat.st_mtime_ns)
+        logger.info(f"ローカルカタログを読み込みました: {count}件（{self.path}）")
+
+    def _close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._file.close()
+        self._file = self._mmap = self._stat = None
+        self._count = 0
+
+    def _find(self, key):
+        """索引を二分探索し、見つかった値のバイト列を返す"""
+        mm = self._mmap
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            position = HEADER.size + middle * ENTRY.size
+            current = mm[position:position + KEY_SIZE]
+            if current < key:
+                low = middle + 1
+            elif current > key:
+                high = middle
+            else:
+                _, offset, length = ENTRY.unpack_from(mm, position)
+                start = self._blob_start + offset
+                return mm[start:start + length]
+        return None
+
+    def get_many(self, isbn13s):
+        """(見つかった結果の辞書, 見つからなかったISBNのリスト) を返す"""
+        with self._lock:
+            if time.monotonic() - self._checked_at >= self.reload_interval:
+                self._open()
+            if self._mmap is None:
+                return {}, list(isbn13s)
+
+            found = {}
+            missing = []
+            for isbn13 in isbn13s:
+                value = self._find(isbn13.encode('ascii')) if len(isbn13) == KEY_SIZE else None
+                if value is None:
+                    missing.append(isbn13)
+                else:
+                    found[isbn13] = unpack_info(value)
+            self.hits += len(found)
+            self.misses += len(missing)
+            return found, missing
+
+    def get(self, isbn13):
+        found, _ = self.get_many([isbn13])
+        return found.get(isbn13)
+
+    def iter_entries(self):
+        """全件を (isbn13, 値のバイト列) でISBN順に返す（update用）"""
+        mm = self._mmap
+        for i in range(self._count):
+            key, offset, length = ENTRY.unpack_from(mm, HEADER.size + i * ENTRY.size)
+            start = self._blob_start + offset
+            yield key.decode('ascii'), mm[start:start + length]
+
+    def stats(self):
+        return {'path': self.path, 'entries': self._count, 'hits': self.hits, 'misses': self.misses}
+
+def build(dump_path, out_path):
+    """一括データからカタログを作る（同じISBNが複数あれば後のレコードを使う）"""
+    values = {isbn: pack_info(parse_book_data(record)) for isbn, record in iter_dump_records(dump_path)}
+    return write_mirror(out_path, ((isbn, values[isbn]) for isbn in sorted(values)))
+
+def update(mirror_path, changes_path):
+    """変更分のデータを既存のカタログにマージする
+
+    既存の索引と変更分はどちらもISBN順なので、並べて突き合わせるだけで済む。
+    内容が変わらないレコードは既存のバイト列をそのまま使う。
+    戻り値は (追加件数, 更新件数, 全件数)。
+    """
+    changes = {isbn: pack_info(parse_book_data(record)) for isbn, record in iter_dump_records(changes_path)}
+    mirror = CatalogMirror(mirror_path)
+    if mirror._mmap is None:
+        return len(changes), 0, write_mirror(mirror_path, ((isbn, changes[isbn]) for isbn in sorted(changes)))
+
+    counts = {'added': 0, 'updated': 0}
+
+    def merged():
+        pending = iter(sorted(changes))
+        next_change = next(pending, None)
+        for isbn, value in mirror.iter_entries():
+            while next_change is not None and next_change < isbn:
+                counts['added'] += 1
+                yield next_change, changes[next_change]
+                next_change = next(pending, None)
+            if next_change == isbn:
+                if changes[isbn] != value:
+                    counts['updated'] += 1
+                    value = changes[isbn]
+                next_change = next(pending, None)
+            yield isbn, value
+        while next_change is not None:
+            counts['added'] += 1
+            yield next_change, changes[next_change]
+            next_change = next(pending, None)
+
+    try:
+        total = write_mirror(mirror_path, merged())
+    finally:
+        mirror._close()
+    return counts['added'], counts['updated'], total
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="OpenBDの一括データからローカルカタログを作る")
+    commands = parser.add_subparsers(dest='command', required=True)
+    build_parser = commands.add_parser('build', help="一括データから作り直す")
+    build_parser.add_argument('dump')
+    build_parser.add_argument('mirror')
+    update_parser = commands.add_parser('update', help="変更分だけ差し替える")
+    update_parser.add_argument('mirror')
+    update_parser.add_argument('changes')
+    lookup_parser = commands.add_parser('lookup', help="ISBN13で引く")
+    lookup_parser.add_argument('mirror')
+    lookup_parser.add_argument('isbns', nargs='+')
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    if args.command == 'build':
+        total = build(args.dump, args.mirror)
+        print(f"{args.mirror}: {total}件（{time.perf_counter() - started:.1f}秒）")
+    elif args.command == 'update':
+        added, updated, total = update(args.mirror, args.changes)
+        print(f"{args.mirror}: 追加{added}件 / 更新{updated}件 / 全{total}件（{time.perf_counter() - started:.1f}秒）")
+    else:
+        mirror = CatalogMirror(args.mirror)
+        for isbn in args.isbns:
+            print(isbn, mirror.get(isbn))
+    return 0
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -0,0 +1,160 @@
+import asyncio
+import cProfile
+import hmac
+import io
+import logging
+import marshal
+import pstats
+import time
+import tracemalloc
+import weakref
+from datetime import datetime
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+MAX_PROFILE_SECONDS = 300
+
+_task_created = weakref.WeakKeyDictionary()  # タスク -> 作成時刻（track_task_ages を呼んだ後に作られたもの）
+_task_first_seen = weakref.WeakKeyDictionary()  # タスク -> /debug/tasks で初めて見た時刻
+_profile_lock = asyncio.Lock()
+_last_snapshot = None
+
+def track_task_ages(loop):
+    """以降に作られるタスクの作成時刻を記録する（デバッグ用エンドポイントを有効にしたときだけ呼ぶ）"""
+    default_factory = loop.get_task_factory()
+
+    def factory(loop, coro, **kwargs):
+        if default_factory is not None:
+            task = default_factory(loop, coro, **kwargs)
+        else:
+            task = asyncio.Task(coro, loop=loop, **kwargs)
+        _task_created[task] = time.monotonic()
+        return task
+
+    loop.set_task_factory(factory)
+
+def _attachment(text, filename, content_type='text/plain'):
+    """ダウンロードできるレポートとして返す"""
+    body = text.encode('utf-8') if isinstance(text, str) else text
+    return web.Response(body=body, content_type=content_type, charset='utf-8' if isinstance(text, str) else None,
+                        headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+def _timestamp():
+    return datetime.now().strftime('%Y%m%d-%H%M%S')
+
+def create_debug_routes(token):
+    """/debug/* のルート（token がリクエストの Authorization: Bearer と一致したときだけ応答する）"""
+    routes = web.RouteTableDef()
+
+    def authorized(handler):
+        async def check(request):
+            supplied = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+            if not hmac.compare_digest(supplied.encode(), token.encode()):
+                return web.json_response({'error': 'unauthorized'}, status=401)
+            return await handler(request)
+        return check
+
+    @routes.get('/debug/profile')
+    @authorized
+    async def profile(request):
+        """イベントループのスレッドを seconds 秒間 cProfile で計測する（format=pstats で生データ）"""
+        try:
+            seconds = min(float(request.query.get('seconds', 30)), MAX_PROFILE_SECONDS)
+        except ValueError:
+            return web.json_response({'error': 'seconds は数値で指定してください'}, status=400)
+        if _profile_lock.locked():
+            return web.json_response({'error': '別の計測を実行中です'}, status=409)
+
+        async with _profile_lock:
+            profiler = cProfile.Profile()
+            logger.warning(f"プロファイル計測開始: {seconds:.0f}秒")
+            profiler.enable()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                profiler.disable()
+            logger.warning("プロファイル計測終了")
+
+        if request.query.get('format') == 'pstats':
+            # python -m pstats や snakeviz で開ける
+            profiler.create_stats()
+            return _attachment(marshal.dumps(profiler.stats), f"profile-{_timestamp()}.pstats", 'application/octet-stream')
+        out = io.StringIO()
+        stats = pstats.Stats(profiler, stream=out)
+        stats.sort_stats(request.query.get('sort', 'cumulative')).print_stats(int(request.query.get('limit', 60)))
+        return _attachment(out.getvalue(), f"profile-{_timestamp()}.txt")
+
+    @routes.get('/debug/tracemalloc')
+    @authorized
+    async def memory(request):
+        """メモリ割り当ての追跡（action=start / stop、省略時は割り当ての多い行の一覧）
+
+        追跡中は全ての割り当てが遅くなるので、調べ終わったら action=stop で止める。
+        前回の一覧からの増減は compare=1 で見られる。
+        """
+        global _last_snapshot
+        action = request.query.get('action')
+        if action == 'start':
+            tracemalloc.start(int(request.query.get('frames', 1)))
+            _last_snapshot = None
+            logger.warning("tracemalloc を開始しました")
+            return web.json_response({'tracing': True})
+        if action == 'stop':
+            tracemalloc.stop()
+            _last_snapshot = None
+            logger.warning("tracemalloc を停止しました")
+            return web.json_response({'tracing': False})
+        if not tracemalloc.is_tracing():
+            return web.json_response({'tracing': False, 'error': 'action=start で追跡を開始してください'}, status=409)
+
+        limit = int(request.query.get('limit', 30))
+        snapshot = await asyncio.to_thread(tracemalloc.take_snapshot)
+        snapshot = snapshot.filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),))
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [f"traced: {current / 1024 / 1024:.1f} MiB (peak {peak / 1024 / 1024:.1f} MiB)", '']
+        if request.query.get('compare') and _last_snapshot is not None:
+            lines.append(f"前回からの増減 上位{limit}件:")
+            lines.extend(str(stat) for stat in snapshot.compare_to(_last_snapshot, 'lineno')[:limit])
+        else:
+            lines.append(f"割り当ての多い行 上位{limit}件:")
+            lines.extend(str(stat) for stat in snapshot.statistics('lineno')[:limit])
+        _last_snapshot = snapshot
+        return _attachment('\n'.join(lines) + '\n', f"tracemalloc-{_timestamp()}.txt")
+
+    @routes.get('/debug/tasks')
+    @authorized
+    async def tasks(request):
+        """実行中のasyncioタスクを古い順に一覧する（format=text でスタックも出す）"""
+        now = time.monotonic()
+        rows = []
+        for task in asyncio.all_tasks():
+            if task is asyncio.current_task():
+                continue
+            created = _task_created.get(task)
+            if created is None:
+                created = _task_first_seen.setdefault(task, now)
+            coro = task.get_coro()
+            stack = task.get_stack(limit=1)
+            rows.append({
+                'name': task.get_name(),
+                'coro': getattr(coro, '__qualname__', repr(coro)),
+                'age_seconds': round(now - created, 3),
+                'age_known': task in _task_created,  # Falseなら作成時刻ではなく初めて一覧した時刻からの秒数
+                'waiting_at': f"{stack[0].f_code.co_filename}:{stack[0].f_lineno}" if stack else None,
+                'task': task,
+            })
+        rows.sort(key=lambda row: row['age_seconds'], reverse=True)
+
+        if request.query.get('format') == 'text':
+            out = io.StringIO()
+            for row in rows:
+                out.write(f"--- {row['name']} {row['coro']} ({row['age_seconds']:.1f}秒)\n")
+                row['task'].print_stack(file=out)
+            return _attachment(out.getvalue(), f"tasks-{_timestamp()}.txt")
+        for row in rows:
+            del row['task']
+        return web.json_response({'count': len(rows), 'tasks': rows})
+
+    return routes
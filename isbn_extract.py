@@ -0,0 +1,136 @@
+"""メッセージ本文からISBN候補を抽出する
+
+数字の並び（区切り文字 ':' '-' 空白 で連結されたもの）を1回の線形走査で取り出し、
+桁数をもとにISBN1件分ずつに切り分ける。バックトラックが爆発しない正規表現だけを使うため、
+表計算ソフトから貼り付けた長い数字とハイフンの羅列でも処理時間は入力長に比例する。
+候補は見つけた順に返すので、limit件で打ち切れば残りの並びは切り分けない。
+"""
+import re
+from collections import deque
+
+# 区切り文字で連結された数字の並び（末尾のXはISBN10のチェックディジット）
+# 数字列の間には必ず区切り文字が入るため、一致の仕方が一意になりバックトラックしない
+_RUN_RE = re.compile(r'(?:ISBN[:\s-]*)?\d+(?:[:\s-]+\d+)*(?:[:\s-]*X(?![A-Z]))?', re.IGNORECASE)
+# 並びの中の数字グループ
+_GROUP_RE = re.compile(r'\d+X?|X', re.IGNORECASE)
+
+MIN_CANDIDATE_DIGITS = 9  # これより短い候補はISBNとして解釈できない
+MAX_CANDIDATE_DIGITS = 13
+
+def _iter_groups(run_start, run_text):
+    """並びの中の数字グループを (本文中の開始位置, 文字列) で順に返す
+
+    区切りのない長い数字列はISBNの長さごとに分割する（位置をずらして切り出すだけなので
+    数字列の長さに比例した時間で済む）。
+    """
+    for match in _GROUP_RE.finditer(run_text):
+        start, end = match.span()
+        while end - start > MAX_CANDIDATE_DIGITS:
+            size = 13 if run_text.startswith(('978', '979'), start) else 10
+            yield run_start + start, run_text[start:start + size]
+            start += size
+        yield run_start + start, run_text[start:end]
+
+class _GroupReader:
+    """数字グループを順に読む（判定に必要な数グループだけ先読みする）"""
+
+    def __init__(self, groups):
+        self._groups = groups
+        self._ahead = deque()
+
+    def peek(self, index):
+        """index個先のグループ（なければNone）"""
+        while len(self._ahead) <= index:
+            group = next(self._groups, None)
+            if group is None:
+                return None
+            self._ahead.append(group)
+        return self._ahead[index]
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._ahead:
+            return self._ahead.popleft()
+        return next(self._groups)
+
+def _can_complete_isbn10(count, text, reader):
+    """count桁の候補に text とその後のグループを足していくと、ちょうど9桁か10桁で区切れるか"""
+    count += len(text)
+    index = 0
+    while count < MIN_CANDIDATE_DIGITS:
+        group = reader.peek(index)
+        if group is None:
+            return False
+        count += len(group[1])
+        index += 1
+    return count <= 10
+
+def _iter_run_candidates(run_match):
+    """1つの並びをISBN1件分ずつの (開始位置, 終了位置, 桁数) に切り分ける"""
+    run_text = run_match.group()
+    run_start = run_match.start()
+    reader = _GroupReader(_iter_groups(run_start, run_text))
+
+    # 区切りを除いて13桁以下なら並び全体で1件（ほとんどのメッセージはここで終わる）
+    total = 0
+    index = 0
+    while total <= MAX_CANDIDATE_DIGITS:
+        group = reader.peek(index)
+        if group is None:
+            yield run_start, run_match.end(), total
+            return
+        total += len(group[1])
+        index += 1
+
+    current_start = 0
+    current_end = 0
+    starts_with_97x = False
+    count = 0
+
+    for start, text in reader:
+        size = len(text)
+        if count and (count == MAX_CANDIDATE_DIGITS
+                      or count + size > MAX_CANDIDATE_DIGITS
+                      or (count == 10 and not starts_with_97x)
+                      or (not starts_with_97x and text[:3] in ('978', '979')
+                          and not _can_complete_isbn10(count, text, reader))):
+            # 978/979のグループの前で切るのは、今の候補がISBN10の長さにならないとき
+            # （表計算の「1<TAB>978-...」のように前の列の数字が付いた場合）
+            yield current_start, current_end, count
+            count = 0
+
+        if not count:
+            current_start = start
+            # 978/979で始まるか（先頭グループが3桁未満なら次のグループも見る）
+            head = text
+        elif count < 3:
+            head += text
+        starts_with_97x = head[:3] in ('978', '979')
+        current_end = start + size
+        count += size
+
+    if count:
+        yield current_start, current_end, count
+
+def iter_isbn_candidates(content, limit=None):
+    """本文からISBN候補の文字列を順に返すジェネレータ
+
+    9〜13桁の候補のみを返し、limit件に達したら打ち切る。
+    先頭の「ISBN」表記は候補に含める（解析側で取り除かれる）。
+    """
+    found = 0
+    for run_match in _RUN_RE.finditer(content):
+        first = True
+        for start, end, count in _iter_run_candidates(run_match):
+            if first:
+                # 「ISBN」表記があれば最初の候補に含める
+                start = run_match.start()
+                first = False
+            if count < MIN_CANDIDATE_DIGITS:
+                continue
+            yield content[start:end]
+            found += 1
+            if limit is not None and found >= limit:
+                return
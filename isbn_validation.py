@@ -0,0 +1,207 @@
+"""ISBNの検証・修正エンジン（isbnlibを使わない純Python実装）
+
+チェックディジットは位置ごとの重み付きテーブルで計算し、
+入力の数字列を1回走査するだけで全ての修正パターンを判定する。
+"""
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# ISBN修正の種類（修正が不要だった場合はNone）
+CORRECTION_SUFFIX_978 = 'suffix_978'  # ISBN13の後ろ10桁をISBN10として入力
+CORRECTION_ISBN10_CHECK = 'isbn10_check_digit'  # ISBN10チェックディジット
+CORRECTION_978_ISBN10 = '978_isbn10'  # ISBN10の前に978を付けただけ
+CORRECTION_978_ISBN10_CHECK = '978_isbn10_check_digit'  # 978+ISBN10（チェックディジット修正）
+CORRECTION_ISBN13_CHECK = 'isbn13_check_digit'  # ISBN13チェックディジット
+CORRECTION_COMPLETE_9 = 'complete_9'  # 9桁補完
+CORRECTION_COMPLETE_12 = 'complete_12'  # 12桁補完
+
+_NON_ISBN_CHARS = re.compile(r'[^\dX]')
+
+# ASCII数字 -> 値（全角数字などはisbnlibと同様に無効扱い）
+_DIGIT_VALUES = {str(d): d for d in range(10)}
+
+# 位置ごとの重み付き値テーブル: _ISBN10_TABLE[i][d] = d * (10 - i)
+_ISBN10_TABLE = tuple(tuple(d * (10 - i) for d in range(10)) for i in range(9))
+# ISBN13の重み（1, 3, 1, 3, ...）: _ISBN13_TABLE[i][d]
+_ISBN13_TABLE = tuple(tuple(d * (3 if i % 2 else 1) for d in range(10)) for i in range(12))
+# 「978」+ 9桁 の先頭3桁分の重み付き合計（9*1 + 7*3 + 8*1）
+_PREFIX_978_SUM = 38
+
+# 合計値の剰余 -> チェックディジット
+_ISBN10_CHECK_CHARS = '0X987654321'  # (11 - r) % 11、10はX
+_ISBN13_CHECK_CHARS = '0987654321'  # (10 - r) % 10
+
+def _weighted_sums(digits9):
+    """9桁の数字列を1回走査し、(ISBN10用の合計, 978を前置したISBN13用の合計) を返す
+
+    数字以外が含まれていれば (None, None)。
+    """
+    sum10 = 0
+    sum13 = _PREFIX_978_SUM
+    for i, char in enumerate(digits9):
+        value = _DIGIT_VALUES.get(char)
+        if value is None:
+            return None, None
+        sum10 += _ISBN10_TABLE[i][value]
+        # 978の後ろに続くので位置は3から始まる
+        sum13 += _ISBN13_TABLE[i + 3][value]
+    return sum10, sum13
+
+def _isbn13_sum(digits12):
+    """12桁の数字列のISBN13用の重み付き合計（数字以外が含まれていればNone）"""
+    total = 0
+    for i, char in enumerate(digits12):
+        value = _DIGIT_VALUES.get(char)
+        if value is None:
+            return None
+        total += _ISBN13_TABLE[i][value]
+    return total
+
+def calculate_isbn10_check_digit(isbn9):
+    """ISBN10のチェックディジットを計算"""
+    if len(isbn9) != 9:
+        return None
+    sum10, _ = _weighted_sums(isbn9)
+    if sum10 is None:
+        return None
+    return _ISBN10_CHECK_CHARS[sum10 % 11]
+
+def calculate_isbn13_check_digit(isbn12):
+    """ISBN13のチェックディジットを計算"""
+    if len(isbn12) != 12:
+        return None
+    total = _isbn13_sum(isbn12)
+    if total is None:
+        return None
+    return _ISBN13_CHECK_CHARS[total % 10]
+
+def is_isbn10(isbn10):
+    """正規化済み10桁がISBN10として正しいか"""
+    return len(isbn10) == 10 and calculate_isbn10_check_digit(isbn10[:9]) == isbn10[9]
+
+def is_isbn13(isbn13):
+    """正規化済み13桁がISBN13として正しいか"""
+    return (len(isbn13) == 13 and isbn13[:3] in ('978', '979')
+            and calculate_isbn13_check_digit(isbn13[:12]) == isbn13[12])
+
+def to_isbn13(isbn10):
+    """正しいISBN10をISBN13に変換（変換できなければ空文字）"""
+    if not is_isbn10(isbn10):
+        return ''
+    _, sum13 = _weighted_sums(isbn10[:9])
+    return '978' + isbn10[:9] + _ISBN13_CHECK_CHARS[sum13 % 10]
+
+def to_isbn10(isbn13):
+    """正しいISBN13をISBN10に変換（979で始まるなど変換できなければ空文字）"""
+    if not isbn13.startswith('978') or not is_isbn13(isbn13):
+        return ''
+    sum10, _ = _weighted_sums(isbn13[3:12])
+    return isbn13[3:12] + _ISBN10_CHECK_CHARS[sum10 % 11]
+
+def _fix_10(clean_isbn):
+    """10桁入力の判定（ISBN10 / ISBN13の後ろ10桁 / ISBN10チェックディジット間違い）"""
+    sum10, sum13 = _weighted_sums(clean_isbn[:9])
+    if sum10 is None:
+        return None, None, None
+
+    last = clean_isbn[9]
+    check10 = _ISBN10_CHECK_CHARS[sum10 % 11]
+    check13 = _ISBN13_CHECK_CHARS[sum13 % 10]
+    isbn10 = clean_isbn[:9] + check10
+    isbn13 = '978' + clean_isbn[:9] + check13
+
+    # 通常のISBN10
+    if check10 == last:
+        return clean_isbn, isbn13, None
+
+    # ISBN13の後ろ10桁（978 + 9桁 + チェックディジット）
+    # ※979で始まるISBN13にはISBN10が存在しないため、このパターンは978のみ
+    if check13 == last:
+        logger.info(f"ISBN修正: 後ろ10桁パターン {clean_isbn} -> {isbn10}")
+        return isbn10, isbn13, CORRECTION_SUFFIX_978
+
+    # チェックディジットが間違っている
+    logger.info(f"ISBN修正: ISBN10チェックディジット {clean_isbn} -> {isbn10}")
+    return isbn10, isbn13, CORRECTION_ISBN10_CHECK
+
+def _fix_13(clean_isbn):
+    """13桁入力の判定（ISBN13 / 978+ISBN10 / ISBN13チェックディジット間違い）"""
+    sum13 = _isbn13_sum(clean_isbn[:12])
+    if sum13 is None:
+        return None, None, None
+
+    prefix = clean_isbn[:3]
+    if prefix not in ('978', '979'):
+        return None, None, None
+
+    isbn13 = clean_isbn[:12] + _ISBN13_CHECK_CHARS[sum13 % 10]
+
+    if prefix == '979':
+        # 979で始まるISBN13にはISBN10が存在しない
+        if isbn13 == clean_isbn:
+            return '', clean_isbn, None
+        logger.info(f"ISBN修正: ISBN13チェックディジット {clean_isbn} -> {isbn13}")
+        return '', isbn13, CORRECTION_ISBN13_CHECK
+
+    # 978で始まる場合、後ろ9桁から同時にISBN10を求める
+    # （978 + 9桁 の重み付き合計はISBN13の先頭12桁の合計と同じ）
+    sum10, _ = _weighted_sums(clean_isbn[3:12])
+    isbn10 = clean_isbn[3:12] + _ISBN10_CHECK_CHARS[sum10 % 11]
+
+    # 通常のISBN13
+    if isbn13 == clean_isbn:
+        return isbn10, clean_isbn, None
+
+    # ISBN10の前に978を付けただけ
+    if isbn10 == clean_isbn[3:]:
+        logger.info(f"ISBN修正: 978+ISBN10パターン {clean_isbn} -> {isbn13}")
+        return isbn10, isbn13, CORRECTION_978_ISBN10
+
+    # 978+ISBN10でチェックディジットも間違っている
+    logger.info(f"ISBN修正: 978+ISBN10(チェックディジット修正) {clean_isbn} -> {isbn13}")
+    return isbn10, isbn13, CORRECTION_978_ISBN10_CHECK
+
+def _fix_9(clean_isbn):
+    """9桁入力をISBN10として補完"""
+    sum10, sum13 = _weighted_sums(clean_isbn)
+    if sum10 is None:
+        return None, None, None
+    isbn10 = clean_isbn + _ISBN10_CHECK_CHARS[sum10 % 11]
+    isbn13 = '978' + clean_isbn + _ISBN13_CHECK_CHARS[sum13 % 10]
+    logger.info(f"ISBN修正: 9桁補完 {clean_isbn} -> {isbn10}")
+    return isbn10, isbn13, CORRECTION_COMPLETE_9
+
+def _fix_12(clean_isbn):
+    """12桁入力をISBN13として補完"""
+    sum13 = _isbn13_sum(clean_isbn)
+    if sum13 is None or clean_isbn[:3] not in ('978', '979'):
+        return None, None, None
+    isbn13 = clean_isbn + _ISBN13_CHECK_CHARS[sum13 % 10]
+    logger.info(f"ISBN修正: 12桁補完 {clean_isbn} -> {isbn13}")
+    return to_isbn10(isbn13), isbn13, CORRECTION_COMPLETE_12
+
+_FIXERS = {9: _fix_9, 10: _fix_10, 12: _fix_12, 13: _fix_13}
+
+def fix_isbn(isbn_input):
+    """ISBN入力を検証・修正し、(ISBN10, ISBN13, 修正の種類) を返す
+
+    無効な入力は (None, None, None)。979で始まるISBN13のISBN10は空文字。
+    """
+    clean_isbn = _NON_ISBN_CHARS.sub('', isbn_input.upper())
+    fixer = _FIXERS.get(len(clean_isbn))
+    if fixer is None:
+        return None, None, None
+    return fixer(clean_isbn)
+
+def fix_isbns(isbn_inputs):
+    """複数のISBN入力をまとめて検証・修正し、入力と同じ順に fix_isbn の結果を返す
+
+    同じ入力は1回だけ計算する（メッセージや取り込みファイルの1行の候補をまとめて渡す）。
+    """
+    results = {}
+    for isbn_input in isbn_inputs:
+        if isbn_input not in results:
+            results[isbn_input] = fix_isbn(isbn_input)
+    return [results[isbn_input] for isbn_input in isbn_inputs]
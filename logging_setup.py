@@ -0,0 +1,131 @@
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import zlib
+from datetime import datetime, timezone
+
+correlation_id = contextvars.ContextVar('correlation_id', default=None)
+
+RATE_LIMIT_LOGGER = 'bookbot.rate_limit'
+
+# LogRecordが標準で持つ属性（これ以外は extra で渡された項目としてJSONに出す）
+_STANDARD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime', 'correlation_id'}
+
+def set_correlation_id(value):
+    """このタスク（とそこから作るタスク）のログに付けるIDを設定する"""
+    return correlation_id.set(value)
+
+class CorrelationFilter(logging.Filter):
+    """ログを出したタスクの相関IDを record.correlation_id に記録する"""
+
+    def filter(self, record):
+        record.correlation_id = correlation_id.get()
+        return True
+
+class SamplingFilter(logging.Filter):
+    """INFO未満のログを sample_rate の割合だけ残す
+
+    相関IDがあればIDから決めるので、残すメッセージのDEBUGログは全て揃う。
+    """
+
+    def __init__(self, sample_rate):
+        super().__init__()
+        self.sample_rate = sample_rate
+
+    def filter(self, record):
+        if record.levelno >= logging.INFO or self.sample_rate >= 1:
+            return True
+        key = getattr(record, 'correlation_id', None)
+        if key is None:
+            return random.random() < self.sample_rate
+        return zlib.crc32(key.encode()) % 10000 < self.sample_rate * 10000
+
+class JsonFormatter(logging.Formatter):
+    """1行1レコードのJSON（extra で渡した項目もそのまま出す）"""
+
+    def format(self, record):
+        data = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if getattr(record, 'correlation_id', None):
+            data['correlation_id'] = record.correlation_id
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS:
+                data[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data['exc_info'] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+class TextFormatter(logging.Formatter):
+    """従来の形式（extra の項目は key=value、相関IDがあれば [ID] を末尾に付ける）"""
+
+    def __init__(self):
+        super().__init__('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    def formatMessage(self, record):
+        text = super().formatMessage(record)
+        extras = ' '.join(f"{key}={value}" for key, value in vars(record).items() if key not in _STANDARD_ATTRS)
+        if extras:
+            text = f"{text} {extras}"
+        cid = getattr(record, 'correlation_id', None)
+        return f"{text} [{cid}]" if cid else text
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """キューに入れる前にメッセージと例外を文字列にする（extra の項目は残す）"""
+
+    def prepare(self, record):
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+def setup_logging(level='INFO', json_output=True, file_path=None, max_bytes=10 * 1024 * 1024,
+                  backup_count=5, debug_sample_rate=1.0, rate_limit_log_path=None):
+    """ログ出力をバックグラウンドのスレッドに任せる
+
+    ログを出す側はキューに入れるだけで戻るので、コンソールやファイルへの書き込みで
+    イベントループが止まらない。書き込みは QueueListener のスレッドが行い、
+    ファイルは max_bytes ごとにローテーションする。Rate Limitの記録
+    （RATE_LIMIT_LOGGER）は rate_limit_log_path にも出す。
+    """
+    formatter = JsonFormatter() if json_output else TextFormatter()
+    handlers = [logging.StreamHandler()]
+    if file_path:
+        handlers.append(logging.handlers.RotatingFileHandler(
+            file_path, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8', delay=True))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    if rate_limit_log_path:
+        rate_limit_handler = logging.handlers.RotatingFileHandler(
+            rate_limit_log_path, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8', delay=True)
+        rate_limit_handler.setFormatter(formatter)
+        rate_limit_handler.addFilter(logging.Filter(RATE_LIMIT_LOGGER))
+        handlers.append(rate_limit_handler)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = _QueueHandler(log_queue)
+    queue_handler.addFilter(CorrelationFilter())
+    queue_handler.addFilter(SamplingFilter(debug_sample_rate))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)  # 終了時にキューに残ったログを書き出す
+    return listener
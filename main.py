@@ -1,6 +1,5 @@
 import discord
 import re
-import gspread
 import requests
 import os
 import json
@@ -8,30 +7,136 @@ import logging
 import asyncio
 import random
 import time
-import threading
+from collections import deque, namedtuple
+from contextlib import aclosing
 from datetime import datetime, timedelta, timezone
-from oauth2client.service_account import ServiceAccountCredentials
-from isbnlib import to_isbn10, to_isbn13, canonical, is_isbn10, is_isbn13
-from flask import Flask, request
-
-# ログ設定（より詳細な設定）
-logging.basicConfig(
-    level=logging.INFO, 
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),  # コンソール出力
-    ]
-)
+from functools import lru_cache
+import aiohttp
+from aiohttp import web
+import metrics
+from sheet_buffer import SheetWriteBuffer
+from order_queue import OrderQueue
+from sheet_index import SheetIndex, ISBN13_COLUMN, QUANTITY_COLUMN, STATUS_COLUMN, ORDER_KEY_COLUMN
+from openbd import MAX_ISBNS_PER_REQUEST, OPENBD_GET_URL, warm_up as warm_up_openbd
+from metadata_providers import MetadataLookup, OpenBDProvider, NDLSearchProvider, NDL_SEARCH_URL
+from book_cache import BookInfoCache
+from catalog_mirror import CatalogMirror
+from isbn_validation import fix_isbn, fix_isbns
+from isbn_extract import iter_isbn_candidates
+from rate_limiter import RateLimitScheduler
+from quota_store import SQLiteQuotaStore
+from sheet_routes import SheetRoute, SheetRouter, parse_guild_sheet_urls, suffixed_path
+from reply_sender import ReplySender
+from bootstrap import Services
+from sheets_client import SheetsClient
+from bulk_import import ImportProgress, ImportTooLarge, is_import_attachment, iter_attachment_lines
+from debug_tools import create_debug_routes, track_task_ages
+from logging_setup import setup_logging, set_correlation_id, RATE_LIMIT_LOGGER
+
+# ログ設定（書き込みはバックグラウンドのスレッドで行う）
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json')  # json または text（従来の形式）
+LOG_FILE_PATH = os.environ.get('LOG_FILE_PATH', '/tmp/bookbot.log')  # 空文字ならコンソールのみ
+LOG_FILE_MAX_BYTES = int(os.environ.get('LOG_FILE_MAX_BYTES', 10 * 1024 * 1024))
+LOG_FILE_BACKUPS = int(os.environ.get('LOG_FILE_BACKUPS', 5))
+LOG_DEBUG_SAMPLE_RATE = float(os.environ.get('LOG_DEBUG_SAMPLE_RATE', 0.1))  # DEBUGログを残すメッセージの割合
+RATE_LIMIT_LOG_PATH = os.environ.get('RATE_LIMIT_LOG_PATH', '/tmp/rate_limit_errors.txt')
+
 logger = logging.getLogger(__name__)
+rate_limit_logger = logging.getLogger(RATE_LIMIT_LOGGER)
 
-# Rate Limit対策の設定
-RATE_LIMIT_DETECTED = False
-RATE_LIMIT_START_TIME = None
+# Rate Limit対策の設定（Discordログイン時の429のみ長時間待機）
 MIN_WAIT_MINUTES = 30  # 最低30分待機
 MAX_WAIT_MINUTES = 120  # 最大2時間待機
 
-# Flask app for health check
-app = Flask(__name__)
+# API別のRate Limit予算（1秒あたりのリクエスト数, 連続で送れる数）
+DISCORD_RATE_PER_SEC = float(os.environ.get('DISCORD_RATE_PER_SEC', 1.0))
+DISCORD_BURST = int(os.environ.get('DISCORD_BURST', 5))
+SHEETS_RATE_PER_SEC = float(os.environ.get('SHEETS_RATE_PER_SEC', 0.9))  # Sheets APIは1分あたり60リクエスト
+SHEETS_BURST = int(os.environ.get('SHEETS_BURST', 5))
+OPENBD_RATE_PER_SEC = float(os.environ.get('OPENBD_RATE_PER_SEC', 5.0))
+OPENBD_BURST = int(os.environ.get('OPENBD_BURST', 10))
+NDL_RATE_PER_SEC = float(os.environ.get('NDL_RATE_PER_SEC', 1.0))
+NDL_BURST = int(os.environ.get('NDL_BURST', 3))
+REPLY_MAX_RETRIES = int(os.environ.get('REPLY_MAX_RETRIES', 3))  # 返信の再試行回数（429・5xxのみ）
+
+# 1メッセージから読み取るISBN候補の上限
+MAX_ISBN_CANDIDATES_PER_MESSAGE = int(os.environ.get('MAX_ISBN_CANDIDATES_PER_MESSAGE', 200))
+
+# ISBN解析結果のメモ化件数
+ISBN_RESOLVE_CACHE_SIZE = int(os.environ.get('ISBN_RESOLVE_CACHE_SIZE', 4096))
+
+# 同時に処理するISBN数（全メッセージ合計。APIごとの上限はRate Limitの予算で別に守られる）
+ISBN_WORKERS = int(os.environ.get('ISBN_WORKERS', 8))
+
+# Google Sheetsまとめ書き込みの設定
+SHEET_FLUSH_INTERVAL = float(os.environ.get('SHEET_FLUSH_INTERVAL', 5))  # 定期書き込み間隔（秒）
+SHEET_FLUSH_MAX_ROWS = int(os.environ.get('SHEET_FLUSH_MAX_ROWS', 50))  # この行数に達したら即書き込み
+SHEET_APPEND_MAX_ROWS = int(os.environ.get('SHEET_APPEND_MAX_ROWS', 500))  # 1回のappend_rowsで書き込む最大行数
+SHEET_FLUSH_PER_MESSAGE = os.environ.get('SHEET_FLUSH_PER_MESSAGE', '1') != '0'  # メッセージごとに書き込むか
+SHEET_FLUSH_REPLY_WAIT = float(os.environ.get('SHEET_FLUSH_REPLY_WAIT', 3))  # 返信前に書き込みの完了を待つ上限秒数
+ORDER_QUEUE_PATH = os.environ.get('ORDER_QUEUE_PATH', '/tmp/order_queue.sqlite3')  # 受付済み注文の記録先
+
+# 添付ファイルからの一括取り込み（「!import」とCSV/TXTを添付して送信）
+BULK_IMPORT_COMMAND = os.environ.get('BULK_IMPORT_COMMAND', '!import')
+BULK_IMPORT_MAX_BYTES = int(os.environ.get('BULK_IMPORT_MAX_BYTES', 5 * 1024 * 1024))  # 添付ファイルの上限サイズ
+BULK_IMPORT_MAX_ISBNS = int(os.environ.get('BULK_IMPORT_MAX_ISBNS', 10000))  # 1回の取り込みの上限件数
+BULK_IMPORT_CONCURRENCY = int(os.environ.get('BULK_IMPORT_CONCURRENCY', 4))  # 同時に問い合わせる書籍情報のまとまり数
+BULK_IMPORT_PROGRESS_SECONDS = float(os.environ.get('BULK_IMPORT_PROGRESS_SECONDS', 5))  # 進捗表示を更新する間隔
+
+# 注文の既定値
+ORDER_QUANTITY = 2  # 1件あたりの発注冊数
+ORDER_STATUS_PENDING = '注文待ち'
+
+# スプレッドシート上の重複注文の扱い
+# append: そのまま追加 / skip: 追加しない / merge: 既存の「注文待ち」行の冊数に加算
+DUPLICATE_ORDER_POLICY = os.environ.get('DUPLICATE_ORDER_POLICY', 'append')
+SHEET_INDEX_REFRESH_MINUTES = float(os.environ.get('SHEET_INDEX_REFRESH_MINUTES', 10))  # 索引の読み直し間隔
+SHEETS_MAX_CONNECTIONS = int(os.environ.get('SHEETS_MAX_CONNECTIONS', 4))  # Sheets APIへのKeep-Alive接続数の上限
+SHEETS_TIMEOUT = float(os.environ.get('SHEETS_TIMEOUT', 30))  # Sheets APIへのリクエスト1回の上限秒数
+SHEETS_COALESCE_SECONDS = float(os.environ.get('SHEETS_COALESCE_SECONDS', 0.05))  # この間に来た書き込みを1回のリクエストにまとめる
+
+# シャーディング（複数プロセスでシャードを分担する場合に設定）
+SHARD_COUNT = int(os.environ['SHARD_COUNT']) if os.environ.get('SHARD_COUNT') else None  # 全体のシャード数
+SHARD_IDS = [int(shard_id) for shard_id in os.environ.get('SHARD_IDS', '').split(',') if shard_id.strip()] or None  # このプロセスが担当するシャード
+INSTANCE_NAME = f"shard-{'-'.join(str(shard_id) for shard_id in SHARD_IDS)}" if SHARD_IDS else ''  # プロセスごとのファイル名の接尾辞
+# Google Sheets・OpenBDの予算をプロセス間で共有するストア（シャーディング時の既定は /tmp/quota.sqlite3、空文字ならプロセスごと）
+QUOTA_STORE_PATH = os.environ.get('QUOTA_STORE_PATH', '/tmp/quota.sqlite3' if SHARD_COUNT else '')
+SHARED_QUOTA_BACKENDS = ('sheets', 'openbd', 'ndl')
+
+# ギルドごとの書き込み先（{"ギルドID": "スプレッドシートURL"}、指定のないギルドは GOOGLE_SHEET_URL）
+GUILD_SHEET_URLS = parse_guild_sheet_urls(os.environ.get('GUILD_SHEET_URLS'))
+
+# 書籍情報キャッシュの設定
+BOOK_CACHE_PATH = os.environ.get('BOOK_CACHE_PATH', '/tmp/book_cache.sqlite3')  # 空文字ならメモリのみ
+BOOK_CACHE_MAX_ENTRIES = int(os.environ.get('BOOK_CACHE_MAX_ENTRIES', 5000))
+BOOK_CACHE_TTL_HOURS = float(os.environ.get('BOOK_CACHE_TTL_HOURS', 24 * 7))  # 書籍情報の有効期間
+BOOK_CACHE_NEGATIVE_TTL_HOURS = float(os.environ.get('BOOK_CACHE_NEGATIVE_TTL_HOURS', 24))  # 「見つからない」結果の有効期間
+CATALOG_MIRROR_PATH = os.environ.get('CATALOG_MIRROR_PATH', '')  # catalog_mirror.py で作ったローカルカタログ（空文字なら使わない）
+
+# 書籍情報の取得先（先頭から順に問い合わせる。URLはテスト用のスタブサーバーに差し替えられる）
+METADATA_PROVIDERS = [name.strip() for name in os.environ.get('METADATA_PROVIDERS', 'openbd,ndl').split(',') if name.strip()]
+OPENBD_URL = os.environ.get('OPENBD_URL', OPENBD_GET_URL)
+NDL_SEARCH_API_URL = os.environ.get('NDL_SEARCH_URL', NDL_SEARCH_URL)
+METADATA_HEDGE_DELAY = float(os.environ.get('METADATA_HEDGE_DELAY', 1.0))  # この秒数で答えがなければ次の取得先にも問い合わせる
+METADATA_TIMEOUT = float(os.environ.get('METADATA_TIMEOUT', 8))  # 1回の書籍情報取得の上限秒数
+METADATA_SLOW_CALL = float(os.environ.get('METADATA_SLOW_CALL', 5))  # これより遅い応答は失敗として数える
+METADATA_BREAKER_FAILURES = int(os.environ.get('METADATA_BREAKER_FAILURES', 5))  # 連続でこの回数失敗した取得先は一時的に使わない
+METADATA_BREAKER_RESET = float(os.environ.get('METADATA_BREAKER_RESET', 30))  # 使わない期間（秒）
+
+# 省メモリモード（ギルド・メンバー・メッセージをキャッシュしない。小さなコンテナ向け）
+LEAN_CLIENT = os.environ.get('LEAN_CLIENT', '').lower() in ('1', 'true', 'yes')
+
+# /debug/profile・/debug/tracemalloc・/debug/tasks（設定したトークンを Authorization: Bearer で渡したときだけ応答。空文字なら無効）
+DEBUG_TOKEN = os.environ.get('DEBUG_TOKEN', '')
+
+# 起動時の設定
+STARTUP_TIMEOUT = float(os.environ.get('STARTUP_TIMEOUT', 30))  # 起動時の接続1つあたりの上限秒数
+STARTUP_RETRY_WAIT = float(os.environ.get('STARTUP_RETRY_WAIT', 10))  # 起動に失敗したとき終了までに待つ秒数
+
+# ヘルスチェック・管理用のHTTPサーバー（Botと同じイベントループで動かす）
+WEB_PORT = int(os.environ.get('PORT', 5000))
+routes = web.RouteTableDef()
 
 # シンプルなヘルスチェック用の変数
 health_status = {
@@ -43,485 +148,677 @@ health_status = {
     'message_success_rate': 0.0
 }
 
-@app.route('/')
-def hello():
+# 処理段階ごとのメトリクス（/metrics でPrometheus形式で公開）
+MESSAGES_TOTAL = metrics.counter('bookbot_messages_total', 'ISBN候補を含む受信メッセージ数')
+ORDERS_TOTAL = metrics.counter('bookbot_orders_total', 'ISBNごとの処理結果', labels=('result',))
+ISBN_EXTRACT_SECONDS = metrics.histogram('bookbot_isbn_extract_seconds', '1メッセージからのISBN候補抽出の所要時間')
+ISBN_NORMALIZE_SECONDS = metrics.histogram('bookbot_isbn_normalize_seconds', '1メッセージ分のISBN検証・補正・重複除去の所要時間')
+REPLY_SECONDS = metrics.histogram('bookbot_reply_seconds', '返信送信の所要時間（Rate Limit待ち・再試行を含む）', labels=('result',))
+MESSAGE_SECONDS = metrics.histogram('bookbot_message_seconds', 'メッセージ受信から返信完了までの所要時間')
+
+def collect_runtime_metrics():
+    """スクレイプ時に計算する値（キュー長・キャッシュ・Rate Limit。/metrics のスレッドで呼ばれる）"""
+    cache_stats = book_cache.stats()
+    rate_limits = rate_limiter.status()
+    return [
+        ('bookbot_order_queue_depth', 'gauge', 'スプレッドシート未書き込みの注文数',
+         {(route.name,): route.queue.pending_count() for route in sheet_router.routes()}, ('route',)),
+        ('bookbot_book_cache_hits_total', 'counter', '書籍情報キャッシュのヒット数',
+         {(): cache_stats['hits']}, ()),
+        ('bookbot_book_cache_misses_total', 'counter', '書籍情報キャッシュのミス数',
+         {(): cache_stats['misses']}, ()),
+        ('bookbot_book_cache_hit_ratio', 'gauge', '書籍情報キャッシュのヒット率',
+         {(): cache_stats['hit_rate']}, ()),
+        ('bookbot_book_cache_entries', 'gauge', 'メモリ上の書籍情報キャッシュ件数',
+         {(): cache_stats['entries']}, ()),
+        ('bookbot_catalog_mirror_lookups_total', 'counter', 'ローカルカタログの検索件数',
+         {('hit',): catalog_mirror.hits, ('miss',): catalog_mirror.misses} if catalog_mirror is not None else {}, ('result',)),
+        ('bookbot_metadata_provider_open', 'gauge', '書籍情報の取得先がサーキットブレーカーで外されているか',
+         {(name,): int(state['state'] != 'closed') for name, state in metadata_lookup.status().items()}, ('provider',)),
+        ('bookbot_rate_limit_events_total', 'counter', 'API別の429（Rate Limit）発生回数',
+         {(name,): state['rate_limit_events'] for name, state in rate_limits.items()}, ('backend',)),
+        ('bookbot_rate_limit_waiting', 'gauge', 'API別の予算待ちの処理数',
+         {(name,): state['waiting'] for name, state in rate_limits.items()}, ('backend',)),
+        ('bookbot_rate_limit_blocked_seconds', 'gauge', 'API別のRate Limit解除までの残り秒数',
+         {(name,): state['blocked_seconds'] for name, state in rate_limits.items()}, ('backend',)),
+    ]
+
+metrics.add_collector(collect_runtime_metrics)
+
+def _json_dumps(data):
+    return json.dumps(data, ensure_ascii=False)
+
+@routes.get('/')
+async def hello(request):
     """メインのヘルスチェックエンドポイント"""
-    return "Discord Bot is running!"
+    return web.Response(text="Discord Bot is running!")
 
-@app.route('/ping')
-def ping():
+@routes.get('/ping')
+async def ping(request):
     """UptimeRobot用のpingエンドポイント"""
     health_status['last_check'] = datetime.now().isoformat()
-    return "pong"
+    return web.Response(text="pong")
 
-@app.route('/status')
-def status():
+@routes.get('/status')
+async def status(request):
     """詳細なステータス情報"""
-    return health_status
+    sheet_routes = {}
+    for route in sheet_router.routes():
+        sheet_routes[route.name] = {
+            'connected': route.sheet is not None,
+            'pending_orders': await asyncio.to_thread(route.queue.pending_count),
+            'sheet_index_rows': len(route.index),
+        }
+    return web.json_response({
+        **health_status,
+        'book_cache': book_cache.stats(),
+        'catalog_mirror': catalog_mirror.stats() if catalog_mirror is not None else None,
+        'rate_limits': await asyncio.to_thread(rate_limiter.status),
+        'metadata_providers': metadata_lookup.status(),
+        'pending_orders': sum(route['pending_orders'] for route in sheet_routes.values()),
+        'sheet_routes': sheet_routes,
+        'shards': {'shard_ids': SHARD_IDS, 'shard_count': SHARD_COUNT},
+        'services': services.status(),
+    }, dumps=_json_dumps)
 
-def run_web():
-    """Flaskサーバーを実行"""
-    port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port)
+@routes.get('/ready')
+async def ready(request):
+    """起動時の接続が完了してメッセージを処理できるか（できなければ503）"""
+    is_ready = services.is_ready()
+    return web.json_response(
+        {'ready': is_ready, 'services': services.status()},
+        status=200 if is_ready else 503,
+        dumps=_json_dumps,
+    )
+
+@routes.get('/metrics')
+async def prometheus_metrics(request):
+    """Prometheus形式のメトリクス（キュー長などSQLiteを読む値があるのでスレッドで組み立てる）"""
+    body = await asyncio.to_thread(metrics.render)
+    return web.Response(body=body.encode('utf-8'), headers={'Content-Type': metrics.CONTENT_TYPE})
+
+def create_web_app():
+    """ヘルスチェック・管理用のアプリケーションを作る"""
+    app = web.Application()
+    app.add_routes(routes)
+    if DEBUG_TOKEN:
+        app.add_routes(create_debug_routes(DEBUG_TOKEN))
+    return app
+
+async def start_web_server(port=WEB_PORT):
+    """HTTPサーバーを現在のイベントループで開始し、停止用のrunnerを返す"""
+    runner = web.AppRunner(create_web_app(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, '0.0.0.0', port).start()
+    logger.info(f"ヘルスチェックサーバー開始: ポート{port}")
+    return runner
 
 def get_server_ip():
     """サーバーIPを取得"""
     try:
-        response = requests.get('https://api.ipify.org')
+        response = requests.get('https://api.ipify.org', timeout=5)
         return response.text
     except:
         return "Unknown"
 
-def calculate_isbn10_check_digit(isbn9):
-    """ISBN10のチェックディジットを計算"""
-    try:
-        total = 0
-        for i, digit in enumerate(isbn9):
-            if not digit.isdigit():
-                return None
-            total += int(digit) * (10 - i)
-        
-        remainder = total % 11
-        if remainder == 0:
-            return '0'
-        elif remainder == 1:
-            return 'X'
-        else:
-            return str(11 - remainder)
-    except:
-        return None
+def fix_common_isbn_errors(isbn_input):
+    """一般的なISBN入力間違いを修正"""
+    isbn_10, isbn_13, _ = fix_isbn(isbn_input)
+    return isbn_10, isbn_13
+
+# 1件のISBN候補の解析結果（raw: 入力そのまま, correction: 修正の種類。修正なしならNone）
+IsbnRecord = namedtuple('IsbnRecord', ['raw', 'isbn10', 'isbn13', 'correction'])
+
+@lru_cache(maxsize=ISBN_RESOLVE_CACHE_SIZE)
+def resolve_isbn(isbn_raw):
+    """ISBN候補を解析・修正してIsbnRecordを返す（無効ならNone）
 
-def calculate_isbn13_check_digit(isbn12):
-    """ISBN13のチェックディジットを計算"""
+    同じ入力は一度しか解析しないよう結果をメモ化する。
+    """
     try:
-        total = 0
-        for i, digit in enumerate(isbn12):
-            if not digit.isdigit():
-                return None
-            multiplier = 1 if i % 2 == 0 else 3
-            total += int(digit) * multiplier
-        
-        remainder = total % 10
-        return str((10 - remainder) % 10)
-    except:
+        isbn_10, isbn_13, correction = fix_isbn(isbn_raw)
+        if isbn_13:
+            return IsbnRecord(isbn_raw, isbn_10, isbn_13, correction)
+        return None
+    except Exception as e:
+        logger.error(f"ISBN解析エラー: {e}")
         return None
 
-def fix_common_isbn_errors(isbn_input):
-    """一般的なISBN入力間違いを修正"""
+def resolve_isbns(isbn_raws):
+    """複数のISBN候補をまとめて解析し、入力と同じ順にIsbnRecord（無効ならNone）を返す"""
     try:
-        # 数字とXのみ抽出
-        clean_isbn = re.sub(r'[^\dX]', '', isbn_input.upper())
-        
-        # ケース1: ISBN13の後ろ10桁をISBN10として間違えて入力
-        if len(clean_isbn) == 10:
-            # 通常のISBN10として検証
-            if is_isbn10(clean_isbn):
-                return clean_isbn, to_isbn13(clean_isbn)
-            
-            # ISBN13の後ろ10桁の可能性をチェック
-            # 978 + 9桁 + チェックディジット の形で13桁にしてみる
-            if clean_isbn[0].isdigit():  # Xで始まることはない
-                test_isbn13 = '978' + clean_isbn
-                if len(test_isbn13) == 13 and is_isbn13(test_isbn13):
-                    corrected_isbn10 = to_isbn10(test_isbn13)
-                    if corrected_isbn10:
-                        logger.info(f"ISBN修正: 後ろ10桁パターン {clean_isbn} -> {corrected_isbn10}")
-                        return corrected_isbn10, test_isbn13
-            
-            # 979プレフィックスも試す
-            test_isbn13_979 = '979' + clean_isbn
-            if len(test_isbn13_979) == 13 and is_isbn13(test_isbn13_979):
-                corrected_isbn10 = to_isbn10(test_isbn13_979)
-                if corrected_isbn10:
-                    logger.info(f"ISBN修正: 979後ろ10桁パターン {clean_isbn} -> {corrected_isbn10}")
-                    return corrected_isbn10, test_isbn13_979
-            
-            # チェックディジットが間違っている可能性
-            isbn9 = clean_isbn[:9]
-            correct_check = calculate_isbn10_check_digit(isbn9)
-            if correct_check and correct_check != clean_isbn[9]:
-                corrected_isbn10 = isbn9 + correct_check
-                if is_isbn10(corrected_isbn10):
-                    logger.info(f"ISBN修正: ISBN10チェックディジット {clean_isbn} -> {corrected_isbn10}")
-                    return corrected_isbn10, to_isbn13(corrected_isbn10)
-        
-        # ケース2: ISBN10の前に978を付けただけの間違ったISBN13
-        elif len(clean_isbn) == 13:
-            # 通常のISBN13として検証
-            if is_isbn13(clean_isbn):
-                return to_isbn10(clean_isbn), clean_isbn
-            
-            # 978 + ISBN10 の形になっている可能性
-            if clean_isbn.startswith('978'):
-                potential_isbn10 = clean_isbn[3:]
-                if len(potential_isbn10) == 10:
-                    # ISBN10として正しいかチェック
-                    if is_isbn10(potential_isbn10):
-                        corrected_isbn13 = to_isbn13(potential_isbn10)
-                        logger.info(f"ISBN修正: 978+ISBN10パターン {clean_isbn} -> {corrected_isbn13}")
-                        return potential_isbn10, corrected_isbn13
-                    
-                    # ISBN10のチェックディジットを再計算
-                    isbn9 = potential_isbn10[:9]
-                    correct_check = calculate_isbn10_check_digit(isbn9)
-                    if correct_check:
-                        test_isbn10 = isbn9 + correct_check
-                        if is_isbn10(test_isbn10):
-                            corrected_isbn13 = to_isbn13(test_isbn10)
-                            logger.info(f"ISBN修正: 978+ISBN10(チェックディジット修正) {clean_isbn} -> {corrected_isbn13}")
-                            return test_isbn10, corrected_isbn13
-            
-            # チェックディジットが間違っている可能性
-            isbn12 = clean_isbn[:12]
-            correct_check = calculate_isbn13_check_digit(isbn12)
-            if correct_check and correct_check != clean_isbn[12]:
-                corrected_isbn13 = isbn12 + correct_check
-                if is_isbn13(corrected_isbn13):
-                    logger.info(f"ISBN修正: ISBN13チェックディジット {clean_isbn} -> {corrected_isbn13}")
-                    return to_isbn10(corrected_isbn13), corrected_isbn13
-        
-        # ケース3: 9桁や12桁の不完全な入力
-        elif len(clean_isbn) == 9:
-            # ISBN10の最初の9桁の可能性
-            correct_check = calculate_isbn10_check_digit(clean_isbn)
-            if correct_check:
-                test_isbn10 = clean_isbn + correct_check
-                if is_isbn10(test_isbn10):
-                    logger.info(f"ISBN修正: 9桁補完 {clean_isbn} -> {test_isbn10}")
-                    return test_isbn10, to_isbn13(test_isbn10)
-        
-        elif len(clean_isbn) == 12:
-            # ISBN13の最初の12桁の可能性
-            correct_check = calculate_isbn13_check_digit(clean_isbn)
-            if correct_check:
-                test_isbn13 = clean_isbn + correct_check
-                if is_isbn13(test_isbn13):
-                    logger.info(f"ISBN修正: 12桁補完 {clean_isbn} -> {test_isbn13}")
-                    return to_isbn10(test_isbn13), test_isbn13
-        
-        return None, None
-        
+        fixed = fix_isbns(isbn_raws)
     except Exception as e:
-        logger.error(f"ISBN修正処理エラー: {e}")
-        return None, None
+        logger.error(f"ISBN解析エラー: {e}")
+        return [resolve_isbn(isbn_raw) for isbn_raw in isbn_raws]
+    return [IsbnRecord(isbn_raw, isbn_10, isbn_13, correction) if isbn_13 else None
+            for isbn_raw, (isbn_10, isbn_13, correction) in zip(isbn_raws, fixed)]
 
 def normalize_isbn_for_dedup(isbn_raw):
     """重複検出用のISBN正規化（ISBN13形式に統一）"""
-    try:
-        # まず標準的な方法で処理を試行
-        isbn_digits = re.sub(r'[:\s-]', '', isbn_raw).upper()
-        
-        # 標準的な処理
-        if len(isbn_digits) == 10 and is_isbn10(isbn_digits):
-            return to_isbn13(isbn_digits)
-        elif len(isbn_digits) == 13 and is_isbn13(isbn_digits):
-            return isbn_digits
-        else:
-            # 修正機能を試行
-            fixed_isbn10, fixed_isbn13 = fix_common_isbn_errors(isbn_raw)
-            if fixed_isbn13:
-                return fixed_isbn13
-            
-        return None
-    except:
-        return None
+    record = resolve_isbn(isbn_raw)
+    return record.isbn13 if record else None
 
-def handle_rate_limit_error(error_message):
-    """Rate Limit エラーの処理"""
-    global RATE_LIMIT_DETECTED, RATE_LIMIT_START_TIME
+# API別のRate Limit管理（あるAPIの429で他のAPIは止めない）
+# Google Sheets・OpenBDの予算は QUOTA_STORE_PATH を使う全プロセスで共有する（ファイルは起動時に開く）
+quota_store = SQLiteQuotaStore(QUOTA_STORE_PATH) if QUOTA_STORE_PATH else None
+rate_limiter = RateLimitScheduler({
+    'discord': (DISCORD_RATE_PER_SEC, DISCORD_BURST),
+    'sheets': (SHEETS_RATE_PER_SEC, SHEETS_BURST),
+    'openbd': (OPENBD_RATE_PER_SEC, OPENBD_BURST),
+    'ndl': (NDL_RATE_PER_SEC, NDL_BURST),
+}, store=quota_store, shared=SHARED_QUOTA_BACKENDS)
+
+def is_rate_limit_error(error_message):
+    """エラー内容がRate Limitによるものか"""
+    return "429" in str(error_message) or "rate limit" in str(error_message).lower()
+
+async def handle_rate_limit_error(error_message, backend, retry_after=None):
+    """Rate Limit エラーの処理（該当APIだけを一時停止し、待たずに戻る）
+
+    停止中にそのAPIを使う処理は rate_limiter.acquire で解除まで順番待ちになる。
+    """
+    if not is_rate_limit_error(error_message):
+        return False
     
     current_time = datetime.now()
+    wait_seconds = await rate_limiter.penalize(backend, retry_after)
+    # RATE_LIMIT_LOG_PATH にも記録される（書き込みはログのスレッドが行う）
+    rate_limit_logger.error(f"Rate Limit検出 ({backend}): {wait_seconds:.0f}秒停止", extra={
+        'backend': backend,
+        'wait_seconds': round(wait_seconds, 1),
+        'error_details': str(error_message),
+        'next_retry': (current_time + timedelta(seconds=wait_seconds)).isoformat(),
+    })
+    return True
+
+async def wait_after_login_rate_limit(error_message):
+    """Discordログイン時のRate Limit処理（接続前なので長時間待機してから終了する）
+
+    待機中もヘルスチェックサーバーは同じイベントループで応答を続ける。
+    """
+    current_time = datetime.now()
     
-    # Rate Limit検出
-    if "429" in str(error_message) or "rate limit" in str(error_message).lower():
-        RATE_LIMIT_DETECTED = True
-        RATE_LIMIT_START_TIME = current_time
-        
-        # ランダムな待機時間 (30分～2時間)
-        wait_minutes = random.randint(MIN_WAIT_MINUTES, MAX_WAIT_MINUTES)
-        wait_seconds = wait_minutes * 60
-        
-        logger.error(f"Rate Limit検出: {current_time}")
-        logger.error(f"緊急待機開始: {wait_minutes}分 ({wait_seconds}秒)")
-        
-        # エラーログの詳細保存
-        error_log = f"""
-=== RATE LIMIT ERROR DETECTED ===
-Time: {current_time}
-Wait Duration: {wait_minutes} minutes
-Error Details: {error_message}
-IP: {get_server_ip()}
-Next Retry: {current_time + timedelta(minutes=wait_minutes)}
-================================
-        """
-        
-        # ログファイルに保存
-        with open('/tmp/rate_limit_errors.txt', 'a') as f:
-            f.write(error_log)
-        
-        logger.info(f"エラーログ保存完了。{wait_minutes}分待機中...")
-        
-        # 実際の待機
-        time.sleep(wait_seconds)
-        
-        # 待機終了後もRate Limitフラグは維持
-        logger.info(f"{wait_minutes}分の待機完了。慎重に再開します。")
-        
-        return True
+    # ランダムな待機時間 (30分～2時間)
+    wait_minutes = random.randint(MIN_WAIT_MINUTES, MAX_WAIT_MINUTES)
+    wait_seconds = wait_minutes * 60
     
-    return False
-
-# Discord bot setup with enhanced error handling
-intents = discord.Intents.default()
-intents.message_content = True
-client = discord.Client(intents=intents)
-
-# Google Sheets setup
-scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-google_credentials_json = os.environ.get('GOOGLE_CREDENTIALS_JSON')
-if google_credentials_json:
-    creds_dict = json.loads(google_credentials_json)
-    creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, scope)
-    gc = gspread.authorize(creds)
-    sheet = gc.open_by_url(os.environ.get('GOOGLE_SHEET_URL')).sheet1
-else:
-    logger.error("Google認証情報が見つかりません")
-
-def safe_reply(message, content, max_retries=5):
-    """Enhanced safe reply with exponential backoff"""
-    base_wait_time = 5.0  # 基本待機時間を5秒に増加
+    rate_limit_logger.error(f"ログイン時のRate Limit検出: 緊急待機開始 {wait_minutes}分 ({wait_seconds}秒)", extra={
+        'backend': 'discord (login)',
+        'wait_seconds': wait_seconds,
+        'error_details': str(error_message),
+        'ip': await asyncio.to_thread(get_server_ip),
+        'next_retry': (current_time + timedelta(minutes=wait_minutes)).isoformat(),
+    })
+    logger.info(f"{wait_minutes}分待機中...")
+    await asyncio.sleep(wait_seconds)
+    logger.info(f"{wait_minutes}分の待機完了。")
+
+# Discordクライアントとスプレッドシートは起動時に作る（インポート時には接続しない）
+client = None
+
+def create_route(name, sheet_url, queue_path):
+    """1つのスプレッドシート用の注文キュー・索引・書き込みバッファを作る
+
+    受け付けた注文はまずローカルのキューに記録し、append_rowsでまとめて書き込む。
+    索引（ISBN13・ステータス列）は重複チェックに使う。
+    """
+    index = SheetIndex(None, refresh_interval=SHEET_INDEX_REFRESH_MINUTES * 60)
+    queue = OrderQueue(queue_path)
+    buffer = SheetWriteBuffer(
+        None,
+        queue,
+        flush_interval=SHEET_FLUSH_INTERVAL,
+        max_rows=SHEET_FLUSH_MAX_ROWS,
+        rate_limiter=rate_limiter,
+        on_error=lambda error: handle_rate_limit_error(str(error), 'sheets', getattr(error, 'retry_after', None)),
+        on_written=index.record_append,
+        max_append_rows=SHEET_APPEND_MAX_ROWS,
+        order_key_column=ORDER_KEY_COLUMN,
+        on_merged=lambda row, row_number, quantity: record_merged_quantity(index, row, row_number, quantity),
+        on_merge_missed=lambda row, row_number: index.refresh_soon(),
+    )
+    return SheetRoute(name, sheet_url, queue, index, buffer)
+
+def create_sheet_router():
+    """ギルドごとの書き込み先を作る（同じURLのギルドは経路を共有）
+
+    注文キューはプロセス・経路ごとに別ファイルにする（複数プロセスで同じキューを取り合わない）。
+    """
+    default_route = create_route('default', os.environ.get('GOOGLE_SHEET_URL'), suffixed_path(ORDER_QUEUE_PATH, INSTANCE_NAME))
+    routes_by_url = {default_route.sheet_url: default_route}
+    guild_routes = {}
+    for guild_id, sheet_url in GUILD_SHEET_URLS.items():
+        if sheet_url not in routes_by_url:
+            name = f"guild-{guild_id}"
+            queue_path = suffixed_path(ORDER_QUEUE_PATH, '-'.join(part for part in (INSTANCE_NAME, name) if part))
+            routes_by_url[sheet_url] = create_route(name, sheet_url, queue_path)
+        guild_routes[guild_id] = routes_by_url[sheet_url]
+    return SheetRouter(default_route, guild_routes)
+
+sheet_router = create_sheet_router()
+
+# 既定の書き込み先（ギルド指定のない注文・DM）
+sheet_index = sheet_router.default.index
+order_queue = sheet_router.default.queue
+sheet_buffer = sheet_router.default.buffer
+
+# 返信は必ずawaitして送信し、429はDiscord指定のretry_afterに従う
+reply_sender = ReplySender(
+    rate_limiter,
+    max_retries=REPLY_MAX_RETRIES,
+    on_rate_limit=lambda error_message, retry_after: handle_rate_limit_error(error_message, 'discord', retry_after),
+)
+
+async def safe_reply(message, content):
+    """返信を送信し、実際の送信結果で統計を更新する"""
+    started = time.perf_counter()
+    success = await reply_sender.send(message, content)
+    REPLY_SECONDS.observe(time.perf_counter() - started, result='ok' if success else 'error')
+
+    health_status['total_messages'] += 1
+    if success:
+        health_status['successful_messages'] += 1
+    health_status['message_success_rate'] = health_status['successful_messages'] / health_status['total_messages']
+
+    return success
+
+def create_metadata_lookup(providers):
+    """書籍情報の取得先をまとめる（429は該当する取得先の予算だけを止める）"""
+    return MetadataLookup(
+        providers,
+        hedge_delay=METADATA_HEDGE_DELAY,
+        timeout=METADATA_TIMEOUT,
+        slow_call=METADATA_SLOW_CALL,
+        failure_threshold=METADATA_BREAKER_FAILURES,
+        reset_timeout=METADATA_BREAKER_RESET,
+        on_rate_limit=lambda name, error: handle_rate_limit_error(str(error), name, error.retry_after),
+    )
+
+METADATA_PROVIDER_FACTORIES = {
+    'openbd': lambda: OpenBDProvider(rate_limiter, url=OPENBD_URL, timeout=METADATA_TIMEOUT),
+    'ndl': lambda: NDLSearchProvider(rate_limiter, url=NDL_SEARCH_API_URL, timeout=METADATA_TIMEOUT),
+}
+
+def create_metadata_providers(names):
+    providers = []
+    for name in names:
+        if name in METADATA_PROVIDER_FACTORIES:
+            providers.append(METADATA_PROVIDER_FACTORIES[name]())
+        else:
+            logger.error(f"METADATA_PROVIDERS に不明な取得先があります（無視します）: {name}")
+    return providers
+
+metadata_lookup = create_metadata_lookup(create_metadata_providers(METADATA_PROVIDERS))
+
+# 書籍情報キャッシュ（同じISBNの再注文ではOpenBDに問い合わせない）
+book_cache = BookInfoCache(
+    db_path=BOOK_CACHE_PATH or None,
+    max_entries=BOOK_CACHE_MAX_ENTRIES,
+    ttl=BOOK_CACHE_TTL_HOURS * 3600,
+    negative_ttl=BOOK_CACHE_NEGATIVE_TTL_HOURS * 3600,
+)
+
+# ローカルカタログ（OpenBDの一括データ。登録があればOpenBDに問い合わせない）
+catalog_mirror = CatalogMirror(CATALOG_MIRROR_PATH) if CATALOG_MIRROR_PATH else None
+
+async def lookup_book_infos(isbns):
+    """複数ISBNの書籍情報をまとめて取得（ローカルカタログ・キャッシュ優先、残りをプロバイダーに問い合わせ）
+
+    問い合わせは MAX_ISBNS_PER_REQUEST 件ずつ並行に行い、全体で METADATA_TIMEOUT 秒までしか待たない。
+    再試行はしない（MetadataLookup が次のプロバイダーに引き直す）。分からなかったISBNは結果に含まれない。
+    """
+    mirrored = {}
+    if catalog_mirror is not None:
+        mirrored, isbns = catalog_mirror.get_many(isbns)
+    book_infos, missing = await asyncio.to_thread(book_cache.get_many, isbns)
+    book_infos.update(mirrored)
     
-    for attempt in range(max_retries):
-        try:
-            # Discord指定の待機時間を確認
-            wait_time = base_wait_time * (2 ** attempt)  # 指数関数的バックオフ
-            
-            logger.info(f"返信試行 {attempt + 1}/{max_retries} - {wait_time:.1f}秒待機後")
-            time.sleep(wait_time)
-            
-            # 実際の返信を送信
-            asyncio.create_task(message.reply(content))
-            
-            # 成功統計を更新
-            health_status['successful_messages'] += 1
-            health_status['total_messages'] += 1
-            health_status['message_success_rate'] = health_status['successful_messages'] / health_status['total_messages']
-            
-            logger.info(f"返信成功 (試行 {attempt + 1})")
+    if missing:
+        deadline = asyncio.get_running_loop().time() + METADATA_TIMEOUT
+        chunks = [missing[start:start + MAX_ISBNS_PER_REQUEST] for start in range(0, len(missing), MAX_ISBNS_PER_REQUEST)]
+        for fetched in await asyncio.gather(*(metadata_lookup.lookup(chunk, deadline) for chunk in chunks)):
+            # タイムアウトやエラーで分からなかったISBNは fetched に含まれず、キャッシュもしない
+            await asyncio.to_thread(book_cache.put_many, fetched)
+            book_infos.update(fetched)
+    
+    logger.info(f"書籍情報取得: カタログ{len(mirrored)}件 / キャッシュ{len(isbns) - len(missing)}件 / 問い合わせ{len(missing)}件")
+    return book_infos
+
+def is_pending_order_row(row, isbn_13):
+    """行が指定したISBN13の「注文待ち」の注文か"""
+    return (len(row) >= STATUS_COLUMN and str(row[ISBN13_COLUMN - 1]) == isbn_13
+            and row[STATUS_COLUMN - 1] == ORDER_STATUS_PENDING)
+
+def add_quantity(row, quantity):
+    row = list(row)
+    row[QUANTITY_COLUMN - 1] = int(row[QUANTITY_COLUMN - 1]) + quantity
+    return row
+
+async def merge_duplicate_order(isbn_13, order_key, new_row, route=None):
+    """既存の「注文待ち」の冊数に加算する。加算を受け付けたらTrueを返す
+
+    まだシートに書き込んでいない注文があれば注文キューの行に加算する。
+    シートの行への加算は注文キューに記録し、書き込みと同じくバックグラウンドで行う
+    （Sheetsが Rate Limit 中でも返信を待たせない）。その行が並べ替え・削除で
+    別の注文に変わっていれば、new_row を通常の注文として追記する。
+    """
+    route = route or sheet_router.default
+    if route.index.is_pending(isbn_13):
+        merged = await asyncio.to_thread(
+            route.queue.update_pending,
+            lambda row: is_pending_order_row(row, isbn_13),
+            lambda row: add_quantity(row, ORDER_QUANTITY),
+        )
+        if merged:
+            logger.info(f"重複注文を未書き込みの注文に加算: {isbn_13}")
             return True
-            
-        except discord.HTTPException as e:
-            error_str = str(e)
-            logger.warning(f"返信試行 {attempt + 1} 失敗: {error_str}")
-            
-            # Rate Limitエラーの特別処理
-            if "429" in error_str or "rate limit" in error_str.lower():
-                if handle_rate_limit_error(error_str):
-                    return False
-            
-            # Discord指定の待機時間があるかチェック
-            if hasattr(e, 'retry_after') and e.retry_after:
-                discord_wait_time = e.retry_after + 1  # +1秒のマージン
-                logger.info(f"Discord指定待機時間: {discord_wait_time}秒")
-                time.sleep(discord_wait_time)
-            
-            if attempt == max_retries - 1:
-                logger.error(f"返信最終試行失敗: {error_str}")
-                
-        except Exception as e:
-            logger.error(f"返信エラー (試行 {attempt + 1}): {str(e)}")
-            
-            # Rate Limitエラーの可能性をチェック
-            if handle_rate_limit_error(str(e)):
-                return False
     
-    # 統計更新（失敗）
-    health_status['total_messages'] += 1
-    if health_status['total_messages'] > 0:
-        health_status['message_success_rate'] = health_status['successful_messages'] / health_status['total_messages']
+    entries = route.index.find(isbn_13, ORDER_STATUS_PENDING)
+    if not entries:
+        return False
     
-    return False
+    row_number = entries[-1][0]
+    if await route.buffer.add_merge(order_key, new_row, row_number):
+        logger.info(f"重複注文の加算を受付: {isbn_13} 行{row_number}")
+    else:
+        logger.debug(f"受付済みの注文のためスキップ: {order_key}")
+    return True
 
-def get_openbd_info(isbn):
-    """OpenBD APIから書籍情報を取得"""
+def record_merged_quantity(index, row, row_number, quantity):
+    """加算の書き込みを索引に反映する"""
+    index.record_quantity(str(row[ISBN13_COLUMN - 1]), row_number, quantity)
+
+async def flush_before_reply(route):
+    """返信の前に注文キューの行を書き込む（返信は SHEET_FLUSH_REPLY_WAIT 秒までしか待たせない）
+
+    書き込みはバックグラウンドのタスクで行い、Sheetsが Rate Limit で停止中なら待たずに戻る。
+    間に合わなかった行は注文キューに残り、そのタスクか定期書き込みで送られる。
+    書き込めたらTrueを返す。
+    """
+    task = route.buffer.flush_in_background()
+    wait = 0 if rate_limiter.blocked_seconds('sheets') > 0 else SHEET_FLUSH_REPLY_WAIT
     try:
-        url = f"https://api.openbd.jp/v1/get?isbn={isbn}"
-        response = requests.get(url, timeout=10)
-        data = response.json()
-        
-        if data and data[0]:
-            book_data = data[0]
-            title = book_data.get('summary', {}).get('title', 'タイトル不明')
-            publisher = book_data.get('summary', {}).get('publisher', '出版社不明')
-            
-            # 価格情報の取得
-            price = None
-            if 'onix' in book_data and 'ProductSupply' in book_data['onix']:
-                supply_detail = book_data['onix']['ProductSupply'].get('SupplyDetail', {})
-                if 'Price' in supply_detail:
-                    price_data = supply_detail['Price']
-                    if isinstance(price_data, list) and len(price_data) > 0:
-                        price = price_data[0].get('PriceAmount', None)
-                    elif isinstance(price_data, dict):
-                        price = price_data.get('PriceAmount', None)
-            
-            return title, publisher, price
-        
-        return None, None, None
-        
-    except Exception as e:
-        logger.error(f"OpenBD API エラー: {e}")
-        return None, None, None
+        return await asyncio.wait_for(asyncio.shield(task), wait)
+    except asyncio.TimeoutError:
+        return False
 
 def get_hanmoto_url(isbn):
     """版元ドットコムのURLを生成"""
     return f"https://www.hanmoto.com/bd/isbn/{isbn}"
 
-def process_single_isbn(isbn_raw, message_author_id):
-    """単一ISBNの処理"""
+async def process_single_isbn(isbn_record, message_author_id, book_infos=None, message_id=None, route=None):
+    """単一ISBNの処理（ブロッキングI/Oはスレッドで実行）
+
+    isbn_recordはresolve_isbnの結果（文字列を渡した場合はここで解析する）。
+    book_infosにまとめて取得済みの書籍情報があれば、個別には問い合わせない（含まれないISBNは情報なし）。
+    注文は「メッセージID:ISBN13」をキーに注文キューへ記録され、同じ注文は二重に登録されない。
+    routeは書き込み先（省略時は既定のスプレッドシート）。
+    """
+    route = route or sheet_router.default
     try:
-        # まず標準的な方法で処理を試行
-        isbn_digits = re.sub(r'[:\s-]', '', isbn_raw).upper()
-        isbn_10 = None
-        isbn_13 = None
-        
-        # 標準的な処理
-        if len(isbn_digits) == 10 and is_isbn10(isbn_digits):
-            isbn_10 = isbn_digits
-            isbn_13 = to_isbn13(isbn_digits)
-        elif len(isbn_digits) == 13 and is_isbn13(isbn_digits):
-            isbn_13 = isbn_digits
-            isbn_10 = to_isbn10(isbn_digits)
-        else:
-            # 標準処理で失敗した場合、修正機能を試行
-            fixed_isbn10, fixed_isbn13 = fix_common_isbn_errors(isbn_raw)
-            if fixed_isbn10 and fixed_isbn13:
-                isbn_10 = fixed_isbn10
-                isbn_13 = fixed_isbn13
-            else:
+        if isinstance(isbn_record, str):
+            isbn_raw = isbn_record
+            isbn_record = resolve_isbn(isbn_raw)
+            if isbn_record is None:
+                isbn_digits = re.sub(r'[:\s-]', '', isbn_raw).upper()
                 return None, None, f"無効なISBN形式です: {isbn_digits}"
         
+        isbn_10 = isbn_record.isbn10
+        isbn_13 = isbn_record.isbn13
+        
         # 版元ドットコムのURL
         hanmoto_url = get_hanmoto_url(isbn_13 if isbn_13 else isbn_10)
         
-        # OpenBD APIから書籍情報を取得
-        title, publisher, price = get_openbd_info(isbn_13 if isbn_13 else isbn_10)
+        # 書籍情報を取得（まとめて取得済みならそれを使い、取れなかったものは問い合わせ直さない）
+        lookup_isbn = isbn_13 if isbn_13 else isbn_10
+        if book_infos is None:
+            book_infos = await lookup_book_infos([lookup_isbn])
+        title, publisher, price = book_infos.get(lookup_isbn, (None, None, None))
         
         # 現在の日付を取得
         current_date = datetime.now(timezone(timedelta(hours=9))).strftime('%Y/%m/%d')
         
-        # スプレッドシートへの情報書き込み
-        try:
-            if title is None:
-                # 書籍情報が取得できなかった場合
-                new_row = [str(current_date), str(isbn_10), str(isbn_13), "", "", "", 2, '注文待ち', str(message_author_id), str(hanmoto_url)]
-                sheet.append_row(new_row)
-                logger.info(f"Google Sheetにデータ追加（書籍情報なし）: {new_row}")
-                
-                # 書籍情報なしの場合はURLを返す
-                return None, hanmoto_url, None
+        # スプレッドシートへの情報書き込み（注文キューに記録し、まとめて書き込む）
+        order_key = f"{message_id}:{isbn_13}" if message_id is not None else None
+        if title is None:
+            # 書籍情報が取得できなかった場合
+            new_row = [str(current_date), str(isbn_10), str(isbn_13), "", "", "", ORDER_QUANTITY, ORDER_STATUS_PENDING, str(message_author_id), str(hanmoto_url), order_key or ""]
+        else:
+            # 書籍情報が取得できた場合
+            new_row = [str(current_date), str(isbn_10), str(isbn_13), title, str(price), publisher, ORDER_QUANTITY, ORDER_STATUS_PENDING, str(message_author_id), str(hanmoto_url), order_key or ""]
+        
+        # 重複チェックから注文キューへの記録までは同じISBNごとに1つずつ（並行処理中の二重登録を防ぐ）
+        async with route.order_lock(isbn_13):
+            # スプレッドシートに同じ書籍の「注文待ち」があるか（索引を見るだけでAPIは呼ばない）
+            if route.index.find(isbn_13, ORDER_STATUS_PENDING) or route.index.is_pending(isbn_13):
+                logger.info(f"注文待ちの重複を検出: {isbn_13}（{DUPLICATE_ORDER_POLICY}）")
+                if DUPLICATE_ORDER_POLICY == 'skip':
+                    return None, None, f"『{title or isbn_13}』は既に注文待ちのため追加しませんでした"
+                if DUPLICATE_ORDER_POLICY == 'merge' and await merge_duplicate_order(isbn_13, order_key, new_row, route):
+                    return (title, None, None) if title is not None else (None, hanmoto_url, None)
+        
+            if await route.buffer.add(order_key, new_row):
+                route.index.record_pending(isbn_13)
+                logger.debug(f"注文キューにデータ追加: {new_row}")
             else:
-                # 書籍情報が取得できた場合
-                new_row = [str(current_date), str(isbn_10), str(isbn_13), title, str(price), publisher, 2, '注文待ち', str(message_author_id), str(hanmoto_url)]
-                sheet.append_row(new_row)
-                logger.info(f"Google Sheetにデータ追加: {new_row}")
-                
-                # 書籍情報ありの場合はタイトルのみ返す
-                return title, None, None
-            
-        except Exception as e:
-            error_str = str(e)
-            logger.error(f"Google Sheets書き込みエラー: {error_str}")
-            
-            # Rate Limitエラーの可能性をチェック
-            if handle_rate_limit_error(error_str):
-                return None, None, "Rate Limit検出のため処理を中断しました"
-            
-            return None, None, f"書籍情報の保存でエラーが発生しました: {error_str}"
+                logger.debug(f"受付済みの注文のためスキップ: {order_key}")
+        
+        if title is None:
+            # 書籍情報なしの場合はURLを返す
+            return None, hanmoto_url, None
+        
+        # 書籍情報ありの場合はタイトルのみ返す
+        return title, None, None
             
     except Exception as e:
         error_str = str(e)
         logger.error(f"ISBN処理エラー: {error_str}")
         
-        # Rate Limitエラーの可能性をチェック
-        if handle_rate_limit_error(error_str):
-            return None, None, "Rate Limit検出のため処理を中断しました"
-        
         return None, None, f"書籍情報の処理でエラーが発生しました: {error_str}"
 
-@client.event
+# ISBN処理のワーカー数の上限（メッセージをまたいで共有）
+isbn_workers = asyncio.Semaphore(ISBN_WORKERS)
+
+async def run_isbn_worker(isbn_record, message_author_id, book_infos=None, message_id=None, route=None):
+    """空いているワーカーで process_single_isbn を実行する"""
+    async with isbn_workers:
+        logger.debug(f"処理中: {isbn_record.raw}")
+        return await process_single_isbn(isbn_record, message_author_id, book_infos, message_id, route)
+
+def message_guild_id(message):
+    """メッセージのギルドID（DMならNone）。ギルドをキャッシュしない省メモリモードではチャンネルから取る"""
+    if message.guild is not None:
+        return message.guild.id
+    return getattr(message.channel, 'guild_id', None)
+
 async def on_ready():
     """Bot起動時の処理"""
     logger.info(f'{client.user} has landed!')
+    if SHARD_COUNT or SHARD_IDS:
+        logger.info(f"担当シャード: {SHARD_IDS or '全て'} / 全{client.shard_count}シャード")
     health_status['bot_connected'] = True
+    services.mark_ready('discord')
+
+async def on_disconnect():
+    """Discordとの接続が切れたとき（discord.pyが自動で再接続する）"""
+    health_status['bot_connected'] = False
+    services.mark_ready('discord', False, 'disconnected')
+
+async def handle_bulk_import(message, route):
+    """添付ファイルのISBNをまとめて発注依頼する
+
+    ファイルはダウンロードしながら1行ずつ解析し、MAX_ISBNS_PER_REQUEST件ごとの
+    まとまりで書籍情報を並行して問い合わせる。注文はファイルの順に注文キューへ記録し、
+    append_rowsでまとめて書き込む。進捗は1つのメッセージを書き換えて表示する。
+    """
+    attachments = [attachment for attachment in message.attachments if is_import_attachment(attachment)]
+    if not attachments:
+        await safe_reply(message, f"CSVまたはテキストファイルを添付して `{BULK_IMPORT_COMMAND}` と送信してください")
+        return
+    
+    progress = ImportProgress([attachment.filename for attachment in attachments])
+    status_message = await reply_sender.reply(message, progress.format_progress())
+    last_progress = time.monotonic()
+    seen_isbns = set()
+    batch = []
+    lookups = deque()  # 問い合わせ中のまとまり（ファイルの順）
+    failure = None
+    
+    async def lookup(records):
+        return records, await lookup_book_infos([record.isbn13 for record in records])
+    
+    async def write_next():
+        nonlocal last_progress
+        records, book_infos = await lookups.popleft()
+        for record in records:
+            progress.record(*await process_single_isbn(record, message.author.id, book_infos, message.id, route))
+        if status_message is not None and time.monotonic() - last_progress >= BULK_IMPORT_PROGRESS_SECONDS:
+            last_progress = time.monotonic()
+            await reply_sender.edit(status_message, progress.format_progress())
+    
+    try:
+        async with aiohttp.ClientSession() as session:
+            for attachment in attachments:
+                # 途中で打ち切ってもダウンロードの接続をすぐに閉じる
+                async with aclosing(iter_attachment_lines(session, attachment.url, BULK_IMPORT_MAX_BYTES)) as lines:
+                    async for line in lines:
+                        progress.lines += 1
+                        # 1行に何件あってもよいが、1行から取り出す候補は取り込み全体の上限件数まで
+                        candidates = list(iter_isbn_candidates(line, limit=BULK_IMPORT_MAX_ISBNS))
+                        for record in resolve_isbns(candidates):
+                            if record is None:
+                                progress.invalid += 1
+                            elif record.isbn13 in seen_isbns:
+                                progress.duplicates += 1
+                            elif len(seen_isbns) >= BULK_IMPORT_MAX_ISBNS:
+                                progress.truncated = True
+                                break
+                            else:
+                                seen_isbns.add(record.isbn13)
+                                progress.isbns += 1
+                                batch.append(record)
+                            
+                            if len(batch) >= MAX_ISBNS_PER_REQUEST:
+                                lookups.append(asyncio.create_task(lookup(batch)))
+                                batch = []
+                                if len(lookups) >= BULK_IMPORT_CONCURRENCY:
+                                    await write_next()
+                        if len(candidates) >= BULK_IMPORT_MAX_ISBNS:
+                            # 上限で打ち切った候補の続きは読まない
+                            progress.truncated = True
+                        if progress.truncated:
+                            break
+                if progress.truncated:
+                    break
+        
+        if batch:
+            lookups.append(asyncio.create_task(lookup(batch)))
+        while lookups:
+            await write_next()
+    except ImportTooLarge as e:
+        failure = str(e)
+        logger.warning(f"一括取り込みを中断: {failure}")
+    except Exception as e:
+        failure = f"取り込み中にエラーが発生しました: {e}"
+        logger.error(f"一括取り込みエラー: {e}")
+    finally:
+        for task in lookups:
+            task.cancel()
+    
+    sheet_write_error = None
+    if not await flush_before_reply(route):
+        sheet_write_error = route.buffer.last_error or "返信までに書き込みが終わりませんでした（バックグラウンドで継続）"
+    
+    logger.info(f"一括取り込み: {progress.lines}行 / ISBN {progress.isbns}件 / 発注 {progress.ordered + progress.without_info}件")
+    summary = progress.format_summary(sheet_write_error, failure)
+    if status_message is None or not await reply_sender.edit(status_message, summary):
+        await safe_reply(message, summary)
+
+def is_bulk_import_command(message):
+    return message.content.strip().lower().startswith(BULK_IMPORT_COMMAND.lower())
 
-@client.event
 async def on_message(message):
-    """メッセージ受信時の処理"""
-    if message.author == client.user or message.author.bot:
+    """メッセージ受信時の処理（Bot自身を含むBotの発言は無視）"""
+    if message.author.bot:
+        return
+    
+    # このメッセージの処理中に出るログ（並行処理のタスクを含む）に同じIDを付ける
+    set_correlation_id(f"msg-{message.id}")
+    
+    if is_bulk_import_command(message):
+        await handle_bulk_import(message, sheet_router.for_guild(message_guild_id(message)))
         return
 
-    # ISBN検出の正規表現パターン（より柔軟に、複数対応）
+    # ISBN候補を抽出し、解析・重複除去（候補数はメッセージごとに上限あり）
     # ISBN13: 978-4-09-290604-4, 978-4-759-40136-7, 979-10-12345-67-8 など
     # ISBN10: 4-09-290604-4, 0-123-45678-9, 1234567890 など
-    isbn_pattern = r'(?:ISBN[:\s-]*)?(?:979[:\s-]*\d{1,5}[:\s-]*\d{1,7}[:\s-]*\d{1,6}[:\s-]*[\dX]|978[:\s-]*\d{1,5}[:\s-]*\d{1,7}[:\s-]*\d{1,6}[:\s-]*[\dX]|\d{1,5}[:\s-]*\d{1,7}[:\s-]*\d{1,6}[:\s-]*[\dX]|\d{9,13}[\dX]?)'
+    message_started = time.perf_counter()
+    candidates = list(iter_isbn_candidates(message.content, limit=MAX_ISBN_CANDIDATES_PER_MESSAGE))
+    normalize_started = time.perf_counter()
+    ISBN_EXTRACT_SECONDS.observe(normalize_started - message_started)
+    
+    candidate_count = len(candidates)
+    seen_isbns = set()
+    unique_isbns = []
+    duplicate_count = 0
     
-    content = message.content
-    matches = re.findall(isbn_pattern, content, re.IGNORECASE)
+    for isbn_raw, record in zip(candidates, resolve_isbns(candidates)):
+        if record and record.isbn13 not in seen_isbns:
+            seen_isbns.add(record.isbn13)
+            unique_isbns.append(record)
+        elif record:
+            duplicate_count += 1
+            logger.debug(f"重複ISBN検出（スキップ）: {isbn_raw} -> {record.isbn13}")
     
-    if matches:
-        logger.info(f"ISBN候補検出（{len(matches)}件）: {matches}")
+    if candidate_count:
+        ISBN_NORMALIZE_SECONDS.observe(time.perf_counter() - normalize_started)
+        MESSAGES_TOTAL.inc()
+        logger.info(f"ISBN候補検出（{candidate_count}件）")
+        logger.debug(f"ISBN候補: {[record.raw for record in unique_isbns]}")
+        if candidate_count >= MAX_ISBN_CANDIDATES_PER_MESSAGE:
+            logger.warning(f"ISBN候補が上限（{MAX_ISBN_CANDIDATES_PER_MESSAGE}件）に達したため以降は無視します")
         
-        # 重複除去処理
-        seen_isbns = set()
-        unique_isbns = []
-        duplicate_count = 0
+        if duplicate_count > 0:
+            logger.info(f"重複除去: {len(unique_isbns) + duplicate_count}件 -> {len(unique_isbns)}件 ({duplicate_count}件の重複を除去)")
         
-        for isbn_raw in matches:
-            normalized = normalize_isbn_for_dedup(isbn_raw)
-            if normalized and normalized not in seen_isbns:
-                seen_isbns.add(normalized)
-                unique_isbns.append(isbn_raw)
-            elif normalized:
-                duplicate_count += 1
-                logger.info(f"重複ISBN検出（スキップ）: {isbn_raw} -> {normalized}")
+        # ギルドごとの書き込み先
+        route = sheet_router.for_guild(message_guild_id(message))
         
-        if duplicate_count > 0:
-            logger.info(f"重複除去: {len(matches)}件 -> {len(unique_isbns)}件 ({duplicate_count}件の重複を除去)")
+        # 書籍情報をまとめて取得（1回のリクエストで全ISBN分）
+        unique_isbn13s = [record.isbn13 for record in unique_isbns]
+        book_infos = await lookup_book_infos(unique_isbn13s) if unique_isbn13s else {}
         
         # 処理結果を保存するリスト
         successful_books = []
         books_without_info = []
         error_messages = []
         
-        # 各ISBNを個別に処理（重複除去後）
-        for isbn_raw in unique_isbns:
-            logger.info(f"処理中: {isbn_raw}")
-            
-            # Rate Limit状態をチェック
-            global RATE_LIMIT_DETECTED, RATE_LIMIT_START_TIME
-            if RATE_LIMIT_DETECTED:
-                logger.warning("Rate Limit検出中のため、処理をスキップします")
-                break
-            
-            # 単一ISBNを処理
-            result_title, result_url, error_msg = process_single_isbn(isbn_raw, message.author.id)
-            
+        # 各ISBNを並行して処理し（重複除去後）、結果は入力の順に並べる
+        results = await asyncio.gather(*(
+            run_isbn_worker(isbn_record, message.author.id, book_infos, message.id, route)
+            for isbn_record in unique_isbns
+        ))
+        
+        for result_title, result_url, error_msg in results:
             if result_title:
                 # 書籍情報が取得できた場合
                 successful_books.append(result_title)
+                ORDERS_TOTAL.inc(result='ordered')
             elif result_url:
                 # 書籍情報は取得できなかったがISBNは有効だった場合
                 books_without_info.append(result_url)
+                ORDERS_TOTAL.inc(result='ordered_without_info')
             elif error_msg:
                 error_messages.append(error_msg)
-                # エラーがRate Limit関連の場合は処理を中断
-                if "Rate Limit" in error_msg:
-                    break
-            
-            # 複数処理時は少し間隔を空ける
-            if len(unique_isbns) > 1:
-                time.sleep(2)
+                ORDERS_TOTAL.inc(result='error')
+        
+        # このメッセージ分の行をまとめて書き込む（失敗した行はバッファに残り再試行される）
+        sheet_write_error = None
+        if SHEET_FLUSH_PER_MESSAGE and not await flush_before_reply(route):
+            sheet_write_error = route.buffer.last_error or "返信までに書き込みが終わりませんでした（バックグラウンドで継続）"
+            pending = await asyncio.to_thread(route.queue.pending_count)
+            logger.warning(f"スプレッドシート書き込み失敗（{route.name}: {pending}行を再試行待ち）: {sheet_write_error}")
         
         # 結果に応じて返信メッセージを作成
         reply_parts = []
@@ -540,69 +837,184 @@ async def on_message(message):
                 url_list = '\n'.join([f"・{url}" for url in books_without_info])
                 reply_parts.append(f"以下の書籍も各2冊ずつ発注依頼しました！（書籍情報を取得できませんでした）\n{url_list}")
         
-        # 成功した処理があれば返信
+        if reply_parts and sheet_write_error:
+            reply_parts.append("※スプレッドシートへの書き込みが混み合っているため、記録は後ほど自動で再試行します")
+        
+        # エラーも同じ返信にまとめる（1メッセージにつきAPI呼び出しは1回）
+        if error_messages:
+            reply_parts.append("以下のISBNで問題が発生しました：\n" + '\n'.join([f"・{err}" for err in error_messages[:3]]))  # 最大3件まで表示
+        
         if reply_parts:
             reply_content = '\n\n'.join(reply_parts)
-            success = safe_reply(message, reply_content)
+            success = await safe_reply(message, reply_content)
             if not success:
                 total_books = len(successful_books) + len(books_without_info)
                 logger.warning(f"Reply failed but {total_books} orders processed successfully")
         
-        # エラーがある場合は追加でエラーメッセージを送信
-        if error_messages:
-            # Rate Limit以外のエラーのみ表示
-            non_rate_limit_errors = [err for err in error_messages if "Rate Limit" not in err]
-            if non_rate_limit_errors:
-                error_content = "以下のISBNで問題が発生しました：\n" + '\n'.join([f"・{err}" for err in non_rate_limit_errors[:3]])  # 最大3件まで表示
-                safe_reply(message, error_content)
+        MESSAGE_SECONDS.observe(time.perf_counter() - message_started)
+
+# Sheets APIのクライアント（全ての書き込み先で接続とアクセストークンを共有。起動時に作る）
+sheets_api = None
+
+async def connect_route(route):
+    """スプレッドシートを開いて索引を読み込み、書き込みを開始する"""
+    if route.sheet is None:
+        route.bind(await sheets_api.open_worksheet(route.sheet_url))
+    if not await route.index.refresh():
+        raise RuntimeError("スプレッドシート索引を読み込めませんでした")
+    route.index.start()
+    route.buffer.start()
+
+async def connect_sheets():
+    """全ての書き込み先のスプレッドシートに並行して接続する（接続済みのものは飛ばす）"""
+    global sheets_api
+    if sheets_api is None:
+        credentials_json = os.environ.get('GOOGLE_CREDENTIALS_JSON')
+        if not credentials_json:
+            raise RuntimeError("Google認証情報が見つかりません")
+        sheets_api = SheetsClient.from_service_account_info(
+            json.loads(credentials_json),
+            max_connections=SHEETS_MAX_CONNECTIONS,
+            timeout=SHEETS_TIMEOUT,
+            coalesce_delay=SHEETS_COALESCE_SECONDS,
+        )
+    routes = [route for route in sheet_router.routes() if not route.index.loaded]
+    results = await asyncio.gather(*(connect_route(route) for route in routes), return_exceptions=True)
+    errors = [f"{route.name}: {result}" for route, result in zip(routes, results) if isinstance(result, Exception)]
+    if errors:
+        raise RuntimeError(', '.join(errors))
+
+async def connect_openbd():
+    """OpenBDへのKeep-Alive接続を開いておく"""
+    await asyncio.to_thread(warm_up_openbd, url=OPENBD_URL)
+
+# 起動時に並行して行う接続（Discordのログインとも並行）
+services = Services(timeout=STARTUP_TIMEOUT)
+services.add_check('sheets', connect_sheets)
+services.add_check('openbd', connect_openbd, required=False)
+services.mark_ready('discord', False)
+
+def create_client_options(lean=LEAN_CLIENT):
+    """Discordクライアントの設定
+
+    省メモリモードでは新しいメッセージの受信に必要なインテントだけを使い、
+    ギルド・チャンネル・メンバー・過去のメッセージをキャッシュしない。
+    ギルドは受信したメッセージのIDだけで扱う（message_guild_id）。
+    """
+    if not lean:
+        intents = discord.Intents.default()
+        intents.message_content = True
+        return {'intents': intents}
+    intents = discord.Intents.none()
+    intents.guild_messages = True
+    intents.dm_messages = True
+    intents.message_content = True
+    return {
+        'intents': intents,
+        'max_messages': None,
+        'member_cache_flags': discord.MemberCacheFlags.none(),
+        'chunk_guilds_at_startup': False,
+    }
+
+def create_client():
+    """Discordクライアントを作り、イベントを登録する（シャード設定があればAutoShardedClient）"""
+    options = create_client_options()
+    if SHARD_COUNT or SHARD_IDS:
+        if SHARD_IDS and not SHARD_COUNT:
+            raise RuntimeError("SHARD_IDS を指定する場合は SHARD_COUNT も設定してください")
+        new_client = discord.AutoShardedClient(shard_count=SHARD_COUNT, shard_ids=SHARD_IDS, **options)
+    else:
+        new_client = discord.Client(**options)
+    new_client.event(on_ready)
+    new_client.event(on_disconnect)
+    new_client.event(on_message)
+    return new_client
+
+async def run_bot(token):
+    """外部サービスへの接続とDiscordへのログインを並行して行い、Botを実行する
 
-def safe_discord_login():
+    スプレッドシートの準備ができるまでに受け付けた注文は注文キューに記録され、
+    準備ができてから書き込まれる。
+    """
+    global client
+    client = create_client()
+    startup = asyncio.create_task(services.connect())
+    try:
+        async with client:
+            await client.start(token)
+    finally:
+        startup.cancel()
+
+async def safe_discord_login():
     """安全なDiscordログイン"""
-    global RATE_LIMIT_DETECTED, RATE_LIMIT_START_TIME
-    
-    # Rate Limit状態をチェック
-    if RATE_LIMIT_DETECTED and RATE_LIMIT_START_TIME:
-        time_since_rate_limit = datetime.now() - RATE_LIMIT_START_TIME
-        
-        # 最低1時間は慎重モード
-        if time_since_rate_limit.total_seconds() < 3600:  # 1時間
-            logger.warning("Rate Limit後の慎重期間中。ゆっくりと接続します...")
-            time.sleep(30)  # 30秒追加待機
-    
     try:
         # ログイン試行
         logger.info("Discordへの接続を試行中...")
-        return client.run(os.environ['DISCORD_TOKEN'])
+        await run_bot(os.environ['DISCORD_TOKEN'])
     
     except Exception as e:
         error_str = str(e)
         
         # Rate Limitエラーかチェック
-        if handle_rate_limit_error(error_str):
+        if is_rate_limit_error(error_str):
+            await wait_after_login_rate_limit(error_str)
             # Rate Limit処理が完了したら、プロセスを終了
             logger.info("Rate Limit対策完了。プロセスを安全に終了します。")
-            exit(0)
         else:
             # 他のエラーの場合
             logger.error(f"Discord接続エラー: {error_str}")
             raise e
 
+def open_local_stores():
+    """注文キュー・書籍情報キャッシュ・共有の予算のファイルを開く（インポート時には開かない）
+
+    前回書き込み中だった注文はここで確認待ちになる。
+    """
+    for route in sheet_router.routes():
+        route.queue.open()
+    book_cache.open()
+    if quota_store is not None:
+        quota_store.open()
+
+async def serve():
+    """ヘルスチェックサーバーとBotを同じイベントループで実行する"""
+    await asyncio.to_thread(open_local_stores)
+    if DEBUG_TOKEN:
+        track_task_ages(asyncio.get_running_loop())
+    runner = await start_web_server()
+    try:
+        await safe_discord_login()
+    finally:
+        await runner.cleanup()
+        if sheets_api is not None:
+            await sheets_api.close()
+
+def configure_logging():
+    """ログの出力先を設定する（起動時に1回だけ呼ぶ。importしただけではルートロガーを変えない）"""
+    setup_logging(
+        level=LOG_LEVEL,
+        json_output=LOG_FORMAT != 'text',
+        file_path=LOG_FILE_PATH or None,
+        max_bytes=LOG_FILE_MAX_BYTES,
+        backup_count=LOG_FILE_BACKUPS,
+        debug_sample_rate=LOG_DEBUG_SAMPLE_RATE,
+        rate_limit_log_path=RATE_LIMIT_LOG_PATH or None,
+    )
+
 # メインの起動部分を修正
 if __name__ == "__main__":
+    configure_logging()
     try:
-        # Flaskサーバーを別スレッドで開始
-        threading.Thread(target=run_web, daemon=True).start()
-        
-        # 起動時の慎重チェック
-        logger.info("Discord Bot開始前の安全チェック...")
-        time.sleep(10)  # 10秒の初期待機
+        # 起動前の設定チェック（固定の待機はせず、足りない設定があればすぐに止める）
+        if not os.environ.get('DISCORD_TOKEN'):
+            raise RuntimeError("DISCORD_TOKEN が設定されていません")
         
-        # 安全なDiscordログイン
-        safe_discord_login()
+        # ヘルスチェックサーバーを開始し、安全にDiscordへログイン（スプレッドシート・OpenBDへの接続と並行）
+        asyncio.run(serve())
         
     except Exception as e:
         logger.error(f"起動エラー: {e}")
-        # エラー時は長時間待機してから終了
-        logger.info("エラー検出。60分待機後に終了します。")
-        time.sleep(3600)  # 60分待機
+        # 再起動が連続しすぎないよう少し待ってから終了（ログインの429は別途長時間待機済み）
+        logger.info(f"エラー検出。{STARTUP_RETRY_WAIT:.0f}秒待機後に終了します。")
+        time.sleep(STARTUP_RETRY_WAIT)
         exit(1)
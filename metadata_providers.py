@@ -0,0 +1,299 @@
+import asyncio
+import logging
+import re
+import time
+import xml.etree.ElementTree as ET
+from contextlib import contextmanager
+
+import metrics
+from openbd import OPENBD_GET_URL, fetch_openbd_chunk, get_session, OpenBDRateLimited
+
+logger = logging.getLogger(__name__)
+
+NDL_SEARCH_URL = "https://ndlsearch.ndl.go.jp/api/opensearch"
+NDL_NAMESPACES = {
+    'dc': 'http://purl.org/dc/elements/1.1/',
+    'dcndl': 'http://ndl.go.jp/dcndl/terms/',
+}
+
+METADATA_REQUEST_SECONDS = metrics.histogram(
+    'bookbot_metadata_request_seconds', '書籍情報プロバイダーへの問い合わせ1回の所要時間', labels=('provider', 'result'))
+
+NOT_FOUND = (None, None, None)
+
+class ProviderRateLimited(Exception):
+    """プロバイダーから429が返された（それまでに取得できた結果を保持）"""
+
+    def __init__(self, message, retry_after=None, results=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.results = results or {}
+
+class CircuitBreaker:
+    """連続で失敗・遅延したプロバイダーをしばらく使わない
+
+    failure_threshold 回続けて失敗するとopen（reset_timeout 秒間は呼ばない）。
+    時間が経つとhalf-openになり、試しに1回だけ呼んで成功すれば元に戻す。
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opened_count = 0
+
+    def allow(self):
+        if self.state == 'closed':
+            return True
+        now = time.monotonic()
+        if now - self.opened_at >= self.reset_timeout:
+            # 試しの1回だけ通す（その1回が答えを返さずに終わっても、次の reset_timeout 後にまた試す）
+            self.state = 'half_open'
+            self.opened_at = now
+            return True
+        return False
+
+    def record_success(self):
+        self.state = 'closed'
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == 'half_open' or self.failures >= self.failure_threshold:
+            if self.state != 'open':
+                self.opened_count += 1
+            self.state = 'open'
+            self.opened_at = time.monotonic()
+
+    def is_open(self):
+        """今は呼ばない状態か（allow と違って状態を変えない）"""
+        return self.state == 'open' and time.monotonic() - self.opened_at < self.reset_timeout
+
+    def status(self):
+        return {'state': self.state, 'failures': self.failures, 'opened': self.opened_count}
+
+class ProviderCall:
+    """1つのプロバイダーへの1回の問い合わせの途中経過
+
+    届いた結果は results に順に入るので、打ち切ってキャンセルしても取得済みの分を使える。
+    遅延の判定にはRate Limitの順番待ちを含めない、HTTPリクエスト1回の時間を使う。
+    """
+
+    def __init__(self):
+        self.results = {}
+        self._slowest = 0.0
+        self._in_flight = []
+
+    @contextmanager
+    def request(self):
+        """HTTPリクエスト1回の時間を計る（rate_limiter.acquire の後で使う）"""
+        started = time.perf_counter()
+        self._in_flight.append(started)
+        try:
+            yield
+        finally:
+            self._in_flight.remove(started)
+            self._slowest = max(self._slowest, time.perf_counter() - started)
+
+    def slowest(self):
+        """これまでで最も遅いリクエストの秒数（応答待ちのものを含む）"""
+        now = time.perf_counter()
+        return max([self._slowest] + [now - started for started in self._in_flight])
+
+class OpenBDProvider:
+    """OpenBD（1リクエストで最大100件）"""
+
+    name = 'openbd'
+
+    def __init__(self, rate_limiter, url=OPENBD_GET_URL, timeout=10):
+        self.rate_limiter = rate_limiter
+        self.url = url
+        self.timeout = timeout
+
+    async def fetch(self, isbns, call):
+        await self.rate_limiter.acquire(self.name)
+        try:
+            with call.request():
+                call.results.update(await asyncio.to_thread(fetch_openbd_chunk, isbns, self.timeout, self.url))
+        except OpenBDRateLimited as e:
+            raise ProviderRateLimited(str(e), e.retry_after)
+        return call.results
+
+def parse_ndl_price(text):
+    """「1,800円」「1800円+税」などから数字だけを取り出す"""
+    match = re.search(r'\d[\d,]*', text or '')
+    return match.group().replace(',', '') if match else None
+
+def parse_ndl_response(content):
+    """NDLサーチ OpenSearch（RSS）の最初の1件から (タイトル, 出版社, 価格) を取り出す"""
+    item = ET.fromstring(content).find('channel/item')
+    if item is None:
+        return NOT_FOUND
+    title = item.findtext('dc:title', namespaces=NDL_NAMESPACES) or item.findtext('title')
+    publisher = item.findtext('dc:publisher', namespaces=NDL_NAMESPACES)
+    price = parse_ndl_price(item.findtext('dcndl:price', namespaces=NDL_NAMESPACES))
+    if not title:
+        return NOT_FOUND
+    return title, publisher or '出版社不明', price
+
+class NDLSearchProvider:
+    """国立国会図書館サーチ（1リクエスト1件なので max_parallel 件ずつ並行して問い合わせる）"""
+
+    name = 'ndl'
+
+    def __init__(self, rate_limiter, url=NDL_SEARCH_URL, timeout=10, max_parallel=4):
+        self.rate_limiter = rate_limiter
+        self.url = url
+        self.timeout = timeout
+        self._parallel = asyncio.Semaphore(max_parallel)
+
+    def _get(self, isbn):
+        response = get_session().get(self.url, params={'isbn': isbn, 'cnt': 1}, timeout=self.timeout)
+        if response.status_code == 429:
+            retry_after = response.headers.get('Retry-After')
+            raise ProviderRateLimited(
+                f"NDL Search 429 Too Many Requests (retry_after={retry_after})",
+                float(retry_after) if retry_after and retry_after.isdigit() else None)
+        response.raise_for_status()
+        return parse_ndl_response(response.content)
+
+    async def _fetch_one(self, isbn, call):
+        async with self._parallel:
+            await self.rate_limiter.acquire(self.name)
+            with call.request():
+                call.results[isbn] = await asyncio.to_thread(self._get, isbn)
+
+    async def fetch(self, isbns, call):
+        outcomes = await asyncio.gather(*(self._fetch_one(isbn, call) for isbn in isbns), return_exceptions=True)
+        errors = [outcome for outcome in outcomes if isinstance(outcome, Exception)]
+        rate_limited = next((e for e in errors if isinstance(e, ProviderRateLimited)), None)
+        if rate_limited is not None:
+            raise ProviderRateLimited(str(rate_limited), rate_limited.retry_after, dict(call.results))
+        if errors and not call.results:
+            raise errors[0]
+        return call.results
+
+class MetadataLookup:
+    """複数のプロバイダーに問い合わせ、最初に揃った書籍情報を使う
+
+    - 先頭のプロバイダーが hedge_delay 秒以内に答えなければ、次のプロバイダーにも同時に問い合わせる
+    - 登録がない・エラーになったISBNは次のプロバイダーで引き直す（空欄の行を減らす）
+    - timeout 秒で打ち切り、それまでに揃った分だけ返す（残りの問い合わせはキャンセルする）
+    - 失敗や slow_call 秒を超える遅延が続いたプロバイダーはサーキットブレーカーで外す
+
+    戻り値は {isbn: (タイトル, 出版社, 価格)}。問い合わせられるプロバイダーがすべて「登録なし」と
+    答えたときだけ (None, None, None)、エラーやタイムアウトで分からなかったISBNは結果に含まれない。
+    """
+
+    def __init__(self, providers, hedge_delay=1.0, timeout=8.0, slow_call=5.0,
+                 failure_threshold=5, reset_timeout=30.0, on_rate_limit=None):
+        self.providers = providers
+        self.hedge_delay = hedge_delay
+        self.timeout = timeout
+        self.slow_call = slow_call
+        self.on_rate_limit = on_rate_limit  # 429のときに (プロバイダー名, 例外) で呼ぶコルーチン関数
+        self.breakers = {provider.name: CircuitBreaker(failure_threshold, reset_timeout) for provider in providers}
+
+    def status(self):
+        return {name: breaker.status() for name, breaker in self.breakers.items()}
+
+    async def _call(self, provider, isbns, call):
+        """1つのプロバイダーに問い合わせる（例外は送出せず、取得できた分を返す）"""
+        breaker = self.breakers[provider.name]
+        started = time.perf_counter()
+        try:
+            results = await provider.fetch(isbns, call)
+        except asyncio.CancelledError:
+            # 他のプロバイダーが先に答えた・打ち切った。遅すぎた場合だけ失敗として数える
+            if call.slowest() > self.slow_call:
+                breaker.record_failure()
+            raise
+        except ProviderRateLimited as e:
+            METADATA_REQUEST_SECONDS.observe(time.perf_counter() - started, provider=provider.name, result='rate_limited')
+            breaker.record_failure()
+            if self.on_rate_limit is not None:
+                await self.on_rate_limit(provider.name, e)
+            return e.results
+        except Exception as e:
+            METADATA_REQUEST_SECONDS.observe(time.perf_counter() - started, provider=provider.name, result='error')
+            breaker.record_failure()
+            logger.error(f"書籍情報の取得エラー（{provider.name}、{len(isbns)}件）: {e}")
+            return {}
+
+        METADATA_REQUEST_SECONDS.observe(time.perf_counter() - started, provider=provider.name, result='ok')
+        provider.rate_limiter.record_success(provider.name)
+        slowest = call.slowest()
+        if slowest > self.slow_call:
+            breaker.record_failure()
+            logger.warning(f"書籍情報の取得が遅延（{provider.name}、{slowest:.1f}秒）")
+        else:
+            breaker.record_success()
+        return results
+
+    def _answered_by_all(self, answered, launched):
+        """問い合わせられるプロバイダーがすべて「登録なし」と答えたか"""
+        return all(provider.name in answered
+                   for provider in self.providers
+                   if provider.name in launched or not self.breakers[provider.name].is_open())
+
+    async def lookup(self, isbns, deadline=None):
+        """deadline（イベントループの時刻）を渡せば、timeout 秒より前でもその時刻で打ち切る"""
+        isbns = list(dict.fromkeys(isbns))
+        found = {}
+        not_found_by = {}  # isbn -> 「登録なし」と答えたプロバイダー名
+        launched = set()
+        remaining_providers = iter(self.providers)
+        running = {}
+
+        def launch():
+            """まだ答えのないISBNを次に使えるプロバイダーに問い合わせる"""
+            wanted = [isbn for isbn in isbns if isbn not in found]
+            for provider in remaining_providers:
+                if self.breakers[provider.name].allow():
+                    call = ProviderCall()
+                    running[asyncio.create_task(self._call(provider, wanted, call))] = (provider, call)
+                    launched.add(provider.name)
+                    return True
+            return False
+
+        def record(provider, results):
+            for isbn, info in results.items():
+                if info[0] is not None:
+                    found.setdefault(isbn, tuple(info))
+                else:
+                    not_found_by.setdefault(isbn, set()).add(provider.name)
+
+        loop = asyncio.get_running_loop()
+        deadline = min(loop.time() + self.timeout, deadline if deadline is not None else float('inf'))
+        launch()
+        while running:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            done, _ = await asyncio.wait(running, timeout=min(self.hedge_delay, remaining),
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                launch()  # 遅いので次のプロバイダーにも問い合わせる
+                continue
+            for task in done:
+                provider, _ = running.pop(task)
+                record(provider, task.result())
+            if len(found) == len(isbns):
+                break
+            if not running:
+                launch()
+
+        for task, (provider, call) in running.items():
+            task.cancel()
+            record(provider, call.results)  # 打ち切った問い合わせでも、届いていた分は使う
+        if len(found) < len(isbns) and running:
+            logger.warning(f"書籍情報の取得を打ち切りました（未取得{len(isbns) - len(found)}件）")
+
+        # タイムアウトやエラーで答えなかったプロバイダーがあるISBNは「登録なし」にしない（次回引き直す）
+        results = dict(found)
+        for isbn, answered in not_found_by.items():
+            if isbn not in results and self._answered_by_all(answered, launched):
+                results[isbn] = NOT_FOUND
+        return results
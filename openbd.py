@@ -0,0 +1,69 @@
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+OPENBD_GET_URL = "https://api.openbd.jp/v1/get"
+MAX_ISBNS_PER_REQUEST = 100  # 1リクエストあたりのISBN数（URL長の上限対策）
+
+class OpenBDRateLimited(Exception):
+    """OpenBDから429が返された"""
+
+    def __init__(self, retry_after=None):
+        super().__init__(f"OpenBD 429 Too Many Requests (retry_after={retry_after})")
+        self.retry_after = retry_after
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """Keep-Alive接続を再利用する共有セッションを取得"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _session = session
+        return _session
+
+def warm_up(timeout=5, url=OPENBD_GET_URL):
+    """共有セッションを作り、OpenBDへのKeep-Alive接続を開いておく（起動時の接続確認）"""
+    response = get_session().head(url, timeout=timeout)
+    if response.status_code >= 500:
+        response.raise_for_status()
+    return response.status_code
+
+def parse_book_data(book_data):
+    """OpenBDのレスポンス1件から (タイトル, 出版社, 価格) を取り出す"""
+    if not book_data:
+        return None, None, None
+
+    title = book_data.get('summary', {}).get('title', 'タイトル不明')
+    publisher = book_data.get('summary', {}).get('publisher', '出版社不明')
+
+    # 価格情報の取得
+    price = None
+    if 'onix' in book_data and 'ProductSupply' in book_data['onix']:
+        supply_detail = book_data['onix']['ProductSupply'].get('SupplyDetail', {})
+        if 'Price' in supply_detail:
+            price_data = supply_detail['Price']
+            if isinstance(price_data, list) and len(price_data) > 0:
+                price = price_data[0].get('PriceAmount', None)
+            elif isinstance(price_data, dict):
+                price = price_data.get('PriceAmount', None)
+
+    return title, publisher, price
+
+def fetch_openbd_chunk(chunk, timeout=10, url=OPENBD_GET_URL):
+    """1リクエスト分（MAX_ISBNS_PER_REQUEST件まで）の書籍情報を取得（通信エラーは送出する）"""
+    response = get_session().get(url, params={'isbn': ','.join(chunk)}, timeout=timeout)
+    if response.status_code == 429:
+        retry_after = response.headers.get('Retry-After')
+        raise OpenBDRateLimited(float(retry_after) if retry_after and retry_after.isdigit() else None)
+    response.raise_for_status()
+    # レスポンスはリクエストしたISBNと同じ順序で返る
+    return {isbn: parse_book_data(book_data) for isbn, book_data in zip(chunk, response.json() or [])}
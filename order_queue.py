@@ -0,0 +1,240 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# 注文の状態
+STATUS_PENDING = 'pending'  # スプレッドシート未書き込み
+STATUS_SENDING = 'sending'  # 書き込み中（完了前に落ちた場合は再起動時にunconfirmedにする）
+STATUS_UNCONFIRMED = 'unconfirmed'  # 書き込み中に終了した・結果が分からない失敗（シートで確かめてから送り直す）
+STATUS_DONE = 'done'  # 書き込み済み
+
+class OrderQueue:
+    """受け付けた注文を記録する追記型のキュー（SQLite）
+
+    返信より前に記録し、バックグラウンドでスプレッドシートへ書き込む。
+    order_key（メッセージID:ISBN13）で同じ注文の二重登録を防ぐ。
+    merge_row のある注文は追記せず、シートのその行の冊数に加算する（重複注文の加算）。
+    ファイルは open() か最初の操作のときに開く（作るだけではファイルに触れない）。
+    """
+
+    def __init__(self, db_path=':memory:', keep_done_seconds=7 * 24 * 3600):
+        self.db_path = db_path
+        self.keep_done_seconds = keep_done_seconds
+        self._lock = threading.Lock()
+        self._open_lock = threading.Lock()
+        self._db = None
+
+    def open(self):
+        """DBを開き、前回書き込み中だった注文を確認待ちにする（2回目以降は何もしない）"""
+        with self._open_lock:
+            if self._db is not None:
+                return
+            db = sqlite3.connect(self.db_path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS orders ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "order_key TEXT UNIQUE, "
+                "row TEXT NOT NULL, "
+                "status TEXT NOT NULL, "
+                "attempts INTEGER NOT NULL DEFAULT 0, "
+                "created_at REAL NOT NULL, "
+                "updated_at REAL NOT NULL, "
+                "merge_row INTEGER, "
+                "merge_quantity INTEGER)"
+            )
+            columns = {column[1] for column in db.execute("PRAGMA table_info(orders)")}
+            for column in ('merge_row', 'merge_quantity'):
+                if column not in columns:
+                    # 加算の列がない以前のファイル
+                    db.execute(f"ALTER TABLE orders ADD COLUMN {column} INTEGER")
+            db.execute("CREATE INDEX IF NOT EXISTS orders_status ON orders (status, id)")
+            db.commit()
+            self._recover(db)
+            self._db = db
+
+    def _connection(self):
+        if self._db is None:
+            self.open()
+        return self._db
+
+    def _recover(self, db):
+        """前回書き込み中のまま終了した注文を確認待ちにする
+
+        append_rowsは成功していて書き込み済みにする前に終了した可能性があるので、
+        シートに書かれていないことを確かめるまで送り直さない（resolve_unconfirmed）。
+        """
+        cursor = db.execute(
+            "UPDATE orders SET status = ?, updated_at = ? WHERE status = ?",
+            (STATUS_UNCONFIRMED, time.time(), STATUS_SENDING),
+        )
+        db.commit()
+        if cursor.rowcount:
+            logger.warning(f"書き込み中だった注文{cursor.rowcount}件をシートで確認してから再送します")
+        pending = db.execute("SELECT COUNT(*) FROM orders WHERE status != ?", (STATUS_DONE,)).fetchone()[0]
+        if pending:
+            logger.info(f"未書き込みの注文{pending}件を再開します")
+
+    def enqueue(self, order_key, row, merge_row=None):
+        """注文を記録する。新規ならTrue、同じorder_keyが既にあればFalse
+
+        merge_row を指定すると、シートのその行の冊数に row の冊数を加算する注文になる。
+        """
+        db = self._connection()
+        now = time.time()
+        with self._lock:
+            cursor = db.execute(
+                "INSERT OR IGNORE INTO orders (order_key, row, status, created_at, updated_at, merge_row) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (order_key, json.dumps(row, ensure_ascii=False), STATUS_PENDING, now, now, merge_row),
+            )
+            db.commit()
+        return cursor.rowcount == 1
+
+    def claim(self, limit):
+        """未書き込みの注文（追記するもの）を古い順に取り出して書き込み中にする。[(id, row)] を返す"""
+        db = self._connection()
+        with self._lock:
+            rows = db.execute(
+                "SELECT id, row FROM orders WHERE status = ? AND merge_row IS NULL ORDER BY id LIMIT ?",
+                (STATUS_PENDING, limit),
+            ).fetchall()
+            if rows:
+                db.executemany(
+                    "UPDATE orders SET status = ?, attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                    [(STATUS_SENDING, time.time(), order_id) for order_id, _ in rows],
+                )
+                db.commit()
+        return [(order_id, json.loads(row)) for order_id, row in rows]
+
+    def mark_done(self, order_ids):
+        """書き込み済みにし、古い書き込み済みの注文を削除"""
+        db = self._connection()
+        now = time.time()
+        with self._lock:
+            db.executemany(
+                "UPDATE orders SET status = ?, updated_at = ? WHERE id = ?",
+                [(STATUS_DONE, now, order_id) for order_id in order_ids],
+            )
+            db.execute(
+                "DELETE FROM orders WHERE status = ? AND updated_at < ?",
+                (STATUS_DONE, now - self.keep_done_seconds),
+            )
+            db.commit()
+
+    def claim_merges(self, limit):
+        """未書き込みの加算を古い順に取り出して書き込み中にする
+
+        [(id, row, 加算先の行番号, 書き込む冊数)] を返す。書き込む冊数は一度書き込もうとした
+        ときに記録した値（まだならNone）。
+        """
+        db = self._connection()
+        with self._lock:
+            rows = db.execute(
+                "SELECT id, row, merge_row, merge_quantity FROM orders "
+                "WHERE status = ? AND merge_row IS NOT NULL ORDER BY id LIMIT ?",
+                (STATUS_PENDING, limit),
+            ).fetchall()
+            if rows:
+                db.executemany(
+                    "UPDATE orders SET status = ?, attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                    [(STATUS_SENDING, time.time(), order_id) for order_id, _, _, _ in rows],
+                )
+                db.commit()
+        return [(order_id, json.loads(row), merge_row, merge_quantity)
+                for order_id, row, merge_row, merge_quantity in rows]
+
+    def set_merge_quantity(self, order_id, quantity):
+        """加算後の冊数を記録する（書き込みが失敗しても、再試行では同じ値を書くので二重に加算しない）"""
+        db = self._connection()
+        with self._lock:
+            db.execute(
+                "UPDATE orders SET merge_quantity = ?, updated_at = ? WHERE id = ?",
+                (quantity, time.time(), order_id),
+            )
+            db.commit()
+
+    def unmerge(self, order_ids):
+        """加算先の行がなくなった加算を、通常の注文（追記）として未書き込みに戻す"""
+        db = self._connection()
+        with self._lock:
+            db.executemany(
+                "UPDATE orders SET status = ?, merge_row = NULL, merge_quantity = NULL, updated_at = ? WHERE id = ?",
+                [(STATUS_PENDING, time.time(), order_id) for order_id in order_ids],
+            )
+            db.commit()
+
+    def update_pending(self, match, update):
+        """未書き込みの注文のうち match(row) が真になる最新の1件を update(row) の結果に書き換える
+
+        書き込み中（claim済み）の注文と加算は対象にしない。書き換えたらTrueを返す。
+        """
+        db = self._connection()
+        with self._lock:
+            rows = db.execute(
+                "SELECT id, row FROM orders WHERE status = ? AND merge_row IS NULL ORDER BY id DESC",
+                (STATUS_PENDING,),
+            ).fetchall()
+            for order_id, row in rows:
+                row = json.loads(row)
+                if match(row):
+                    db.execute(
+                        "UPDATE orders SET row = ?, updated_at = ? WHERE id = ?",
+                        (json.dumps(update(row), ensure_ascii=False), time.time(), order_id),
+                    )
+                    db.commit()
+                    return True
+        return False
+
+    def unconfirmed(self):
+        """確認待ちの注文を [(id, order_key)] で返す"""
+        db = self._connection()
+        with self._lock:
+            return db.execute(
+                "SELECT id, order_key FROM orders WHERE status = ? ORDER BY id", (STATUS_UNCONFIRMED,)
+            ).fetchall()
+
+    def resolve_unconfirmed(self, done_ids, retry_ids):
+        """確認待ちの注文を、シートにあったものは書き込み済み、なかったものは未書き込みにする"""
+        db = self._connection()
+        now = time.time()
+        with self._lock:
+            db.executemany(
+                "UPDATE orders SET status = ?, updated_at = ? WHERE id = ?",
+                [(STATUS_DONE, now, order_id) for order_id in done_ids]
+                + [(STATUS_PENDING, now, order_id) for order_id in retry_ids],
+            )
+            db.commit()
+
+    def mark_unconfirmed(self, order_ids):
+        """書き込まれたか分からない失敗（タイムアウトなど）の注文を確認待ちにする"""
+        db = self._connection()
+        with self._lock:
+            db.executemany(
+                "UPDATE orders SET status = ?, updated_at = ? WHERE id = ?",
+                [(STATUS_UNCONFIRMED, time.time(), order_id) for order_id in order_ids],
+            )
+            db.commit()
+
+    def release(self, order_ids):
+        """書き込まれなかった（APIに拒否された）注文を未書き込みに戻す"""
+        db = self._connection()
+        with self._lock:
+            db.executemany(
+                "UPDATE orders SET status = ?, updated_at = ? WHERE id = ?",
+                [(STATUS_PENDING, time.time(), order_id) for order_id in order_ids],
+            )
+            db.commit()
+
+    def pending_count(self):
+        """未書き込みの注文数"""
+        db = self._connection()
+        with self._lock:
+            return db.execute(
+                "SELECT COUNT(*) FROM orders WHERE status != ?", (STATUS_DONE,)
+            ).fetchone()[0]
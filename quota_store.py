@@ -0,0 +1,101 @@
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class SQLiteQuotaStore:
+    """複数プロセスで共有するトークンバケットの状態（SQLite）
+
+    シャーディングで複数プロセスを動かすとき、Google SheetsやOpenBDの予算を
+    プロセス間で分け合うために使う。BEGIN IMMEDIATE でファイルロックを取って
+    読み書きするので、同じファイルを開いた全プロセスで1つの予算になる。
+
+    RateLimitScheduler に渡すストアは take / block / peek の3つを持てばよく、
+    Redisなど別の共有先に差し替えられる。時刻はプロセス間で比較できる time.time() を使う。
+    ファイルは open() か最初の操作のときに開く（作るだけではファイルに触れない）。
+    """
+
+    def __init__(self, db_path, busy_timeout=30.0):
+        self.db_path = db_path
+        self.busy_timeout = busy_timeout
+        self._lock = threading.Lock()
+        self._open_lock = threading.Lock()
+        self._db = None
+
+    def open(self):
+        """DBを開く（2回目以降は何もしない）"""
+        with self._open_lock:
+            if self._db is not None:
+                return
+            db = sqlite3.connect(self.db_path, timeout=self.busy_timeout, isolation_level=None, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                "name TEXT PRIMARY KEY, "
+                "tokens REAL NOT NULL, "
+                "updated_at REAL NOT NULL, "
+                "blocked_until REAL NOT NULL DEFAULT 0)"
+            )
+            self._db = db
+
+    def _connection(self):
+        if self._db is None:
+            self.open()
+        return self._db
+
+    def _load(self, name, capacity, now):
+        row = self._connection().execute(
+            "SELECT tokens, updated_at, blocked_until FROM buckets WHERE name = ?", (name,)
+        ).fetchone()
+        return row if row is not None else (float(capacity), now, 0.0)
+
+    def _save(self, name, tokens, updated_at, blocked_until):
+        self._connection().execute(
+            "INSERT OR REPLACE INTO buckets (name, tokens, updated_at, blocked_until) VALUES (?, ?, ?, ?)",
+            (name, tokens, updated_at, blocked_until),
+        )
+
+    def _transaction(self, func):
+        db = self._connection()
+        with self._lock:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                result = func(time.time())
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+            return result
+
+    def take(self, name, rate, capacity, tokens=1):
+        """トークンを取得する。取得できたら0、できなければ次に試すまでの待機秒数を返す"""
+        def take_tokens(now):
+            available, updated_at, blocked_until = self._load(name, capacity, now)
+            if now < blocked_until:
+                return blocked_until - now
+            available = min(capacity, available + max(0.0, now - updated_at) * rate)
+            if available >= tokens:
+                self._save(name, available - tokens, now, blocked_until)
+                return 0.0
+            self._save(name, available, now, blocked_until)
+            return (tokens - available) / rate
+
+        return self._transaction(take_tokens)
+
+    def block(self, name, seconds):
+        """429を受けたので全プロセスでseconds秒停止する"""
+        def block_bucket(now):
+            _, _, blocked_until = self._load(name, 0.0, now)
+            self._save(name, 0.0, now, max(blocked_until, now + seconds))
+
+        self._transaction(block_bucket)
+
+    def peek(self, name, rate, capacity):
+        """(現在のトークン数, 停止解除までの秒数) を返す"""
+        now = time.time()
+        with self._lock:
+            available, updated_at, blocked_until = self._load(name, capacity, now)
+        available = min(capacity, available + max(0.0, now - updated_at) * rate)
+        return available, max(0.0, blocked_until - now)
@@ -0,0 +1,134 @@
+"""外部APIごとのRate Limit管理（非同期トークンバケット）
+
+Discord・Google Sheets・OpenBD それぞれに独立した予算を持たせ、
+あるAPIで429が返っても他のAPIの処理は止めない。待機はイベントループ上の
+asyncio.sleep で行い、順番待ちの処理は捨てずにFIFOで実行する。
+共有ストア（quota_store.SQLiteQuotaStore など）を渡したAPIは、予算と停止状態を
+同じストアを使う全プロセスで共有する。
+"""
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+class TokenBucket:
+    """1つのAPI用のトークンバケット"""
+
+    def __init__(self, name, rate, capacity, min_backoff=5.0, max_backoff=600.0, store=None):
+        self.name = name
+        self.store = store  # プロセス間で共有する予算（Noneならこのプロセスだけ）
+        self.rate = rate  # 1秒あたりに補充されるトークン数
+        self.capacity = capacity
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.blocked_until = 0.0
+        self.waiting = 0
+        self.rate_limit_events = 0
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._streak = 0
+        self._lock = asyncio.Lock()  # 待機中の処理を到着順に並べる
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, tokens=1):
+        """トークンを取得できるまで待つ（Rate Limit中は解除まで待つ）"""
+        tokens = min(tokens, self.capacity)
+        self.waiting += 1
+        try:
+            async with self._lock:
+                while True:
+                    if self.store is not None:
+                        wait = await asyncio.to_thread(self.store.take, self.name, self.rate, self.capacity, tokens)
+                        if wait <= 0:
+                            return
+                        await asyncio.sleep(wait)
+                        continue
+                    now = time.monotonic()
+                    if now < self.blocked_until:
+                        await asyncio.sleep(self.blocked_until - now)
+                        continue
+                    self._refill(now)
+                    if self._tokens >= tokens:
+                        self._tokens -= tokens
+                        return
+                    await asyncio.sleep((tokens - self._tokens) / self.rate)
+        finally:
+            self.waiting -= 1
+
+    async def penalize(self, retry_after=None):
+        """429を受けたときに一時停止する。待機秒数を返す
+
+        retry_afterが指定されていればそれに従い、なければ連続回数に応じて指数的に延ばす。
+        共有ストアへの記録はファイルロックを待つことがあるのでスレッドで行う。
+        """
+        if retry_after:
+            wait = float(retry_after)
+        else:
+            wait = min(self.min_backoff * (2 ** self._streak), self.max_backoff)
+        self._streak += 1
+        self.rate_limit_events += 1
+        now = time.monotonic()
+        self.blocked_until = max(self.blocked_until, now + wait)
+        self._tokens = 0.0
+        self._updated = now
+        if self.store is not None:
+            await asyncio.to_thread(self.store.block, self.name, wait)
+        return wait
+
+    def blocked_seconds(self):
+        """このプロセスが受けた429による停止の残り秒数（待たずに分かる値だけを見る）"""
+        return max(0.0, self.blocked_until - time.monotonic())
+
+    def record_success(self):
+        """成功したら連続429の回数をリセット"""
+        self._streak = 0
+
+    def status(self):
+        """現在の状態（バケットは書き換えない。共有ストアを読むので、イベントループではなくスレッドで呼ぶ）"""
+        now = time.monotonic()
+        tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        blocked_seconds = max(0.0, self.blocked_until - now)
+        if self.store is not None:
+            tokens, blocked_seconds = self.store.peek(self.name, self.rate, self.capacity)
+        return {
+            'tokens': round(tokens, 2),
+            'waiting': self.waiting,
+            'blocked_seconds': round(blocked_seconds, 1),
+            'rate_limit_events': self.rate_limit_events,
+            'shared': self.store is not None,
+        }
+
+class RateLimitScheduler:
+    """API名ごとのトークンバケットをまとめて管理"""
+
+    def __init__(self, limits, store=None, shared=()):
+        # limits: {API名: (rate, capacity)}、shared: storeで予算を共有するAPI名
+        self.buckets = {
+            name: TokenBucket(name, rate, capacity, store=store if name in shared else None)
+            for name, (rate, capacity) in limits.items()
+        }
+
+    def bucket(self, name):
+        return self.buckets[name]
+
+    async def acquire(self, name, tokens=1):
+        await self.buckets[name].acquire(tokens)
+
+    async def penalize(self, name, retry_after=None):
+        wait = await self.buckets[name].penalize(retry_after)
+        logger.warning(f"Rate Limit: {name} を{wait:.0f}秒間停止（他のAPIは継続）")
+        return wait
+
+    def blocked_seconds(self, name):
+        return self.buckets[name].blocked_seconds()
+
+    def record_success(self, name):
+        self.buckets[name].record_success()
+
+    def status(self):
+        """全APIの状態（共有ストアを読むので、イベントループではなくスレッドで呼ぶ）"""
+        return {name: bucket.status() for name, bucket in self.buckets.items()}
@@ -0,0 +1,108 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+DISCORD_MESSAGE_LIMIT = 2000  # Discordの1メッセージの最大文字数
+
+_FAILED = object()  # 送信失敗（成功時の戻り値がNoneでも区別できるように）
+
+def split_message(content, limit=DISCORD_MESSAGE_LIMIT):
+    """長い返信を行単位でlimit文字以内に分割する"""
+    if len(content) <= limit:
+        return [content]
+
+    chunks = []
+    current = ''
+    for line in content.split('\n'):
+        while len(line) > limit:
+            if current:
+                chunks.append(current)
+                current = ''
+            chunks.append(line[:limit])
+            line = line[limit:]
+        candidate = f"{current}\n{line}" if current else line
+        if len(candidate) > limit:
+            chunks.append(current)
+            current = line
+        else:
+            current = candidate
+    if current:
+        chunks.append(current)
+    return chunks
+
+def _retry_after(error):
+    """例外からDiscord指定の待機秒数を取り出す"""
+    retry_after = getattr(error, 'retry_after', None)
+    if retry_after:
+        return float(retry_after)
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        return float(headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+class ReplySender:
+    """返信をawaitして送り、失敗時はエラー内容に応じて再試行する
+
+    429の場合はDiscordが返したretry_afterに従って 'discord' の予算だけを止め、
+    5xxは短く待って再試行、それ以外の4xx（権限不足など）は再試行しない。
+    """
+
+    def __init__(self, rate_limiter, max_retries=3, server_error_wait=1.0, on_rate_limit=None):
+        self.rate_limiter = rate_limiter
+        self.max_retries = max_retries
+        self.server_error_wait = server_error_wait
+        self.on_rate_limit = on_rate_limit  # 429のときに (エラー内容, retry_after) で呼ぶコルーチン関数
+        self.sent = 0
+        self.failed = 0
+
+    async def send(self, message, content):
+        """返信を送信する。全て送れたらTrueを返す"""
+        for chunk in split_message(content):
+            if await self._call(lambda: message.reply(chunk)) is _FAILED:
+                self.failed += 1
+                return False
+        self.sent += 1
+        return True
+
+    async def reply(self, message, content):
+        """1通だけ返信し、送信したメッセージを返す（失敗したらNone）。後から edit で書き換える進捗表示用"""
+        sent = await self._call(lambda: message.reply(content[:DISCORD_MESSAGE_LIMIT]))
+        return None if sent is _FAILED else sent
+
+    async def edit(self, sent_message, content):
+        """送信済みのメッセージを書き換える。成功したらTrueを返す"""
+        return await self._call(lambda: sent_message.edit(content=content[:DISCORD_MESSAGE_LIMIT])) is not _FAILED
+
+    async def _call(self, request):
+        """Discord APIを呼び出す（requestはコルーチンを返す関数）。失敗したら _FAILED を返す"""
+        for attempt in range(self.max_retries):
+            await self.rate_limiter.acquire('discord')
+            try:
+                result = await request()
+                self.rate_limiter.record_success('discord')
+                if attempt:
+                    logger.info(f"返信成功 (試行 {attempt + 1})")
+                return result
+            except Exception as e:
+                status = getattr(e, 'status', None)
+                logger.warning(f"返信試行 {attempt + 1}/{self.max_retries} 失敗: {e}")
+
+                if status == 429:
+                    # Discordの予算を止め、次の acquire で解除まで待つ
+                    retry_after = _retry_after(e)
+                    if self.on_rate_limit is not None:
+                        await self.on_rate_limit(f"429 {e}", retry_after)
+                    else:
+                        await self.rate_limiter.penalize('discord', retry_after)
+                elif status is not None and status >= 500:
+                    await asyncio.sleep(self.server_error_wait * (2 ** attempt))
+                else:
+                    # 権限不足・メッセージ削除済みなどは再試行しても成功しない
+                    logger.error(f"返信エラー（再試行しません）: {e}")
+                    return _FAILED
+
+        logger.error("返信最終試行失敗")
+        return _FAILED
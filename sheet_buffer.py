@@ -0,0 +1,266 @@
+import asyncio
+import logging
+import time
+import metrics
+from sheet_index import ISBN13_COLUMN, QUANTITY_COLUMN, STATUS_COLUMN
+
+logger = logging.getLogger(__name__)
+
+SHEETS_APPEND_SECONDS = metrics.histogram(
+    'bookbot_sheets_append_seconds', 'Google Sheetsへのappend_rows 1回の所要時間', labels=('result',))
+SHEETS_APPENDED_ROWS = metrics.counter('bookbot_sheets_appended_rows_total', 'Google Sheetsに書き込んだ行数')
+
+def is_rejected(error):
+    """書き込まれていないことが確かな失敗か
+
+    4xx（429を含む）はAPIが受け付けなかったもの。タイムアウト・接続断・5xxは
+    書き込まれた可能性があるので含まない。
+    """
+    status = getattr(error, 'status', None)
+    return isinstance(status, int) and 400 <= status < 500
+
+class SheetWriteBuffer:
+    """注文キューの行をまとめてappend_rowsでGoogle Sheetsに書き込むワーカー（sheet は sheets_client.Worksheet）
+
+    行はまず OrderQueue に記録され、書き込みに成功するまでキューに残る。
+    再起動しても未書き込みの行は次の書き込みで送られる。書き込み中に終了した行や、
+    タイムアウトなど書き込まれたか分からない失敗の行は、order_key_column 列（行に含めた
+    注文キー）をシートで確かめ、なかったものだけを送り直す。
+
+    重複注文の加算（add_merge）も同じキューに記録し、書き込みのときにシートの行を
+    読み直して冊数を書き換える。行が別の注文に変わっていれば通常の注文として追記する。
+    """
+
+    def __init__(self, sheet, queue, flush_interval=5.0, max_rows=50,
+                 min_retry_wait=5.0, max_retry_wait=300.0, rate_limiter=None, on_error=None,
+                 on_written=None, max_append_rows=None, order_key_column=None,
+                 on_merged=None, on_merge_missed=None):
+        self.sheet = sheet
+        self.queue = queue
+        self.flush_interval = flush_interval
+        self.max_rows = max_rows  # 未書き込みがこの行数に達したらすぐ書き込む
+        self.max_append_rows = max_append_rows or max_rows  # 1回のappend_rowsで書き込む最大行数
+        self.min_retry_wait = min_retry_wait
+        self.max_retry_wait = max_retry_wait
+        self.rate_limiter = rate_limiter  # 'sheets' の予算が空くまで書き込みを待つ
+        self.on_error = on_error  # 書き込み失敗時に例外を渡して呼ぶコルーチン関数（Rate Limit判定など）
+        self.on_written = on_written  # 書き込み成功時に (行, append_rowsのレスポンス) で呼ぶ関数
+        self.order_key_column = order_key_column  # 注文キーを書く列（1始まり。Noneなら確認せずに送り直す）
+        self.on_merged = on_merged  # 加算を書き込んだときに (行, 行番号, 冊数) で呼ぶ関数
+        self.on_merge_missed = on_merge_missed  # 加算先の行が別の注文に変わっていたときに (行, 行番号) で呼ぶ関数
+        self.last_error = None
+        self.flush_count = 0
+        self._unflushed = 0
+        self._lock = asyncio.Lock()
+        self._task = None
+        self._queued_flush = None  # 書き込み中の処理の後に控えているバックグラウンドの書き込み
+        self._failures = 0
+        self._next_retry_at = 0.0
+
+    def __len__(self):
+        return self.queue.pending_count()
+
+    async def add(self, order_key, row):
+        """注文をキューに記録（上限に達したらバックグラウンドで書き込み）
+
+        同じorder_keyの注文が既にあれば記録せずFalseを返す。
+        """
+        added = await asyncio.to_thread(self.queue.enqueue, order_key, row)
+        if added:
+            self._unflushed += 1
+        if self._unflushed >= self.max_rows and self._task is not None:
+            self.flush_in_background()
+        return added
+
+    async def add_merge(self, order_key, row, row_number):
+        """シートの row_number 行目の冊数に row の冊数を加算する注文を記録する
+
+        書き込みはバックグラウンドで行うので、Sheetsが Rate Limit 中でも待たない。
+        同じorder_keyの注文が既にあれば記録せずFalseを返す。
+        """
+        added = await asyncio.to_thread(self.queue.enqueue, order_key, row, row_number)
+        if added:
+            self._unflushed += 1
+        if self._unflushed >= self.max_rows and self._task is not None:
+            self.flush_in_background()
+        return added
+
+    def flush_in_background(self):
+        """flush をバックグラウンドで実行するタスクを返す
+
+        まだ書き込みを始めていないタスクがあればそれを返す（そのタスクが
+        始めるときに、それまでに記録された行をまとめて書き込む）。
+        """
+        if self._queued_flush is None or self._queued_flush.done():
+            self._queued_flush = asyncio.create_task(self._flush_queued())
+        return self._queued_flush
+
+    async def _flush_queued(self):
+        async with self._lock:
+            self._queued_flush = None
+            return await self._flush_locked()
+
+    def start(self):
+        """定期書き込みタスクを開始（複数回呼ばれても1つだけ起動）"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        """一定間隔でキューを書き込み、失敗分を再試行"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                if time.monotonic() >= self._next_retry_at:
+                    await self.flush()
+            except Exception as e:
+                # ここで止まると以降の注文が書き込まれないので、記録して次の間隔で続ける
+                self.last_error = str(e)
+                logger.error(f"定期書き込みのエラー（{self.flush_interval:.0f}秒後に再試行）: {e}", exc_info=True)
+
+    async def flush(self):
+        """未書き込みの行を書き込む（1回のappend_rowsにmax_append_rows行まで）。成功したらTrueを返す
+
+        書き込み中に溜まった行は次のappend_rowsでまとめて送るので、
+        注文が多いほど1回あたりの行数が増え、API呼び出しは増えにくい。
+        """
+        async with self._lock:
+            return await self._flush_locked()
+
+    async def _confirm_unfinished(self):
+        """前回書き込み中に終了した注文のうち、注文キーがシートにあるものを書き込み済みにする"""
+        unconfirmed = await asyncio.to_thread(self.queue.unconfirmed)
+        if not unconfirmed:
+            return True
+
+        written = set()
+        if self.order_key_column is not None:
+            if self.rate_limiter is not None:
+                await self.rate_limiter.acquire('sheets')
+            try:
+                values = await self.sheet.get_all_values()
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"書き込み中だった注文の確認エラー（{len(unconfirmed)}件）: {e}")
+                if self.on_error is not None:
+                    await self.on_error(e)
+                return False
+            column = self.order_key_column - 1
+            written = {row[column] for row in values if len(row) > column and row[column]}
+
+        done_ids = [order_id for order_id, order_key in unconfirmed if order_key in written]
+        retry_ids = [order_id for order_id, order_key in unconfirmed if order_key not in written]
+        await asyncio.to_thread(self.queue.resolve_unconfirmed, done_ids, retry_ids)
+        logger.warning(f"書き込み中だった注文: シートにあった{len(done_ids)}件は書き込み済み、{len(retry_ids)}件を再送")
+        return True
+
+    async def _apply_merges(self):
+        """記録された加算を古い順に書き込む。全て書き込めたらTrueを返す
+
+        加算後の冊数は書き込む前にキューへ記録し、失敗して再試行するときは同じ値を書く
+        （書き込まれていた場合でも二重に加算しない）。
+        """
+        merges = await asyncio.to_thread(self.queue.claim_merges, self.max_append_rows)
+        for index, (order_id, row, row_number, quantity) in enumerate(merges):
+            try:
+                if quantity is None:
+                    if self.rate_limiter is not None:
+                        await self.rate_limiter.acquire('sheets')
+                    current = await self.sheet.get_row(row_number)
+                    if not _is_same_order(current, row):
+                        # 索引を読み込んだ後に行が動いた（並べ替え・削除）。通常の注文として追記する
+                        await asyncio.to_thread(self.queue.unmerge, [order_id])
+                        logger.warning(f"加算先の行{row_number}が{row[ISBN13_COLUMN - 1]}の注文ではなくなっていました（行を追加します）")
+                        if self.on_merge_missed is not None:
+                            self.on_merge_missed(row, row_number)
+                        continue
+                    quantity = _to_int(current[QUANTITY_COLUMN - 1]) + _to_int(row[QUANTITY_COLUMN - 1])
+                    await asyncio.to_thread(self.queue.set_merge_quantity, order_id, quantity)
+                if self.rate_limiter is not None:
+                    await self.rate_limiter.acquire('sheets')
+                await self.sheet.update_cell(row_number, QUANTITY_COLUMN, quantity)
+            except Exception as e:
+                # 残りの加算も順番を保つためにキューに戻す
+                await asyncio.to_thread(self.queue.release, [merge[0] for merge in merges[index:]])
+                self.last_error = str(e)
+                self._failures += 1
+                wait = min(self.min_retry_wait * (2 ** (self._failures - 1)), self.max_retry_wait)
+                self._next_retry_at = time.monotonic() + wait
+                logger.error(f"冊数の加算エラー（行{row_number}、{wait:.0f}秒後に再試行）: {e}")
+                if self.on_error is not None:
+                    await self.on_error(e)
+                return False
+
+            await asyncio.to_thread(self.queue.mark_done, [order_id])
+            if self.on_merged is not None:
+                self.on_merged(row, row_number, quantity)
+            if self.rate_limiter is not None:
+                self.rate_limiter.record_success('sheets')
+            logger.info(f"重複注文を既存行に加算: {row[ISBN13_COLUMN - 1]} 行{row_number} -> {quantity}冊")
+        return True
+
+    async def _flush_locked(self):
+        if self.sheet is None:
+            self.last_error = "スプレッドシートに未接続です"
+            return False
+
+        if not await self._confirm_unfinished():
+            return False
+
+        self._unflushed = 0
+        if not await self._apply_merges():
+            return False
+
+        while True:
+            claimed = await asyncio.to_thread(self.queue.claim, self.max_append_rows)
+            if not claimed:
+                return True
+
+            order_ids = [order_id for order_id, _ in claimed]
+            rows = [row for _, row in claimed]
+
+            if self.rate_limiter is not None:
+                await self.rate_limiter.acquire('sheets')
+            started = time.perf_counter()
+            try:
+                response = await self.sheet.append_rows(rows)
+            except Exception as e:
+                SHEETS_APPEND_SECONDS.observe(time.perf_counter() - started, result='error')
+                if is_rejected(e):
+                    # 書き込まれていないのでキューに戻して次回再試行
+                    await asyncio.to_thread(self.queue.release, order_ids)
+                else:
+                    # 書き込まれた可能性があるので、次回シートの注文キーを確かめてから送り直す
+                    await asyncio.to_thread(self.queue.mark_unconfirmed, order_ids)
+                self.last_error = str(e)
+                self._failures += 1
+                wait = min(self.min_retry_wait * (2 ** (self._failures - 1)), self.max_retry_wait)
+                self._next_retry_at = time.monotonic() + wait
+                logger.error(f"Google Sheetsまとめ書き込みエラー（{len(rows)}行、{wait:.0f}秒後に再試行）: {e}")
+                if self.on_error is not None:
+                    await self.on_error(e)
+                return False
+
+            SHEETS_APPEND_SECONDS.observe(time.perf_counter() - started, result='ok')
+            SHEETS_APPENDED_ROWS.inc(len(rows))
+            await asyncio.to_thread(self.queue.mark_done, order_ids)
+            if self.on_written is not None:
+                self.on_written(rows, response)
+            self.flush_count += 1
+            self.last_error = None
+            self._failures = 0
+            self._next_retry_at = 0.0
+            if self.rate_limiter is not None:
+                self.rate_limiter.record_success('sheets')
+            logger.info(f"Google Sheetにまとめて{len(rows)}行追加")
+
+def _is_same_order(sheet_row, row):
+    """シートの行が row と同じISBN13・ステータスの注文か（加算先が動いていないか）"""
+    return (len(sheet_row) >= STATUS_COLUMN
+            and str(sheet_row[ISBN13_COLUMN - 1]) == str(row[ISBN13_COLUMN - 1])
+            and sheet_row[STATUS_COLUMN - 1] == row[STATUS_COLUMN - 1])
+
+def _to_int(value):
+    try:
+        return int(value or 0)
+    except (TypeError, ValueError):
+        return 0
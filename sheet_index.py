@@ -0,0 +1,133 @@
+import asyncio
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# スプレッドシートの列（1始まり）
+ISBN13_COLUMN = 3  # C列: ISBN13
+QUANTITY_COLUMN = 7  # G列: 冊数
+STATUS_COLUMN = 8  # H列: ステータス
+ORDER_KEY_COLUMN = 11  # K列: 注文キー（メッセージID:ISBN13。再起動時の二重書き込み防止）
+
+_UPDATED_RANGE_RE = re.compile(r'![A-Z]+(\d+)(?::[A-Z]+(\d+))?$')
+
+class SheetIndex:
+    """スプレッドシートのISBN13列とステータス列のメモリ上の索引
+
+    起動時にget_all_valuesで一括読み込みし、以降は自分の追記で更新、
+    一定間隔で読み直す。重複チェックはAPIを呼ばずにO(1)で行える。
+    """
+
+    def __init__(self, sheet, refresh_interval=600.0):
+        self.sheet = sheet
+        self.refresh_interval = refresh_interval
+        self.loaded = False
+        self._rows = {}  # isbn13 -> [[行番号, ステータス, 冊数], ...]
+        self._pending = {}  # 注文キューに記録済みでまだ書き込まれていない isbn13 -> 件数
+        self._row_count = 0
+        self._lock = asyncio.Lock()
+        self._task = None
+        self._refresh_task = None
+
+    def __len__(self):
+        return self._row_count
+
+    def start(self):
+        """定期再読み込みタスクを開始（複数回呼ばれても1つだけ起動）"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await self.refresh()
+            await asyncio.sleep(self.refresh_interval)
+
+    def refresh_soon(self):
+        """索引が古いと分かったときに、定期の読み直しを待たずにバックグラウンドで読み直す"""
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self.refresh())
+
+    async def refresh(self):
+        """シート全体を1回のAPI呼び出しで読み込み、索引を作り直す"""
+        if self.sheet is None:
+            return False
+
+        async with self._lock:
+            try:
+                values = await self.sheet.get_all_values()
+            except Exception as e:
+                logger.error(f"スプレッドシート索引の読み込みエラー: {e}")
+                return False
+
+            rows = {}
+            for row_number, row in enumerate(values, start=1):
+                if len(row) < ISBN13_COLUMN or not row[ISBN13_COLUMN - 1]:
+                    continue
+                rows.setdefault(row[ISBN13_COLUMN - 1], []).append([
+                    row_number,
+                    row[STATUS_COLUMN - 1] if len(row) >= STATUS_COLUMN else '',
+                    _to_int(row[QUANTITY_COLUMN - 1]) if len(row) >= QUANTITY_COLUMN else 0,
+                ])
+
+            self._rows = rows
+            self._row_count = len(values)
+            self.loaded = True
+            logger.info(f"スプレッドシート索引を更新: {len(values)}行 / ISBN {len(rows)}種類")
+            return True
+
+    def find(self, isbn13, status=None):
+        """ISBN13の行を [[行番号, ステータス, 冊数], ...] で返す（statusを指定すれば絞り込み）"""
+        entries = self._rows.get(isbn13, [])
+        if status is None:
+            return list(entries)
+        return [entry for entry in entries if entry[1] == status]
+
+    def is_pending(self, isbn13):
+        """注文キューに記録済みでまだ書き込まれていない注文があるか"""
+        return self._pending.get(isbn13, 0) > 0
+
+    def record_pending(self, isbn13):
+        """注文キューへの記録を索引に反映する"""
+        self._pending[isbn13] = self._pending.get(isbn13, 0) + 1
+
+    def record_append(self, rows, response=None):
+        """自分で追記した行を索引に反映する
+
+        append_rowsのレスポンスに書き込み範囲があればその行番号を使い、
+        なければ読み込み済みの行数の続きとみなす。
+        """
+        first_row = _first_row_from_response(response) or self._row_count + 1
+        for offset, row in enumerate(rows):
+            isbn13 = str(row[ISBN13_COLUMN - 1])
+            if self._pending.get(isbn13, 0) > 1:
+                self._pending[isbn13] -= 1
+            else:
+                self._pending.pop(isbn13, None)
+            self._rows.setdefault(isbn13, []).append([
+                first_row + offset,
+                row[STATUS_COLUMN - 1],
+                _to_int(row[QUANTITY_COLUMN - 1]),
+            ])
+        self._row_count = max(self._row_count, first_row + len(rows) - 1)
+
+    def record_quantity(self, isbn13, row_number, quantity):
+        """冊数の更新を索引に反映する"""
+        for entry in self._rows.get(isbn13, []):
+            if entry[0] == row_number:
+                entry[2] = quantity
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+def _first_row_from_response(response):
+    """append_rowsのレスポンス（updates.updatedRange）から書き込み開始行を取り出す"""
+    try:
+        updated_range = response['updates']['updatedRange']
+    except (TypeError, KeyError):
+        return None
+    match = _UPDATED_RANGE_RE.search(updated_range)
+    return int(match.group(1)) if match else None
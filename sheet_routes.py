@@ -0,0 +1,77 @@
+import asyncio
+import json
+import logging
+import os
+import weakref
+
+logger = logging.getLogger(__name__)
+
+class SheetRoute:
+    """1つのスプレッドシートへの書き込み経路（注文キュー・索引・書き込みバッファ）
+
+    ギルドごとにスプレッドシートを分けると、経路ごとに別のキューとバッファで
+    書き込まれるので、忙しいサーバーの未書き込み分が他のサーバーの注文を待たせない。
+    """
+
+    def __init__(self, name, sheet_url, queue, index, buffer):
+        self.name = name
+        self.sheet_url = sheet_url
+        self.queue = queue
+        self.index = index
+        self.buffer = buffer
+        self.sheet = None
+        self._order_locks = weakref.WeakValueDictionary()  # isbn13 -> asyncio.Lock（使われなくなったら消える）
+
+    def order_lock(self, isbn13):
+        """同じISBNの重複チェックと注文の記録を1つずつ行うためのロック"""
+        lock = self._order_locks.get(isbn13)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._order_locks[isbn13] = lock
+        return lock
+
+    def bind(self, worksheet):
+        """開いたスプレッドシートを索引・書き込みバッファに設定する"""
+        self.sheet = worksheet
+        self.index.sheet = worksheet
+        self.buffer.sheet = worksheet
+
+class SheetRouter:
+    """ギルドIDから注文の書き込み先を選ぶ（指定のないギルドとDMは既定の経路）"""
+
+    def __init__(self, default_route, guild_routes=None):
+        self.default = default_route
+        self._guild_routes = dict(guild_routes or {})
+
+    def for_guild(self, guild_id):
+        if guild_id is None:
+            return self.default
+        return self._guild_routes.get(str(guild_id), self.default)
+
+    def routes(self):
+        """全ての経路（同じスプレッドシートを使うギルドは1つにまとめる）"""
+        unique = {id(self.default): self.default}
+        for route in self._guild_routes.values():
+            unique.setdefault(id(route), route)
+        return list(unique.values())
+
+def parse_guild_sheet_urls(value):
+    """GUILD_SHEET_URLS（{"ギルドID": "スプレッドシートURL"} のJSON）を読み込む"""
+    if not value:
+        return {}
+    try:
+        mapping = json.loads(value)
+    except ValueError as e:
+        logger.error(f"GUILD_SHEET_URLS を読み込めません（既定のスプレッドシートを使います）: {e}")
+        return {}
+    if not isinstance(mapping, dict):
+        logger.error("GUILD_SHEET_URLS はギルドIDをキーにしたオブジェクトで指定してください")
+        return {}
+    return {str(guild_id): url for guild_id, url in mapping.items() if url}
+
+def suffixed_path(path, suffix):
+    """ファイル名に接尾辞を付ける（/tmp/order_queue.sqlite3 -> /tmp/order_queue-suffix.sqlite3）"""
+    if not suffix or not path or path == ':memory:':
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}-{suffix}{ext}"
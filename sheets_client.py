@@ -0,0 +1,305 @@
+import asyncio
+import logging
+import re
+from abc import ABC, abstractmethod
+from datetime import datetime
+from urllib.parse import quote
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+SHEETS_API_URL = "https://sheets.googleapis.com/v4/spreadsheets"
+SHEETS_SCOPES = ["https://www.googleapis.com/auth/spreadsheets"]
+
+_SPREADSHEET_ID_RE = re.compile(r'/spreadsheets/d/([a-zA-Z0-9_-]+)')
+_UPDATED_RANGE_RE = re.compile(r'!([A-Z]+)(\d+)(?::([A-Z]+)(\d+))?$')
+
+class SheetsAPIError(Exception):
+    """Sheets APIがエラーを返した（メッセージはステータスコードから始まる）"""
+
+    def __init__(self, status, message, retry_after=None):
+        super().__init__(f"{status} {message}")
+        self.status = status
+        self.retry_after = retry_after  # Retry-Afterヘッダーの秒数（なければNone）
+
+def column_letter(column):
+    """列番号（1始まり）をA1形式の列名にする（1 -> A、27 -> AA）"""
+    letters = ''
+    while column > 0:
+        column, remainder = divmod(column - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
+
+def spreadsheet_id_from_url(sheet_url):
+    match = _SPREADSHEET_ID_RE.search(sheet_url or '')
+    if not match:
+        raise ValueError(f"スプレッドシートのURLではありません: {sheet_url}")
+    return match.group(1)
+
+class Worksheet(ABC):
+    """注文の書き込み先のワークシート（SheetWriteBuffer・SheetIndex・重複の加算が使う操作）
+
+    本番は SheetsClient.open_worksheet が返す ApiWorksheet、テストや負荷試験では
+    MemoryWorksheet などのサブクラスを使う。
+    """
+
+    title = 'Sheet1'
+
+    @abstractmethod
+    async def append_rows(self, rows):
+        """行を末尾に追加し、Sheets APIと同じ形のレスポンス（updates.updatedRange に書き込んだ範囲）を返す"""
+
+    @abstractmethod
+    async def get_all_values(self):
+        """全ての行を文字列のリストで返す"""
+
+    @abstractmethod
+    async def get_row(self, row):
+        """1行を文字列のリストで返す（空の行は []）"""
+
+    @abstractmethod
+    async def update_cell(self, row, col, value):
+        """1つのセルを書き換える"""
+
+class MemoryWorksheet(Worksheet):
+    """メモリ上のワークシート（認証情報なしで動かすとき用）"""
+
+    def __init__(self, rows=None, title='Sheet1'):
+        self.rows = [list(row) for row in rows or []]
+        self.title = title
+
+    async def append_rows(self, rows):
+        start = len(self.rows) + 1
+        self.rows.extend(list(row) for row in rows)
+        width = max((len(row) for row in rows), default=1)
+        return {'updates': {
+            'updatedRange': f"'{self.title}'!A{start}:{column_letter(width)}{len(self.rows)}",
+            'updatedRows': len(rows),
+        }}
+
+    async def get_all_values(self):
+        return [[str(value) for value in row] for row in self.rows]
+
+    async def get_row(self, row):
+        if row > len(self.rows):
+            return []
+        return [str(value) for value in self.rows[row - 1]]
+
+    async def update_cell(self, row, col, value):
+        while len(self.rows) < row:
+            self.rows.append([])
+        cells = self.rows[row - 1]
+        cells.extend([''] * (col - len(cells)))
+        cells[col - 1] = value
+
+class RequestCoalescer:
+    """短い間隔の間に来た呼び出しを1回のリクエストにまとめる
+
+    submit(item) は delay 秒待ってから、それまでに集まった item のリストで
+    send を1回呼び、send が返したリストから自分の分の結果を返す。
+    """
+
+    def __init__(self, send, delay=0.05):
+        self.send = send
+        self.delay = delay
+        self.requests = 0
+        self.items = 0
+        self._pending = []
+        self._task = None
+
+    async def submit(self, item):
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((item, future))
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_later())
+        return await future
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.delay)
+        pending, self._pending, self._task = self._pending, [], None
+        self.requests += 1
+        self.items += len(pending)
+        try:
+            results = await self.send([item for item, _ in pending])
+        except Exception as e:
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(pending, results):
+            if not future.done():
+                future.set_result(result)
+
+class ServiceAccountToken:
+    """サービスアカウントのアクセストークン（期限が近づいたらバックグラウンドで更新）
+
+    トークンの取得は google-auth で行う（HTTPは同期なのでスレッドで実行）。
+    リクエストの途中で更新を待たないよう、期限の refresh_margin 秒前に更新しておく。
+    """
+
+    def __init__(self, credentials_info, scopes=SHEETS_SCOPES, refresh_margin=300):
+        from google.oauth2 import service_account
+
+        self.credentials = service_account.Credentials.from_service_account_info(credentials_info, scopes=scopes)
+        self.refresh_margin = refresh_margin
+        self.refresh_count = 0
+        self._lock = asyncio.Lock()
+        self._task = None
+
+    def _expires_in(self):
+        expiry = self.credentials.expiry  # UTC（タイムゾーンなし）
+        if not self.credentials.token or expiry is None:
+            return 0.0
+        return (expiry - datetime.utcnow()).total_seconds()
+
+    async def refresh(self, force=False):
+        async with self._lock:
+            if not force and self._expires_in() > self.refresh_margin:
+                return
+            from google.auth.transport.requests import Request
+
+            await asyncio.to_thread(self.credentials.refresh, Request())
+            self.refresh_count += 1
+            logger.info(f"Google APIのアクセストークンを更新しました（有効期限 {self.credentials.expiry}）")
+
+    async def get(self):
+        """有効なアクセストークンを返す（期限切れ間近なら更新してから）"""
+        if self._expires_in() <= self.refresh_margin:
+            await self.refresh()
+        return self.credentials.token
+
+    def start(self):
+        """期限前に更新するタスクを開始（複数回呼ばれても1つだけ起動）"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+                wait = max(self._expires_in() - self.refresh_margin, 30.0)
+            except Exception as e:
+                wait = 30.0
+                logger.error(f"アクセストークンの更新エラー（{wait:.0f}秒後に再試行）: {e}")
+            await asyncio.sleep(wait)
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+class SheetsClient:
+    """Sheets API v4 の非同期クライアント
+
+    全てのワークシートで1つのKeep-Aliveの接続プールを共有する。
+    """
+
+    def __init__(self, token, max_connections=4, timeout=30.0, coalesce_delay=0.05, api_url=SHEETS_API_URL):
+        self.token = token
+        self.api_url = api_url
+        self.coalesce_delay = coalesce_delay
+        self.requests = 0
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=max_connections, keepalive_timeout=60),
+            timeout=aiohttp.ClientTimeout(total=timeout),
+        )
+
+    @classmethod
+    def from_service_account_info(cls, credentials_info, **kwargs):
+        """サービスアカウントの認証情報（dict）から作る。トークンの自動更新も開始する"""
+        token = ServiceAccountToken(credentials_info)
+        token.start()
+        return cls(token, **kwargs)
+
+    async def close(self):
+        self.token.stop()
+        await self._session.close()
+
+    async def request(self, method, path, params=None, json=None):
+        """APIを呼び出してJSONを返す（401なら1度だけトークンを更新して再試行）"""
+        for attempt in range(2):
+            headers = {'Authorization': f"Bearer {await self.token.get()}"}
+            self.requests += 1
+            async with self._session.request(method, f"{self.api_url}/{path}", params=params, json=json,
+                                             headers=headers) as response:
+                if response.status == 401 and attempt == 0:
+                    await self.token.refresh(force=True)
+                    continue
+                if response.status >= 400:
+                    try:
+                        message = (await response.json())['error']['message']
+                    except Exception:
+                        message = response.reason
+                    retry_after = response.headers.get('Retry-After', '')
+                    raise SheetsAPIError(response.status, message,
+                                         float(retry_after) if retry_after.isdigit() else None)
+                return await response.json()
+
+    async def open_worksheet(self, sheet_url, index=0):
+        """URLのスプレッドシートの index 枚目（既定は1枚目）を開く"""
+        spreadsheet_id = spreadsheet_id_from_url(sheet_url)
+        metadata = await self.request('GET', spreadsheet_id, params={'fields': 'sheets.properties.title'})
+        title = metadata['sheets'][index]['properties']['title']
+        return ApiWorksheet(self, spreadsheet_id, title, coalesce_delay=self.coalesce_delay)
+
+class ApiWorksheet(Worksheet):
+    """Sheets APIのワークシート
+
+    同時に来た append_rows は1回の values.append に、update_cell は
+    1回の values.batchUpdate にまとめて送る。
+    """
+
+    def __init__(self, client, spreadsheet_id, title, coalesce_delay=0.05):
+        self.client = client
+        self.spreadsheet_id = spreadsheet_id
+        self.title = title
+        self._range = "'{}'".format(title.replace("'", "''"))
+        self._appends = RequestCoalescer(self._send_appends, coalesce_delay)
+        self._updates = RequestCoalescer(self._send_updates, coalesce_delay)
+
+    def _values_path(self, suffix=''):
+        return f"{self.spreadsheet_id}/values/{quote(self._range, safe='')}{suffix}"
+
+    async def append_rows(self, rows):
+        return await self._appends.submit([list(row) for row in rows])
+
+    async def _send_appends(self, batches):
+        rows = [row for batch in batches for row in batch]
+        response = await self.client.request(
+            'POST', self._values_path(':append'), params={'valueInputOption': 'RAW'}, json={'values': rows})
+        match = _UPDATED_RANGE_RE.search(response.get('updates', {}).get('updatedRange', ''))
+        if match is None or len(batches) == 1:
+            return [response] * len(batches)
+
+        # まとめて書き込んだ範囲を呼び出しごとの範囲に分ける
+        first_column, start = match.group(1), int(match.group(2))
+        last_column = match.group(3) or first_column
+        results = []
+        for batch in batches:
+            end = start + len(batch) - 1
+            results.append({'spreadsheetId': self.spreadsheet_id, 'updates': {
+                'updatedRange': f"{self._range}!{first_column}{start}:{last_column}{end}",
+                'updatedRows': len(batch),
+            }})
+            start = end + 1
+        return results
+
+    async def get_all_values(self):
+        response = await self.client.request('GET', self._values_path())
+        return response.get('values', [])
+
+    async def get_row(self, row):
+        path = f"{self.spreadsheet_id}/values/{quote(f'{self._range}!{row}:{row}', safe='')}"
+        response = await self.client.request('GET', path)
+        values = response.get('values', [])
+        return values[0] if values else []
+
+    async def update_cell(self, row, col, value):
+        return await self._updates.submit((row, col, value))
+
+    async def _send_updates(self, cells):
+        data = [{'range': f"{self._range}!{column_letter(col)}{row}", 'values': [[value]]} for row, col, value in cells]
+        response = await self.client.request(
+            'POST', f"{self.spreadsheet_id}/values:batchUpdate",
+            json={'valueInputOption': 'USER_ENTERED', 'data': data})
+        return [response] * len(cells)
@@ -0,0 +1,25 @@
+from isbn_validation import (
+    CORRECTION_978_ISBN10, CORRECTION_COMPLETE_9, CORRECTION_ISBN10_CHECK, CORRECTION_ISBN13_CHECK,
+    CORRECTION_SUFFIX_978, fix_isbn, fix_isbns,
+)
+
+def test_fix_isbn_valid():
+    assert fix_isbn('978-4-09-290604-4') == ('4092906048', '9784092906044', None)
+    assert fix_isbn('4-09-290604-8') == ('4092906048', '9784092906044', None)
+    assert fix_isbn('979-10-90636-07-1') == ('', '9791090636071', None)
+
+def test_fix_isbn_corrections():
+    assert fix_isbn('4092906044') == ('4092906048', '9784092906044', CORRECTION_SUFFIX_978)
+    assert fix_isbn('4092906041') == ('4092906048', '9784092906044', CORRECTION_ISBN10_CHECK)
+    assert fix_isbn('9784092906048') == ('4092906048', '9784092906044', CORRECTION_978_ISBN10)
+    assert fix_isbn('9791090636070') == ('', '9791090636071', CORRECTION_ISBN13_CHECK)
+    assert fix_isbn('409290604') == ('4092906048', '9784092906044', CORRECTION_COMPLETE_9)
+
+def test_fix_isbn_invalid():
+    assert fix_isbn('12345') == (None, None, None)
+    assert fix_isbn('1234567890123') == (None, None, None)
+
+def test_fix_isbns_matches_fix_isbn_in_order():
+    inputs = ['4092906044', '978-4-09-290604-4', 'abc', '4092906044', '979-10-90636-07-1']
+    assert fix_isbns(inputs) == [fix_isbn(isbn) for isbn in inputs]
+    assert fix_isbns([]) == []
@@ -0,0 +1,105 @@
+import asyncio
+
+import metadata_providers
+from metadata_providers import NOT_FOUND, CircuitBreaker, MetadataLookup
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def test_circuit_breaker_transitions(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(metadata_providers.time, 'monotonic', clock)
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+
+    breaker.record_failure()
+    assert breaker.state == 'closed' and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == 'open' and breaker.is_open()
+    assert not breaker.allow()
+
+    # reset_timeout 後に試しの1回だけ通す
+    clock.now += 30
+    assert breaker.allow() and breaker.state == 'half_open'
+    assert not breaker.allow()
+
+    # 試しの1回が失敗したらまたopen
+    breaker.record_failure()
+    assert breaker.state == 'open' and breaker.opened_count == 2
+
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == 'closed' and breaker.failures == 0 and breaker.allow()
+
+class RateLimiter:
+    def __init__(self, wait=0.0):
+        self.wait = wait
+
+    async def acquire(self, name):
+        await asyncio.sleep(self.wait)
+
+    def record_success(self, name):
+        pass
+
+class StubProvider:
+    """ISBNごとに1リクエストを送るプロバイダー（answers にないISBNは登録なし）"""
+
+    def __init__(self, name, answers, delay=0.01, queue_wait=0.0, error=None):
+        self.name = name
+        self.answers = answers
+        self.delay = delay
+        self.error = error
+        self.rate_limiter = RateLimiter(queue_wait)
+
+    async def fetch(self, isbns, call):
+        if self.error is not None:
+            raise self.error
+        for isbn in isbns:
+            await self.rate_limiter.acquire(self.name)
+            with call.request():
+                await asyncio.sleep(self.delay)
+                call.results[isbn] = self.answers.get(isbn, NOT_FOUND)
+        return call.results
+
+def test_not_found_only_when_every_provider_answered():
+    first = StubProvider('first', {'1': ('T1', 'P', 1)})
+    second = StubProvider('second', {'2': ('T2', 'P', 1)})
+    lookup = MetadataLookup([first, second], hedge_delay=1, timeout=1)
+    assert asyncio.run(lookup.lookup(['1', '2', '3'])) == {'1': ('T1', 'P', 1), '2': ('T2', 'P', 1), '3': NOT_FOUND}
+
+def test_failed_provider_keeps_isbns_out_of_not_found():
+    first = StubProvider('first', {})
+    second = StubProvider('second', {}, error=TimeoutError('read timeout'))
+    lookup = MetadataLookup([first, second], hedge_delay=1, timeout=1)
+    assert asyncio.run(lookup.lookup(['1', '2'])) == {}
+
+def test_timeout_keeps_partial_answers_and_ignores_local_queueing():
+    first = StubProvider('first', {'1': ('T1', 'P', 1)})
+    # 1件ごとにRate Limitの順番待ちがあり、timeout までに全件は答えられない
+    second = StubProvider('second', {'2': ('T2', 'P', 1)}, queue_wait=0.15)
+    lookup = MetadataLookup([first, second], hedge_delay=1, timeout=0.5, slow_call=0.1)
+    results = asyncio.run(lookup.lookup(['1', '2', '3', '4', '5', '6']))
+
+    assert results['1'] == ('T1', 'P', 1)
+    assert results['2'] == ('T2', 'P', 1)
+    assert '6' not in results
+    # 順番待ちの時間は遅延として数えない
+    assert lookup.breakers['second'].failures == 0
+
+def test_deadline_cuts_the_lookup_short():
+    slow = StubProvider('slow', {'1': ('T1', 'P', 1)}, delay=1)
+    lookup = MetadataLookup([slow], hedge_delay=5, timeout=5)
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        results = await lookup.lookup(['1'], deadline=started + 0.1)
+        return results, loop.time() - started
+
+    results, elapsed = asyncio.run(scenario())
+    assert results == {}
+    assert elapsed < 0.5
@@ -0,0 +1,76 @@
+from order_queue import OrderQueue
+
+def test_enqueue_ignores_duplicate_order_keys():
+    queue = OrderQueue()
+    assert queue.enqueue('m1:978', ['a']) is True
+    assert queue.enqueue('m1:978', ['b']) is False
+    assert queue.pending_count() == 1
+
+def test_claim_release_and_mark_done():
+    queue = OrderQueue()
+    for key in ('k1', 'k2', 'k3'):
+        queue.enqueue(key, [key])
+
+    claimed = queue.claim(2)
+    assert [row for _, row in claimed] == [['k1'], ['k2']]
+    # 書き込み中の注文は二度取り出さない
+    assert [row for _, row in queue.claim(10)] == [['k3']]
+
+    queue.release([claimed[1][0]])
+    assert [row for _, row in queue.claim(10)] == [['k2']]
+
+    queue.mark_done([order_id for order_id, _ in claimed])
+    assert queue.pending_count() == 1  # k3 は書き込み中のまま
+
+def test_restart_moves_sending_orders_to_unconfirmed(tmp_path):
+    path = str(tmp_path / 'queue.sqlite3')
+    queue = OrderQueue(path)
+    queue.enqueue('k1', ['k1'])
+    queue.enqueue('k2', ['k2'])
+    queue.claim(10)
+
+    restarted = OrderQueue(path)
+    unconfirmed = restarted.unconfirmed()
+    assert [key for _, key in unconfirmed] == ['k1', 'k2']
+    # 確認が終わるまで送り直さない
+    assert restarted.claim(10) == []
+
+    restarted.resolve_unconfirmed([unconfirmed[0][0]], [unconfirmed[1][0]])
+    assert restarted.unconfirmed() == []
+    assert [row for _, row in restarted.claim(10)] == [['k2']]
+
+def test_mark_unconfirmed_after_ambiguous_failure():
+    queue = OrderQueue()
+    queue.enqueue('k1', ['k1'])
+    order_ids = [order_id for order_id, _ in queue.claim(10)]
+    queue.mark_unconfirmed(order_ids)
+    assert queue.unconfirmed() == [(order_ids[0], 'k1')]
+    assert queue.claim(10) == []
+
+def test_update_pending_skips_claimed_orders():
+    queue = OrderQueue()
+    queue.enqueue('k1', ['978', 1])
+    queue.claim(10)
+    queue.enqueue('k2', ['978', 1])
+
+    assert queue.update_pending(lambda row: row[0] == '978', lambda row: [row[0], row[1] + 1]) is True
+    assert [row for _, row in queue.claim(10)] == [['978', 2]]
+    assert queue.update_pending(lambda row: row[0] == '978', lambda row: row) is False
+
+def test_merges_are_claimed_separately_and_can_be_unmerged():
+    queue = OrderQueue()
+    queue.enqueue('k1', ['append'])
+    queue.enqueue('k2', ['merge'], merge_row=5)
+
+    assert [row for _, row in queue.claim(10)] == [['append']]
+    merges = queue.claim_merges(10)
+    assert [(row, row_number, quantity) for _, row, row_number, quantity in merges] == [(['merge'], 5, None)]
+
+    order_id = merges[0][0]
+    queue.set_merge_quantity(order_id, 7)
+    queue.release([order_id])
+    assert [quantity for _, _, _, quantity in queue.claim_merges(10)] == [7]
+
+    queue.unmerge([order_id])
+    assert queue.claim_merges(10) == []
+    assert [row for _, row in queue.claim(10)] == [['merge']]
@@ -0,0 +1,64 @@
+import asyncio
+import time
+
+from quota_store import SQLiteQuotaStore
+from rate_limiter import RateLimitScheduler, TokenBucket
+
+def test_penalize_uses_retry_after():
+    bucket = TokenBucket('sheets', rate=10, capacity=5)
+    assert asyncio.run(bucket.penalize(12)) == 12
+    assert 11 < bucket.blocked_seconds() <= 12
+    assert bucket.status()['tokens'] < 1
+
+def test_penalize_backs_off_exponentially_until_success():
+    bucket = TokenBucket('sheets', rate=10, capacity=5, min_backoff=5, max_backoff=30)
+
+    async def penalize_times(count):
+        return [await bucket.penalize() for _ in range(count)]
+
+    assert asyncio.run(penalize_times(4)) == [5, 10, 20, 30]
+    bucket.record_success()
+    assert asyncio.run(bucket.penalize()) == 5
+    assert bucket.rate_limit_events == 5
+
+def test_penalty_on_one_api_does_not_block_others():
+    limiter = RateLimitScheduler({'discord': (50, 5), 'sheets': (1, 1)})
+
+    async def scenario():
+        await limiter.penalize('sheets', 30)
+        started = time.monotonic()
+        await limiter.acquire('discord')
+        return time.monotonic() - started
+
+    assert asyncio.run(scenario()) < 0.1
+    assert limiter.blocked_seconds('sheets') > 29
+    assert limiter.blocked_seconds('discord') == 0
+
+def test_acquire_waits_until_the_penalty_ends():
+    bucket = TokenBucket('openbd', rate=100, capacity=1)
+
+    async def scenario():
+        await bucket.penalize(0.2)
+        started = time.monotonic()
+        await bucket.acquire()
+        return time.monotonic() - started
+
+    assert asyncio.run(scenario()) >= 0.19
+
+def test_status_does_not_change_the_bucket():
+    bucket = TokenBucket('sheets', rate=1, capacity=5)
+    asyncio.run(bucket.acquire(3))
+    before = (bucket._tokens, bucket._updated)
+    bucket.status()
+    assert (bucket._tokens, bucket._updated) == before
+
+def test_shared_store_blocks_every_process(tmp_path):
+    path = str(tmp_path / 'quota.sqlite3')
+    first = RateLimitScheduler({'sheets': (10, 5)}, store=SQLiteQuotaStore(path), shared=('sheets',))
+    second = RateLimitScheduler({'sheets': (10, 5)}, store=SQLiteQuotaStore(path), shared=('sheets',))
+
+    asyncio.run(first.penalize('sheets', 20))
+    status = second.status()['sheets']
+    assert status['shared'] is True
+    assert 19 < status['blocked_seconds'] <= 20
+    assert SQLiteQuotaStore(path).take('sheets', 10, 5) > 19
@@ -0,0 +1,182 @@
+import asyncio
+
+from order_queue import OrderQueue
+from sheet_buffer import SheetWriteBuffer
+from sheets_client import MemoryWorksheet, SheetsAPIError
+
+KEY_COLUMN = 2
+
+class FlakySheet(MemoryWorksheet):
+    """append_rows を1回だけ失敗させる（landed=True なら行を書き込んでから失敗する）"""
+
+    def __init__(self, error, landed):
+        super().__init__()
+        self.error = error
+        self.landed = landed
+        self.appends = 0
+
+    async def append_rows(self, rows):
+        self.appends += 1
+        if self.error is not None:
+            error, self.error = self.error, None
+            if self.landed:
+                await super().append_rows(rows)
+            raise error
+        return await super().append_rows(rows)
+
+def run(sheet, keys=('m1:1', 'm1:2')):
+    errors = []
+
+    async def on_error(e):
+        errors.append(e)
+
+    async def scenario():
+        buffer = SheetWriteBuffer(sheet, OrderQueue(), min_retry_wait=0, on_error=on_error,
+                                  order_key_column=KEY_COLUMN)
+        for key in keys:
+            await buffer.add(key, ['row', key])
+        first = await buffer.flush()
+        second = await buffer.flush()
+        return buffer, first, second
+
+    buffer, first, second = asyncio.run(scenario())
+    return buffer, first, second, errors
+
+def test_timeout_after_append_landed_does_not_duplicate_rows():
+    sheet = FlakySheet(asyncio.TimeoutError(), landed=True)
+    buffer, first, second, errors = run(sheet)
+    assert (first, second) == (False, True)
+    assert len(errors) == 1
+    assert sheet.rows == [['row', 'm1:1'], ['row', 'm1:2']]
+    assert sheet.appends == 1
+    assert len(buffer) == 0
+
+def test_server_error_before_append_resends_rows():
+    sheet = FlakySheet(SheetsAPIError(503, 'Service Unavailable'), landed=False)
+    buffer, first, second, _ = run(sheet)
+    assert (first, second) == (False, True)
+    assert sheet.rows == [['row', 'm1:1'], ['row', 'm1:2']]
+    assert len(buffer) == 0
+
+def test_rejected_rows_are_resent_without_reading_the_sheet():
+    sheet = FlakySheet(SheetsAPIError(429, 'Too Many Requests'), landed=False)
+    reads = []
+    get_all_values = sheet.get_all_values
+
+    async def counting_get_all_values():
+        reads.append(1)
+        return await get_all_values()
+
+    sheet.get_all_values = counting_get_all_values
+    buffer, first, second, errors = run(sheet)
+    assert (first, second) == (False, True)
+    assert errors[0].status == 429
+    assert reads == []
+    assert sheet.rows == [['row', 'm1:1'], ['row', 'm1:2']]
+
+def test_duplicate_order_key_is_queued_once():
+    sheet = FlakySheet(None, landed=False)
+    buffer, first, _, _ = run(sheet, keys=('m1:1', 'm1:1'))
+    assert first is True
+    assert sheet.rows == [['row', 'm1:1']]
+
+def test_background_flusher_survives_errors():
+    class BrokenQueue(OrderQueue):
+        def unconfirmed(self):
+            raise RuntimeError('disk I/O error')
+
+    async def scenario():
+        buffer = SheetWriteBuffer(MemoryWorksheet(), BrokenQueue(), flush_interval=0.01)
+        buffer.start()
+        await asyncio.sleep(0.05)
+        alive = not buffer._task.done()
+        buffer._task.cancel()
+        return buffer, alive
+
+    buffer, alive = asyncio.run(scenario())
+    assert alive
+    assert buffer.last_error == 'disk I/O error'
+
+def order_row(isbn13, quantity, key):
+    return ['d', '', isbn13, '', '', '', quantity, '注文待ち', '', '', key]
+
+def run_merge(sheet, row_number, fail_update=None):
+    updates = []
+    update_cell = sheet.update_cell
+
+    async def flaky_update_cell(row, col, value):
+        updates.append(value)
+        nonlocal fail_update
+        if fail_update is not None:
+            error, fail_update = fail_update, None
+            await update_cell(row, col, value)
+            raise error
+        await update_cell(row, col, value)
+
+    sheet.update_cell = flaky_update_cell
+    merged = []
+
+    async def scenario():
+        buffer = SheetWriteBuffer(sheet, OrderQueue(), min_retry_wait=0, order_key_column=11,
+                                  on_merged=lambda row, number, quantity: merged.append((number, quantity)))
+        await buffer.add_merge('m2:978', order_row('978', 2, 'm2:978'), row_number)
+        results = [await buffer.flush(), await buffer.flush()]
+        return buffer, results
+
+    buffer, results = asyncio.run(scenario())
+    return buffer, results, updates, merged
+
+def test_merge_adds_quantity_to_the_sheet_row():
+    sheet = MemoryWorksheet([['header'], order_row('978', 3, 'm1:978')])
+    buffer, results, updates, merged = run_merge(sheet, 2)
+    assert results == [True, True]
+    assert sheet.rows[1][6] == 5
+    assert merged == [(2, 5)]
+    assert len(sheet.rows) == 2
+    assert len(buffer) == 0
+
+def test_merge_retry_after_failed_update_does_not_add_twice():
+    sheet = MemoryWorksheet([['header'], order_row('978', 3, 'm1:978')])
+    buffer, results, updates, _ = run_merge(sheet, 2, fail_update=asyncio.TimeoutError())
+    assert results == [False, True]
+    assert updates == [5, 5]
+    assert sheet.rows[1][6] == 5
+
+def test_merge_into_moved_row_appends_the_order_instead():
+    sheet = MemoryWorksheet([['header'], order_row('979', 1, 'm0:979'), order_row('978', 3, 'm1:978')])
+    buffer, results, updates, merged = run_merge(sheet, 2)
+    assert results == [True, True]
+    assert updates == []
+    assert merged == []
+    assert sheet.rows[1][6] == 1
+    assert sheet.rows[-1] == order_row('978', 2, 'm2:978')
+
+def test_failures_back_off_and_success_resets():
+    class DownSheet(MemoryWorksheet):
+        def __init__(self):
+            super().__init__()
+            self.down = True
+
+        async def append_rows(self, rows):
+            if self.down:
+                raise SheetsAPIError(500, 'Internal Error')
+            return await super().append_rows(rows)
+
+    sheet = DownSheet()
+
+    async def scenario():
+        buffer = SheetWriteBuffer(sheet, OrderQueue(), min_retry_wait=5, max_retry_wait=12)
+        await buffer.add('k1', ['row', 'k1'])
+        waits = []
+        for _ in range(3):
+            assert await buffer.flush() is False
+            waits.append(round(buffer._next_retry_at - asyncio.get_running_loop().time()))
+        sheet.down = False
+        assert await buffer.flush() is True
+        return buffer, waits
+
+    buffer, waits = asyncio.run(scenario())
+    assert waits == [5, 10, 12]
+    assert buffer.last_error is None
+    assert buffer._next_retry_at == 0.0
+    assert sheet.rows == [['row', 'k1']]